@@ -5,4 +5,15 @@ samplesDir = Path(r"C:\Samples")
 junjyoukirari_23_ts = samplesDir / "2020年08月07日16時20分00秒-【連続テレビ小説】純情きらり(23)「プロポーズは突然に」[解][字].ts"
 colorMeTrue = samplesDir / "1997.820-2386.809.ts"
 invalid_ts = samplesDir / "invalid.ts"
-not_existing_ts = samplesDir / "not_existing.ts"
\ No newline at end of file
+not_existing_ts = samplesDir / "not_existing.ts"
+
+def Kanji(text):
+    # ARIB 8-unit code of JIS X 0208 text in G0
+    return bytes(b & 0x7F for b in text.encode('euc_jp'))
+
+def Packet(pid, payload, start=True):
+    # one TS packet, padded with an adaptation field
+    header = bytes([ 0x47, (0x40 if start else 0) | (pid >> 8), pid & 0xFF, 0x10 ])
+    if len(payload) < 184:
+        header = header[:3] + b'\x30' + bytes([ 183 - len(payload) ]) + (b'\x00' + b'\xFF' * (182 - len(payload)) if len(payload) < 183 else b'')
+    return header + payload
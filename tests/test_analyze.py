@@ -0,0 +1,54 @@
+import subprocess
+import pytest
+import tsutils, tsutils.analyze, tsutils.ffmpeg, tsutils.audio, tsutils.encode, tsutils.benchmark
+from tests import junjyoukirari_23_ts, not_existing_ts
+
+def test_Analyze_Success(tmp_path):
+    result = tsutils.analyze.Analyze(junjyoukirari_23_ts, silenceParams=[ (800, -80), (500, -60) ], strip=tmp_path / 'stripped.ts', quiet=True)
+    propList = tsutils.ffmpeg.ExtractFrameProps(junjyoukirari_23_ts, 0, result['info']['duration'], pipe=True, quiet=True)
+    assert result['props'] == propList
+    assert set(result['silence'].keys()) == { (800, -80), (500, -60) }
+    assert len(result['box']) == 4
+    assert result['strip'].stat().st_size > 0
+
+@pytest.fixture(scope='module')
+def offset_ts(tmp_path_factory):
+    return tsutils.benchmark.MakeFixture('offset', tmp_path_factory.mktemp('fixtures') / 'offset.ts', 6)
+
+def test_Analyze_Props(offset_ts, tmp_path):
+    # cut mid-GOP, the first decoded frame comes after the start of the video
+    data = offset_ts.read_bytes()
+    cutPath = tmp_path / 'cut.ts'
+    cutPath.write_bytes(data[len(data) // 2 // 188 * 188:])
+    for path in (offset_ts, cutPath):
+        result = tsutils.analyze.Analyze(path, box=False, strip=tmp_path / 'analyzed.ts', audioLanguages=[ 'jpn' ], quiet=True)
+        assert result['props'] == tsutils.ffmpeg.ExtractFrameProps(path, 0, result['info']['duration'], pipe=True, quiet=True)
+        assert result['silence'][(800, -80)] == tsutils.audio.DetectSilence(path, quiet=True)
+        stripped = tsutils.encode.StripTS(path, outputPath=tmp_path / 'stripped.ts', audioLanguages=[ 'jpn' ], quiet=True)
+        assert result['strip'].read_bytes() == stripped.read_bytes()
+
+def test_Analyze_Box(offset_ts):
+    # sampled from the props frames, the same frames the fps filter of FindVideoBox picks
+    result = tsutils.analyze.Analyze(offset_ts, quiet=True)
+    assert result['box'] == tsutils.encode.FindVideoBox(offset_ts, quiet=True)
+
+def test_Analyze_NoAudio(offset_ts, tmp_path):
+    videoPath = tmp_path / 'video.ts'
+    subprocess.run([ 'ffmpeg', '-v', 'error', '-i', offset_ts, '-map', '0:v', '-c', 'copy', videoPath ], check=True)
+    result = tsutils.analyze.Analyze(videoPath, strip=tmp_path / 'analyzed.ts', quiet=True)
+    assert result['info']['soundTracks'] == 0
+    assert len(result['props']) > 0
+    assert result['silence'] == { (800, -80): [] }
+    assert result['strip'].stat().st_size > 0
+
+def test_Analyze_ReaderFailed(offset_ts, monkeypatch):
+    def FindBoxFromFrames(images, width, height):
+        raise ValueError('box failed')
+    monkeypatch.setattr(tsutils.analyze, 'FindBoxFromFrames', FindBoxFromFrames)
+    # ffmpeg still finishes, as the failed reader keeps draining its pipe
+    with pytest.raises(ValueError, match='box failed'):
+        tsutils.analyze.Analyze(offset_ts, quiet=True)
+
+def test_Analyze_NotExisting():
+    with pytest.raises(tsutils.TsFileNotFound, match='"not_existing.ts" not found!'):
+        tsutils.analyze.Analyze(not_existing_ts)
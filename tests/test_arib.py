@@ -0,0 +1,35 @@
+import tsutils.arib
+from tsutils.ts import Crc32
+from tests import Kanji
+
+def test_DecodeAribString():
+    assert tsutils.arib.DecodeAribString(Kanji('純情きらり') + b'\x7A\x5C\x7A\x56') == '純情きらり[解][字]'
+    # hiragana in GR, then alphanumerics in middle size through LS1
+    assert tsutils.arib.DecodeAribString(b'\xA2\xA4\x0E\x89ABC\x8A12\x0F' + Kanji('話')) == 'あいABC１２話'
+    assert tsutils.arib.DecodeAribString(b'\x1B\x7C\xA2\x1B\x7D\xA2\x0D') == 'アあ\n'
+
+def test_ParseEIT():
+    name, text = Kanji('番組'), Kanji('説明')
+    short = b'jpn' + bytes([ len(name) ]) + name + bytes([ len(text) ]) + text
+    item = b'\x00jpn\x06\x02' + Kanji('出') + b'\x02' + Kanji('演') + b'\x00'
+    descriptors = bytes([ 0x4D, len(short) ]) + short + bytes([ 0x4E, len(item) ]) + item
+    event = b'\x00\x01' + b'\xE6\xBC\x16\x20\x00' + b'\x00\x15\x00' + bytes([ 0x80 | (len(descriptors) >> 8), len(descriptors) & 0xFF ]) + descriptors
+    body = b'\x04\x00\xC1\x00\x00\x7F\xE0\x7F\xE1\x00\x4E' + event
+    section = bytes([ 0x4E, 0xF0 | ((len(body) + 4) >> 8), (len(body) + 4) & 0xFF ]) + body
+    section += Crc32(section).to_bytes(4, 'big')
+    store = tsutils.arib.EventStore()
+    key = None
+    for event in tsutils.arib.ParseEIT(section):
+        key = store.Add(event)
+    assert store.IsComplete(key)
+    program = store.GetProgram(key)
+    assert program['serviceId'] == 0x400 and program['eventId'] == 1 and program['networkId'] == 0x7FE1
+    assert program['name'] == '番組' and program['description'] == '説明'
+    assert program['extended'] == { '出': '演' }
+    assert program['duration'] == 15 * 60 * 1000
+    assert program['startAt'] == 1596784800000
+
+def test_DecodeCaption():
+    # a default macro restores kanji in G0, ruby in small size is dropped, APS starts a new line
+    body = b'\x0C\x1B\x28\x4A\x89AB\x8A\x1D\x60' + Kanji('字') + b'\x88\xA4\xA4\x8A' + b'\x1C\x41\x42' + Kanji('幕') + b'\x20'
+    assert tsutils.arib.DecodeCaption([ body ]) == ( 'AB字\n幕', True )
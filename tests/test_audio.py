@@ -1,5 +1,8 @@
 import pytest
-import tsutils.audio
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_silence
+import tsutils.audio, tsutils.ffmpeg, tsutils.benchmark
 from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
 
 def test_DetectSilence_Success():
@@ -8,4 +11,60 @@ def test_DetectSilence_Success():
 
 def test_DetectSilence_Invalid():
      with pytest.raises(tsutils.InvalidTsFormat, match='"invalid.ts" is invalid!'):
-        tsutils.audio.DetectSilence(invalid_ts)
\ No newline at end of file
+        tsutils.audio.DetectSilence(invalid_ts)
+
+def test_DetectSilence_NumPy():
+    periods = tsutils.audio.DetectSilence(junjyoukirari_23_ts, 0, 120, backend='numpy')
+    assert periods == tsutils.audio.DetectSilence(junjyoukirari_23_ts, 0, 120)
+
+@pytest.fixture(scope='module')
+def mono_ts(tmp_path_factory):
+    return tsutils.benchmark.MakeFixture('mono', tmp_path_factory.mktemp('fixtures') / 'mono.ts', 12)
+
+def test_DetectSilence_NumPy_Mono(mono_ts):
+    assert tsutils.ffmpeg.GetAudioChannels(mono_ts) == [ 1, 2 ]
+    # the half volume parts are just above -28dB, a -3dB upmix would make them silent
+    for thresh in (-80, -28):
+        periods = tsutils.audio.DetectSilence(mono_ts, silence_thresh=thresh, quiet=True)
+        assert tsutils.audio.DetectSilence(mono_ts, silence_thresh=thresh, quiet=True, backend='numpy') == periods
+    assert len(periods) == 2
+    assert tsutils.audio.DetectSilenceGrid(mono_ts, thresholds=(-28,), quiet=True)[0][(800, -28)] == periods
+
+def test_SilenceScanner_MatchesPydub():
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, 2000, 48000 * 5).astype(np.int16)
+    samples[48000:48000 * 2 + 123] = 0
+    samples[48000 * 3:48000 * 3 + 4000] = 1
+    sound = AudioSegment(samples.tobytes(), frame_rate=48000, sample_width=2, channels=1)
+    scanner = tsutils.audio.SilenceScanner(min_silence_len=50, silence_thresh=-80)
+    for i in range(0, len(samples), 7777):
+        scanner.Feed(samples[i:i + 7777])
+    assert scanner.Finish() == detect_silence(sound, min_silence_len=50, silence_thresh=-80, seek_step=10)
+
+def test_SilenceDetector_Success(tmp_path):
+    pcmPath = tmp_path / 'audio_0.pcm'
+    with tsutils.audio.SilenceDetector(junjyoukirari_23_ts, pcmPath=pcmPath) as detector:
+        periods = detector.DetectMany([ (0, 120, 800, -80), (0, 60, 500, -60) ])
+    assert len(periods[0]) > 0
+    mtime = pcmPath.stat().st_mtime_ns
+    with tsutils.audio.SilenceDetector(junjyoukirari_23_ts, pcmPath=pcmPath) as detector:
+        assert detector.Detect(0, 120) == periods[0]
+    assert pcmPath.stat().st_mtime_ns == mtime
+
+def test_SilenceDetector_Tracks(mono_ts, tmp_path):
+    pcmPath = tmp_path / 'audio.pcm'
+    with tsutils.audio.SilenceDetector(mono_ts, track=0, pcmPath=pcmPath, quiet=True) as detector:
+        assert len(detector.Detect()) == 2
+    # the same PCM path for another track is decoded again
+    with tsutils.audio.SilenceDetector(mono_ts, track=1, pcmPath=pcmPath, quiet=True) as detector:
+        assert detector.Detect() == []
+    mtime = pcmPath.stat().st_mtime_ns
+    with tsutils.audio.SilenceDetector(mono_ts, track=1, pcmPath=pcmPath, quiet=True) as detector:
+        assert detector.Detect() == []
+    assert pcmPath.stat().st_mtime_ns == mtime
+
+def test_DetectSilenceGrid_Success():
+    results = tsutils.audio.DetectSilenceGrid(junjyoukirari_23_ts, 0, 120, lengths=(500, 800), thresholds=(-80, -60))
+    assert len(results) == tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts)['soundTracks']
+    assert set(results[0].keys()) == { (500, -80), (500, -60), (800, -80), (800, -60) }
+    assert results[0][(800, -80)] == tsutils.audio.DetectSilence(junjyoukirari_23_ts, 0, 120, backend='numpy')
@@ -0,0 +1,17 @@
+import tsutils.benchmark
+
+def test_CompareReports():
+    baseline = { 'results': [
+        { 'fixture': 'basic', 'function': 'GetInfo', 'throughput': 100.0, 'rss': 40.0 },
+        { 'fixture': 'basic', 'function': 'StripTS', 'throughput': 100.0, 'rss': 40.0 },
+    ] }
+    report = { 'results': [
+        { 'fixture': 'basic', 'function': 'GetInfo', 'throughput': 95.0, 'rss': 41.0 },
+        { 'fixture': 'basic', 'function': 'StripTS', 'throughput': 50.0, 'rss': 40.0 },
+        # failed runs and new functions have nothing to compare
+        { 'fixture': 'sd', 'function': 'Trim', 'error': 'InvalidTsFormat' },
+        { 'fixture': 'basic', 'function': 'Trim', 'throughput': 80.0, 'rss': 50.0 },
+    ] }
+    rows = tsutils.benchmark.CompareReports(baseline, report, tolerance=0.1)
+    assert [ ( row['function'], row['regression'] ) for row in rows ] == [ ( 'GetInfo', False ), ( 'StripTS', True ) ]
+    assert rows[0]['rss_delta'] == 1.0
@@ -0,0 +1,76 @@
+import tsutils.cache
+
+def test_Cached(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    calls = []
+    @tsutils.cache.Cached('tuple')
+    def Measure(path, scale=1, quiet=False):
+        calls.append(scale)
+        return path.stat().st_size * scale, scale
+    path = tmp_path / 'video.ts'
+    path.write_bytes(b'\x47' * 1000)
+    assert Measure(path) == (1000, 1)
+    assert Measure(path, quiet=True) == (1000, 1)
+    assert Measure(path, scale=2) == (2000, 2)
+    assert calls == [ 1, 2 ]
+    # new content, new fingerprint
+    path.write_bytes(b'\x47' * 2000)
+    assert Measure(path) == (2000, 1)
+    assert calls == [ 1, 2, 1 ]
+    tsutils.cache.Evict(0)
+    assert list((tmp_path / 'cache' / 'results').glob('*/*')) == []
+
+def test_Cached_Props(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    tsutils.cache.EnableCache()
+    propList = [
+        { 'ptsTime': 0.0, 'pos': 564, 'checksum': '8FDF19C5', 'plane_checksum': [ '10F3F460', '1CD69F41', '24C38606' ], 'mean': [ 126.0, 127.0, 126.0 ], 'stdev': [ 55.9, 79.4, 83.8 ], 'isKey': 1, 'type': 'I', 'sad': 0.0 },
+        { 'ptsTime': 0.0333667, 'pos': 75388, 'checksum': 'B4A742BF', 'plane_checksum': [ 'B858E7A3', '0C4D7E37', 'A615DCC7' ], 'mean': [ 126.0, 127.0, 126.0 ], 'stdev': [ 55.9, 79.4, 83.8 ], 'isKey': 0, 'type': 'P', 'sad': 0.015 },
+    ]
+    calls = []
+    @tsutils.cache.Cached('props')
+    def Props(path):
+        calls.append(path)
+        return propList
+    path = tmp_path / 'video.ts'
+    path.write_bytes(b'\x47' * 1000)
+    try:
+        assert Props(path) == propList
+        assert Props(path) == propList
+        assert len(calls) == 1
+    finally:
+        tsutils.cache.EnableCache(None)
+
+def test_Cached_Version(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    calls = []
+    def Measure(path):
+        calls.append(path)
+        return path.stat().st_size
+    path = tmp_path / 'video.ts'
+    path.write_bytes(b'\x47' * 1000)
+    assert tsutils.cache.Cached()(Measure)(path) == 1000
+    assert tsutils.cache.Cached()(Measure)(path) == 1000
+    # fixed code doesn't get the old results
+    assert tsutils.cache.Cached(version=2)(Measure)(path) == 1000
+    assert len(calls) == 2
+
+def test_Cached_Evict(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    # room for one result of about 1KB
+    monkeypatch.setenv('TSUTILS_CACHE_SIZE', str(1500 / 1024 / 1024))
+    @tsutils.cache.Cached()
+    def Pad(path, char):
+        return char * 1000
+    path = tmp_path / 'video.ts'
+    path.write_bytes(b'\x47' * 1000)
+    resultsDir = tmp_path / 'cache' / 'results'
+    Pad(path, 'a')
+    assert len(list(resultsDir.glob('*/*'))) == 1
+    Pad(path, 'b')
+    assert len(list(resultsDir.glob('*/*'))) == 1
+    tsutils.cache.ClearCache()
+    assert list(resultsDir.glob('*/*')) == []
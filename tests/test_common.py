@@ -5,4 +5,39 @@ def test_CheckExtenralCommand():
     tsutils.common.CheckExtenralCommand('ping')
     tsutils.common.CheckExtenralCommand('ping')
     with pytest.raises(tsutils.ProgramNotFound, match='aaa not found'):
-        tsutils.common.CheckExtenralCommand('aaa')
\ No newline at end of file
+        tsutils.common.CheckExtenralCommand('aaa')
+
+def test_FindExternalCommand():
+    assert tsutils.common.FindExternalCommand('ffmpeg') == tsutils.common.CheckExtenralCommand('ffmpeg')
+    assert tsutils.common.FindExternalCommand('aaa') is None
+
+def test_GetFFmpegCapabilities():
+    capabilities = tsutils.common.GetFFmpegCapabilities()
+    assert 'hevc' in capabilities['encoders']
+    assert 'bwdif' in capabilities['filters']
+    assert capabilities is tsutils.common.GetFFmpegCapabilities()
+
+def test_CheckEncoder():
+    tsutils.common.CheckEncoder('hevc')
+    with pytest.raises(tsutils.common.EncodingError, match='"aaa" is not supported'):
+        tsutils.common.CheckEncoder('aaa')
+
+def test_CopyRange(tmp_path):
+    data = bytes(range(256)) * 4096
+    (tmp_path / 'src.bin').write_bytes(data)
+    with (tmp_path / 'src.bin').open('rb') as rf, (tmp_path / 'dest.bin').open('wb') as wf:
+        wf.write(b'head')
+        assert tsutils.common.CopyRange(rf, wf, 100, 300000) == 0
+        wf.write(b'tail')
+        tsutils.common.CopyRange(rf, wf, len(data) - 10, 100, buffer=bytearray(3))
+    assert (tmp_path / 'dest.bin').read_bytes() == b'head' + data[100:300100] + b'tail' + data[-10:]
+
+def test_CopyParts(tmp_path):
+    data = bytes(range(256)) * 64
+    (tmp_path / 'src.bin').write_bytes(data)
+    tsutils.common.CopyParts(tmp_path / 'src.bin', tmp_path / 'dest.bin', [ (0, 10), (100, 1000), (5000, 5001) ], bufsize=7)
+    assert (tmp_path / 'dest.bin').read_bytes() == data[0:10] + data[100:1000] + data[5000:5001]
+    parts = [ (tmp_path / 'a.bin', 3, 300), (tmp_path / 'b.bin', 200, 16384) ]
+    assert tsutils.common.SplitParts(tmp_path / 'src.bin', parts) == [ tmp_path / 'a.bin', tmp_path / 'b.bin' ]
+    assert (tmp_path / 'a.bin').read_bytes() == data[3:300]
+    assert (tmp_path / 'b.bin').read_bytes() == data[200:]
@@ -0,0 +1,42 @@
+import numpy as np
+import tsutils.encode, tsutils.index, tsutils.benchmark, tsutils.progress
+from tests import junjyoukirari_23_ts
+
+def test_FindBoxEdges():
+    delta = np.zeros((1080, 1440))
+    delta[135:945, 180:1260] = 1.0
+    assert tsutils.encode.FindBoxEdges(delta) == (180, 135, 1080, 810)
+
+def test_FindVideoBox_Sampling():
+    x, y, w, h = tsutils.encode.FindVideoBox(junjyoukirari_23_ts, samples=50)
+    assert w > 0 and h > 0
+
+def test_GetChunks():
+    index = np.zeros(100, dtype=tsutils.index.INDEX_DTYPE)
+    index['pts'] = np.arange(100) * 90000
+    index['isKey'][::15] = 1
+    # chunks start at the first keyframe 40 seconds or more after the previous start
+    assert tsutils.encode.GetChunks(index, 40) == [ (0.0, 45.0), (45.0, 90.0), (90.0, None) ]
+
+def test_EncodeTS_Chunks(tmp_path):
+    outputPath = tsutils.encode.EncodeTS(junjyoukirari_23_ts, 'drama720p', False, 'libx264', 30, outputPath=tmp_path / 'chunks.mp4', quiet=True, chunkSeconds=60)
+    assert outputPath.stat().st_size > 0
+
+def test_EncodeTS_ChunkThreads(tmp_path, monkeypatch):
+    path = tsutils.benchmark.MakeFixture('sd', tmp_path / 'sd.ts', 4)
+    runs = []
+    RunFFmpeg = tsutils.encode.RunFFmpeg
+    def Run(args, *rest, **kwargs):
+        runs.append(args)
+        return RunFFmpeg(args, *rest, **kwargs)
+    monkeypatch.setattr(tsutils.encode, 'RunFFmpeg', Run)
+    # the chunks run at the same time, every one is followed as a job of its own
+    recorder = tsutils.progress.ThroughputRecorder()
+    callbacks = [ tsutils.progress.StallDetector(timeout=60), recorder ]
+    outputPath = tsutils.encode.EncodeTS(path, 'drama720p', False, 'libx264', 30, outputPath=tmp_path / 'chunks.mp4', quiet=True, callbacks=callbacks, threads=3, chunkSeconds=1, workers=2)
+    assert outputPath.stat().st_size > 0
+    chunkRuns = [ args for args in runs if '-an' in args ]
+    assert len(chunkRuns) > 1
+    chunkJobs = [ job for job in recorder.jobs if job['description'].startswith('Chunk') ]
+    assert len(chunkJobs) == len(chunkRuns) == len({ job['job'] for job in chunkJobs })
+    assert all(args[args.index('-threads') + 1] == '3' for args in chunkRuns)
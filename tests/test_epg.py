@@ -1,7 +1,9 @@
+import json
 from pathlib import Path
 import pytest
 import tsutils.epg
-from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
+from tsutils.ts import Crc32, MakePATPacket
+from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts, Kanji, Packet
 
 def test_DumpEPG_Success():
     epgPath, txtPath = tsutils.epg.Dump(junjyoukirari_23_ts)
@@ -12,4 +14,57 @@ def test_DumpEPG_Success():
 
 def test_DumpEPG_Invalid():
     with pytest.raises(tsutils.InvalidTsFormat, match='"invalid.ts" is invalid!'):
-        tsutils.epg.Dump(invalid_ts)
\ No newline at end of file
+        tsutils.epg.Dump(invalid_ts)
+
+def test_DumpEPG_Native():
+    epgPath, txtPath = tsutils.epg.Dump(junjyoukirari_23_ts, native=True)
+    assert epgPath.is_file() and txtPath.is_file()
+    assert '純情きらり' in txtPath.read_text(encoding='utf8')
+    # cleanup
+    epgPath.unlink()
+    txtPath.unlink()
+
+def test_DumpBatch():
+    results = tsutils.epg.DumpBatch([ junjyoukirari_23_ts, invalid_ts ], workers=2)
+    assert results[0]['error'] is None and results[0]['elapsed'] > 0
+    assert 'is invalid!' in results[1]['error']
+    # cleanup
+    Path(results[0]['epg']).unlink()
+    Path(results[0]['txt']).unlink()
+
+def test_GetChannels():
+    channels = tsutils.epg.GetChannels()
+    assert channels[1056]['name'] == 'フジテレビ'
+    assert channels is tsutils.epg.GetChannels()
+
+def MakeEpgTs(path, events):
+    # a service with the PMT and one EIT section per (name, duration) event
+    pmtBody = b'\x00\x01\xC1\x00\x00\xE1\x00\xF0\x00' + b'\x02\xE1\x00\xF0\x00'
+    pmt = bytes([ 0x02, 0xB0, len(pmtBody) + 4 ]) + pmtBody
+    pmt += Crc32(pmt).to_bytes(4, 'big')
+    packets = [ MakePATPacket(1, 1, 0x1000, 0), Packet(0x1000, b'\x00' + pmt) ]
+    for i, (name, duration) in enumerate(events):
+        name = Kanji(name)
+        short = b'jpn' + bytes([ len(name) ]) + name + b'\x00'
+        descriptors = bytes([ 0x4D, len(short) ]) + short
+        event = bytes([ 0, i + 1 ]) + b'\xE6\xBC' + bytes([ 0x16 + i, 0x20, 0x00 ]) + duration + bytes([ 0x80, len(descriptors) ]) + descriptors
+        body = b'\x00\x01\xC1' + bytes([ i, i ]) + b'\x7F\xE0\x7F\xE1\x00\x4E' + event
+        eit = bytes([ 0x4E, 0xF0, len(body) + 4 ]) + body
+        eit += Crc32(eit).to_bytes(4, 'big')
+        packets.append(Packet(0x12, b'\x00' + eit))
+    path.write_bytes(b''.join(packets))
+    return path
+
+def test_DumpEPG_Native_NoDuration(tmp_path):
+    # the duration is undetermined
+    path = MakeEpgTs(tmp_path / '番組.ts', [ ('番組', b'\xFF\xFF\xFF') ])
+    epgPath, txtPath = tsutils.epg.Dump(path, quiet=True, native=True)
+    assert txtPath.read_text(encoding='utf8').splitlines()[-1].endswith(' ~')
+
+def test_DumpEPG_Native_AllEvents(tmp_path):
+    path = MakeEpgTs(tmp_path / '番組.ts', [ ('番組', b'\x00\x30\x00'), ('次回', b'\x00\x30\x00') ])
+    # the early stop is for the programs in memory
+    assert [ program['name'] for program in tsutils.epg.ReadPrograms(path, videoName='番組', quiet=True) ] == [ '番組' ]
+    epgPath, txtPath = tsutils.epg.Dump(path, quiet=True, native=True)
+    assert [ program['name'] for program in json.loads(epgPath.read_text()) ] == [ '番組', '次回' ]
+    assert txtPath.read_text(encoding='utf8').startswith('番組')
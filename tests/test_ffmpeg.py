@@ -1,11 +1,70 @@
 import pytest, tempfile, os
-import tsutils.ffmpeg
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+import tsutils.ffmpeg, tsutils.benchmark
 from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
 
 def test_GetInfo_Success():
     info = tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts)
     assert info['duration'] == 902.22
 
+def test_GetInfo_Cache():
+    tsutils.ffmpeg.InvalidateInfoCache(junjyoukirari_23_ts)
+    info = tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts, useCache=True)
+    assert tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts, useCache=True) == info
+    assert tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts, useCache=False) == info
+    tsutils.ffmpeg.InvalidateInfoCache()
+    assert list(tsutils.ffmpeg.GetInfoCacheDir().glob('*/*.json')) == []
+
+def test_GetInfo_CacheDisabled(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    path = tsutils.benchmark.MakeFixture('sd', tmp_path / 'sd.ts', 1)
+    monkeypatch.setenv('TSUTILS_CACHE', '0')
+    info = tsutils.ffmpeg.GetInfo(path)
+    assert not (tmp_path / 'cache').exists()
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    assert tsutils.ffmpeg.GetInfo(path) == info
+    assert tsutils.ffmpeg.GetInfoCachePath(path).is_file()
+    assert tsutils.ffmpeg.GetInfo(path) == info
+
+def test_GetInfo_CacheShared(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    paths = [ tsutils.benchmark.MakeFixture('sd', tmp_path / f'sd{i}.ts', 1) for i in range(3) ]
+    # each process caches its own recordings, none of them is lost
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        infos = list(executor.map(tsutils.ffmpeg.GetInfo, paths))
+    assert [ tsutils.ffmpeg.LoadInfoCache(path, tsutils.ffmpeg.GetInfoCacheKey(path)) for path in paths ] == infos
+    # a changed recording misses
+    os.utime(paths[0], ns=(0, 0))
+    assert tsutils.ffmpeg.LoadInfoCache(paths[0], tsutils.ffmpeg.GetInfoCacheKey(paths[0])) is None
+    tsutils.ffmpeg.EvictInfoCache(1)
+    assert len(list(tsutils.ffmpeg.GetInfoCacheDir().glob('*/*.json'))) == 1
+
+def test_GetInfo_FFprobe():
+    info = tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts, useCache=False, backend='ffprobe')
+    assert info == tsutils.ffmpeg.GetInfo(junjyoukirari_23_ts, useCache=False)
+
+def test_GetInfoFromProbe():
+    probe = {
+        'programs': [
+            { 'program_id': 1, 'streams': [ { 'index': 0, 'codec_type': 'data' } ] },
+            {
+                'program_id': 2,
+                'streams': [
+                    { 'index': 1, 'codec_type': 'video', 'width': 1440, 'height': 1080, 'avg_frame_rate': '30000/1001', 'sample_aspect_ratio': '4:3', 'display_aspect_ratio': '16:9' },
+                    { 'index': 2, 'codec_type': 'audio', 'sample_rate': '48000' },
+                    { 'index': 3, 'codec_type': 'audio', 'sample_rate': '0' },
+                    { 'index': 4, 'codec_type': 'audio', 'sample_rate': '48000' },
+                ]
+            },
+        ],
+        'format': { 'duration': '902.215' },
+    }
+    info = tsutils.ffmpeg.GetInfoFromProbe(probe)
+    assert info == { 'duration': 902.22, 'width': 1440, 'height': 1080, 'fps': 29.97, 'sar': (4, 3), 'dar': (16, 9), 'soundTracks': 2 }
+
 def test_GetInfo_NotExisting():
     with pytest.raises(tsutils.TsFileNotFound, match='"not_existing.ts" not found!'):
         tsutils.ffmpeg.GetInfo(not_existing_ts)
@@ -36,7 +95,50 @@ def test_ExtractArea_Success():
         tsutils.ffmpeg.ExtractArea(junjyoukirari_23_ts, (0.2, 0.2, 0.8, 0.8), tmpFolder, 10, 20)
         assert len(os.listdir(tmpFolder)) > 0
 
+def test_ExtractAreaFrames_Success():
+    frames = list(tsutils.ffmpeg.ExtractAreaFrames(junjyoukirari_23_ts, (0.2, 0.2, 0.8, 0.8), 10, 20, gray=True, scale=0.5))
+    assert len(frames) > 0
+    ptsTime, image = frames[0]
+    assert 10 <= ptsTime <= 20
+    assert image.ndim == 2
+
+def test_ExtractAreaFrames_OddSize(tmp_path):
+    path = tsutils.benchmark.MakeFixture('sd', tmp_path / 'sd.ts', 3)
+    # a 301x201 crop at an odd offset, ffmpeg makes it even
+    area = (101 / 720, 51 / 480, 301 / 720, 201 / 480)
+    frames = list(tsutils.ffmpeg.ExtractAreaFrames(path, area, 0, 3))
+    tsutils.ffmpeg.ExtractArea(path, area, tmp_path / 'area', 0, 3, quiet=True)
+    images = [ np.asarray(Image.open(imagePath)) for imagePath in sorted((tmp_path / 'area').glob('*.bmp')) ]
+    assert len(frames) == len(images) == 3
+    assert all(np.array_equal(image, bmp) for (_, image), bmp in zip(frames, images))
+
 def test_ExtractArea_Invalid():
     with pytest.raises(tsutils.InvalidTsFormat, match='"invalid.ts" is invalid!'):
         with tempfile.TemporaryDirectory(prefix='test_ExtractArea') as tmpFolder:
-            tsutils.ffmpeg.ExtractArea(invalid_ts, (0.2, 0.2, 0.8, 0.8), tmpFolder, 10, 20)
\ No newline at end of file
+            tsutils.ffmpeg.ExtractArea(invalid_ts, (0.2, 0.2, 0.8, 0.8), tmpFolder, 10, 20)
+
+def test_ExtractFrameProps_Pipe():
+    props = tsutils.ffmpeg.ExtractFrameProps(junjyoukirari_23_ts, 0, 2)
+    pipedProps = tsutils.ffmpeg.ExtractFrameProps(junjyoukirari_23_ts, 0, 2, pipe=True)
+    assert pipedProps == props
+
+def test_ExtractFrameProps_PipeFixture(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    path = tsutils.benchmark.MakeFixture('sar', tmp_path / 'sar.ts', 2)
+    props = tsutils.ffmpeg.ExtractFrameProps(path, 0.5, 2, quiet=True)
+    assert len(props) > 0
+    assert tsutils.ffmpeg.ExtractFrameProps(path, 0.5, 2, pipe=True, quiet=True) == props
+    # pipe is a part of the key
+    assert len(list((tmp_path / 'cache' / 'results').glob('*/*'))) == 2
+
+def test_ExtractFramePropsParallel_Success():
+    props = tsutils.ffmpeg.ExtractFrameProps(junjyoukirari_23_ts, 0, 30)
+    parallelProps = tsutils.ffmpeg.ExtractFramePropsParallel(junjyoukirari_23_ts, 0, 30, workers=4, chunkLength=5)
+    assert parallelProps == props
+
+def test_ExtractFramePropsParallel_Fixture(tmp_path):
+    path = tsutils.benchmark.MakeFixture('sd', tmp_path / 'sd.ts', 4)
+    props = tsutils.ffmpeg.ExtractFrameProps(path, 0.3, 4, quiet=True)
+    parallelProps = tsutils.ffmpeg.ExtractFramePropsParallel(path, 0.3, 4, workers=2, chunkLength=1, quiet=True)
+    assert parallelProps == props
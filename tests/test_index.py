@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+import tsutils.index, tsutils.common, tsutils.benchmark
+from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
+
+def test_BuildIndex_Success():
+    index = tsutils.index.BuildIndex(junjyoukirari_23_ts)
+    assert index['isKey'].sum() > 0
+    assert np.all(np.diff(index['offset']) > 0)
+
+def test_BuildIndex_NotExisting():
+    with pytest.raises(tsutils.TsFileNotFound, match='"not_existing.ts" not found!'):
+        tsutils.index.BuildIndex(not_existing_ts)
+
+def test_BuildIndex_Invalid():
+    with pytest.raises(tsutils.InvalidTsFormat, match='"invalid.ts" is invalid!'):
+        tsutils.index.BuildIndex(invalid_ts)
+
+def test_UnwrapPts():
+    wrap = tsutils.index.PTS_WRAP
+    unwrapped, last = tsutils.index.UnwrapPts(np.array([ wrap - 20, wrap - 10, 0, 10, 5 ]))
+    assert list(unwrapped - unwrapped[0]) == [ 0, 10, 20, 30, 25 ]
+    unwrapped, _ = tsutils.index.UnwrapPts(np.array([ 15 ]), last)
+    assert unwrapped[0] == last + 10
+
+def test_GetByteRange():
+    index = np.zeros(4, dtype=tsutils.index.INDEX_DTYPE)
+    index['pts'] = [ 0, 90000, 180000, 270000 ]
+    index['offset'] = [ 0, 1880, 3760, 5640 ]
+    index['isKey'] = [ 1, 0, 1, 0 ]
+    assert tsutils.index.GetByteRange(index, 1.5, 1.6, 10000) == (0, 3760)
+    assert tsutils.index.GetByteRange(index, 2.5, 3, 10000) == (3760, 10000)
+
+def test_ExportClips_Success(tmp_path):
+    clips = [ (10, 20), (60, 75.5) ]
+    paths = tsutils.index.ExportClips(junjyoukirari_23_ts, clips, folder=tmp_path)
+    assert [ path.name for path in paths ] == [ tsutils.common.ClipToFilename(clip) for clip in clips ]
+    concatenated = tsutils.index.ExportClips(junjyoukirari_23_ts, clips, outputPath=tmp_path / 'clips.ts')[0]
+    assert concatenated.stat().st_size == sum(path.stat().st_size for path in paths)
+
+def test_LoadIndex_Cache(tmp_path, monkeypatch):
+    monkeypatch.setenv('TSUTILS_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setenv('TSUTILS_CACHE', '1')
+    path = tsutils.benchmark.MakeFixture('sd', tmp_path / 'sd.ts', 2)
+    index = tsutils.index.LoadIndex(path, quiet=True)
+    assert index['isKey'].sum() > 0
+    # nothing next to the recording, the index is with the other results
+    assert sorted(tmp_path.iterdir()) == [ tmp_path / 'cache', path ]
+    assert len(list((tmp_path / 'cache' / 'results').glob('*/*.npy'))) == 1
+    assert np.array_equal(tsutils.index.LoadIndex(path, quiet=True), index)
@@ -0,0 +1,56 @@
+import os, time
+import pytest
+import tsutils.progress
+from tsutils.common import EncodingError
+
+fields = {
+    'frame': '1199', 'fps': '59.94', 'stream_0_0_q': '-1.0', 'bitrate': '8948.3kbits/s',
+    'total_size': '44741368', 'out_time_us': '40000000', 'out_time_ms': '40000000', 'out_time': '00:00:40.000000',
+    'dup_frames': '2', 'drop_frames': '1', 'speed': '1.5x', 'progress': 'end',
+}
+
+def test_GetProgressEvent():
+    event = tsutils.progress.GetProgressEvent(fields, 'Encoding', 'input.ts', 60.0, 26.7)
+    assert event['out_time'] == 40.0
+    assert event['frames'] == 1199
+    assert event['fps'] == 59.94
+    assert event['speed'] == 1.5
+    assert event['bitrate'] == 8948.3
+    assert event['total_size'] == 44741368
+    assert (event['dup_frames'], event['drop_frames']) == (2, 1)
+    assert event['progress'] == 'end'
+
+def test_GetProgressEvent_NotAvailable():
+    event = tsutils.progress.GetProgressEvent({ 'out_time': '00:01:02.500000', 'bitrate': 'N/A', 'speed': 'N/A', 'progress': 'continue' }, 'Encoding', 'input.ts', 60.0, 1.0)
+    assert event['out_time'] == 62.5
+    assert event['bitrate'] is None and event['speed'] is None
+
+def test_StallDetector():
+    detector = tsutils.progress.StallDetector(timeout=0)
+    event = tsutils.progress.GetProgressEvent(fields, 'Encoding', 'input.ts', 60.0, 26.7)
+    detector(event)
+    with pytest.raises(EncodingError, match='stalled'):
+        detector(event)
+
+def test_StallDetector_Jobs():
+    detector = tsutils.progress.StallDetector(timeout=0.05)
+    for i in range(3):
+        # the first job moves on, the second one is stuck
+        detector(tsutils.progress.GetProgressEvent(dict(fields, out_time_us=str(i), progress='continue'), 'Chunk 0', 'input.ts', 60.0, 1.0, job=0))
+        if i == 0:
+            detector(tsutils.progress.GetProgressEvent(dict(fields, progress='continue'), 'Chunk 1', 'input.ts', 60.0, 1.0, job=1))
+        time.sleep(0.05)
+    with pytest.raises(EncodingError, match='stalled'):
+        detector(tsutils.progress.GetProgressEvent(dict(fields, progress='continue'), 'Chunk 1', 'input.ts', 60.0, 1.0, job=1))
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='needs a named pipe')
+def test_RunFFmpeg_Stalled(tmp_path):
+    # ffmpeg waits forever for input, so it never sends a progress block
+    fifoPath = tmp_path / 'input.pcm'
+    os.mkfifo(fifoPath)
+    fd = os.open(fifoPath, os.O_RDWR)
+    try:
+        with pytest.raises(EncodingError, match='stalled'):
+            tsutils.progress.RunFFmpeg([ 'ffmpeg', '-f', 's16le', '-i', str(fifoPath), '-f', 'null', '-' ], 10, 'Stalled', quiet=True, callbacks=[ tsutils.progress.StallDetector(timeout=1) ])
+    finally:
+        os.close(fd)
@@ -0,0 +1,50 @@
+import tempfile
+from pathlib import Path
+import numpy as np
+import tsutils.props
+
+propList = [
+    {
+        'ptsTime': 10.01, 'pos': 564, 'checksum': '6B5C3C82',
+        'plane_checksum': [ 'D70725EB', '56A2C195', '069C54F3' ],
+        'mean': [ 126.0, 127.0, 126.0 ], 'stdev': [ 55.9, 79.4, 83.7 ],
+        'isKey': 1, 'type': 'I', 'sad': 0.0,
+    },
+    {
+        'ptsTime': 10.043, 'pos': 98324, 'checksum': '0B5C3C82',
+        'plane_checksum': [ 'D70725EB', '56A2C195', '069C54F3' ],
+        'mean': [ 125.0, 127.0, 126.0 ], 'stdev': [ 55.1, 79.4, 83.7 ],
+        'isKey': 0, 'type': 'B', 'sad': 0.02,
+    },
+    {
+        'ptsTime': 10.076, 'pos': 99204, 'checksum': '00000001',
+        'plane_checksum': [ 'D70725EB', '56A2C195', '069C54F3' ],
+        'mean': [ 124.0, 127.0, 126.0 ], 'stdev': [ 55.0, 79.4, 83.7 ],
+        'isKey': 0, 'type': 'P', 'sad': 0.03,
+    },
+]
+
+def test_PropsToArray_RoundTrip():
+    props = tsutils.props.PropsToArray(propList)
+    assert tsutils.props.ArrayToProps(props) == propList
+
+def test_SaveProps_Npy():
+    with tempfile.TemporaryDirectory(prefix='test_SaveProps') as tmpFolder:
+        path = tsutils.props.SaveProps(propList, Path(tmpFolder) / 'props.npy')
+        props = tsutils.props.LoadProps(path)
+        assert isinstance(props, np.memmap)
+        assert tsutils.props.ArrayToProps(props) == propList
+        del props
+
+def test_SaveProps_Npz():
+    with tempfile.TemporaryDirectory(prefix='test_SaveProps') as tmpFolder:
+        path = tsutils.props.SaveProps(propList, Path(tmpFolder) / 'props.npz')
+        props = tsutils.props.LoadProps(path, columns=[ 'ptsTime', 'sad' ])
+        assert list(props.keys()) == [ 'ptsTime', 'sad' ]
+        assert list(props['sad']) == [ 0.0, 0.02, 0.03 ]
+
+def test_FindFrame():
+    props = tsutils.props.PropsToArray(propList)
+    assert tsutils.props.FindFrame(props, 10.05) == 1
+    assert tsutils.props.FindFrame(props, 0) == 0
+    assert tsutils.props.FindFrameRange(props, 10.02, 10.076) == (1, 3)
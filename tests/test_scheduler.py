@@ -0,0 +1,33 @@
+import shutil
+import tsutils.scheduler
+from tests import junjyoukirari_23_ts
+
+def test_GetBudget():
+    assert tsutils.scheduler.GetBudget(jobs=4, cores=16, memory=64) == (4, 4)
+    # RAM allows only 2 jobs of 2GB
+    assert tsutils.scheduler.GetBudget(jobs=4, cores=16, memory=4) == (2, 8)
+    assert tsutils.scheduler.GetBudget(jobs=32, cores=8, memory=64) == (8, 1)
+
+def test_JobQueue_Resume(tmp_path):
+    inputPath, outputPath = tmp_path / 'input.ts', tmp_path / 'input.mp4'
+    inputPath.write_bytes(b'input')
+    queuePath = tmp_path / 'queue.json'
+    queue = tsutils.scheduler.JobQueue(queuePath)
+    key = queue.Add(inputPath, 'encode', { 'crf': 22 })
+    queue.Update(key, status='done', output=str(outputPath))
+    # the output is gone, so the job is pending again
+    queue = tsutils.scheduler.JobQueue(queuePath)
+    assert queue.Add(inputPath, 'encode', { 'crf': 22 }) == key
+    assert queue.GetPending() == [ key ]
+    outputPath.write_bytes(b'output')
+    shutil.copystat(inputPath, outputPath)
+    queue.Update(key, status='done')
+    queue = tsutils.scheduler.JobQueue(queuePath)
+    queue.Add(inputPath, 'encode', { 'crf': 22 })
+    assert queue.GetPending() == []
+
+def test_RunJobs(tmp_path):
+    queue = tsutils.scheduler.JobQueue(tmp_path / 'queue.json')
+    keys = [ queue.Add(junjyoukirari_23_ts, 'encode', { 'crf': crf }) for crf in ( 22, 25 ) ]
+    result = tsutils.scheduler.RunJobs(queue, lambda job, threads: job['input'], keys=keys, jobs=2, quiet=True)
+    assert result['jobs'] == 2 and result['throughput'] > 0
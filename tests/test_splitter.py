@@ -1,5 +1,5 @@
 import pytest
-import tsutils.splitter
+import tsutils.splitter, tsutils.benchmark
 from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
 
 def test_Split_Success():
@@ -20,4 +20,33 @@ def test_Split_Invalid():
 def test_Trim():
     trimmedTs = tsutils.splitter.Trim(junjyoukirari_23_ts)
     assert '_trimmed.ts' in str(trimmedTs)
-    assert trimmedTs.stat().st_size > 1 * 1024 * 1024 * 1024
\ No newline at end of file
+    assert trimmedTs.stat().st_size > 1 * 1024 * 1024 * 1024
+
+@pytest.fixture(scope='module')
+def programs_ts(tmp_path_factory):
+    # an SD lead-in, the program with two sound tracks, then a short tail of the next one
+    folder = tmp_path_factory.mktemp('fixtures')
+    parts = [ tsutils.benchmark.MakeFixture(name, folder / f'{i}_{name}.ts', duration) for i, (name, duration) in enumerate([ ('sd', 0.2), ('dual', 10), ('basic', 0.2) ]) ]
+    path = folder / 'programs.ts'
+    path.write_bytes(b''.join(part.read_bytes() for part in parts))
+    return path, [ part.read_bytes() for part in parts ]
+
+def FirstPacketOf(data, pid):
+    return next(i for i in range(0, len(data), 188) if ((data[i + 1] & 0x1F) << 8 | data[i + 2]) == pid)
+
+def test_Trim_Ranges(programs_ts, tmp_path, monkeypatch):
+    monkeypatch.setattr(tsutils.splitter, 'TRIM_THRESHOLD', 1024 * 1024)
+    path, parts = programs_ts
+    # from the PMT of the program to the PMT of the next one
+    start = len(parts[0]) + FirstPacketOf(parts[1], 0x1000)
+    end = len(parts[0]) + len(parts[1]) + FirstPacketOf(parts[2], 0x1000)
+    trimmedTs = tsutils.splitter.Trim(path, outputPath=tmp_path / 'trimmed.ts', quiet=True)
+    assert trimmedTs.read_bytes() == path.read_bytes()[start:end]
+    # in place, the file is compacted and truncated
+    inPlaceTs = tmp_path / 'in_place.ts'
+    inPlaceTs.write_bytes(path.read_bytes())
+    assert tsutils.splitter.Trim(inPlaceTs, outputPath=inPlaceTs, quiet=True) == inPlaceTs
+    assert inPlaceTs.read_bytes() == trimmedTs.read_bytes()
+    # the native splitter cuts at the same places, the SD lead-in is dropped
+    splittedTs = tsutils.splitter.Split(path, native=True, quiet=True)
+    assert len(splittedTs) == 2
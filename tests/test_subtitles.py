@@ -1,6 +1,8 @@
 import pytest
+import pysubs2
 import tsutils.subtitles
-from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
+from tsutils.ts import Crc32, MakePATPacket
+from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts, Kanji, Packet
 
 def test_Extract_Success():
     files = tsutils.subtitles.Extract(junjyoukirari_23_ts)
@@ -10,4 +12,32 @@ def test_Extract_Success():
 
 def test_Extract_Invalid():
     files = tsutils.subtitles.Extract(invalid_ts)
-    assert len(files) == 0
\ No newline at end of file
+    assert len(files) == 0
+
+def Pes(streamId, pts, data):
+    ptsBytes = bytes([ 0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, 0x01 | ((pts >> 14) & 0xFE), (pts >> 7) & 0xFF, 0x01 | ((pts << 1) & 0xFE) ])
+    body = b'\x80\x80\x05' + ptsBytes + data
+    return b'\x00\x00\x01' + bytes([ streamId, len(body) >> 8, len(body) & 0xFF ]) + body
+
+def Caption(text):
+    unit = b'\x1F\x20' + len(text).to_bytes(3, 'big') + text
+    statement = b'\x00' + len(unit).to_bytes(3, 'big') + unit
+    group = bytes([ 0x01 << 2, 0, 0, len(statement) >> 8, len(statement) & 0xFF ]) + statement + b'\x00\x00'
+    return b'\x80\xFF\xF0' + group
+
+def test_Extract_Native(tmp_path):
+    pmtBody = b'\x00\x01\xC1\x00\x00\xE1\x00\xF0\x00' + b'\x02\xE1\x00\xF0\x00' + b'\x06\xE1\x30\xF0\x03\x52\x01\x30'
+    pmt = bytes([ 0x02, 0xB0, len(pmtBody) + 4 ]) + pmtBody
+    pmt += Crc32(pmt).to_bytes(4, 'big')
+    kanji = Kanji('字幕')
+    packets = [ MakePATPacket(1, 1, 0x1000, 0), Packet(0x1000, b'\x00' + pmt) ]
+    packets.append(Packet(0x100, Pes(0xE0, 90000, b'\x00' * 16)))
+    packets.append(Packet(0x130, Pes(0xBD, 90000 * 3, Caption(b'\x0C' + kanji))))
+    packets.append(Packet(0x130, Pes(0xBD, 90000 * 5, Caption(b'\x0C'))))
+    packets.append(Packet(0x100, Pes(0xE0, 90000 * 11, b'\x00' * 16)))
+    path = tmp_path / 'caption.ts'
+    path.write_bytes(b''.join(packets))
+    files = tsutils.subtitles.Extract(path, native=True, quiet=True)
+    assert len(files) == 2
+    events = pysubs2.load(str(path.with_suffix('.srt'))).events
+    assert [ (event.start, event.end, event.text) for event in events ] == [ (2000, 4000, '字幕') ]
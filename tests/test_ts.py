@@ -0,0 +1,33 @@
+import pytest
+import tsutils.ts
+from tests import junjyoukirari_23_ts, invalid_ts, not_existing_ts
+
+def test_SplitServices_Success(tmp_path):
+    splittedTs = tsutils.ts.SplitServices(junjyoukirari_23_ts, folder=tmp_path)
+    assert len(splittedTs) > 0
+    assert all('_HD-' in path.stem for path in splittedTs)
+
+def test_SplitServices_NotExisting():
+    with pytest.raises(tsutils.TsFileNotFound, match='"not_existing.ts" not found!'):
+        tsutils.ts.SplitServices(not_existing_ts)
+
+def test_SplitServices_Invalid():
+    with pytest.raises(tsutils.InvalidTsFormat, match='"invalid.ts" is invalid!'):
+        tsutils.ts.SplitServices(invalid_ts)
+
+def test_MakePATPacket():
+    packet = tsutils.ts.MakePATPacket(0x7FE0, 1024, 0x1F0, 5)
+    assert len(packet) == tsutils.ts.PACKET_SIZE
+    sections = tsutils.ts.SectionReader().Feed(packet)
+    assert len(sections) == 1
+    assert tsutils.ts.ParsePAT(sections[0]) == (0x7FE0, { 1024: 0x1F0 })
+
+def test_SectionReader_Verified():
+    reader = tsutils.ts.SectionReader()
+    for i in range(100):
+        assert len(reader.Feed(tsutils.ts.MakePATPacket(0x7FE0, 1024, 0x1F0, i % 16))) == 1
+    # one slot however often the section repeats
+    assert len(reader.verified) == 1
+    packet = bytearray(tsutils.ts.MakePATPacket(0x7FE0, 1024, 0x1F0, 0))
+    packet[14] ^= 0x01
+    assert reader.Feed(bytes(packet)) == []
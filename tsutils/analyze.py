@@ -0,0 +1,218 @@
+import os, sys, io, subprocess, threading, queue, itertools, shutil, argparse, json
+from pathlib import Path
+from tqdm import tqdm
+from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand
+from .ffmpeg import GetInfo, GetInfoFromLines, GetAudioChannelsFromLines, ReadFrames, GetSadImages, CalcSad, GetFramePropFromLine, FilterFrameProps, ExtractFrameProps
+from .audio import SilenceScanner, DetectSilence, ReadMixedBlocks, SAMPLE_RATE
+from .encode import GetAudioLanguagesByName, FindBoxFromFrames, FindVideoBox, StripTS
+from .index import PTS_CLOCK, PTS_WRAP, GetStartPts, GetPtsAt
+from .ts import AUDIO_STREAM_TYPES, GetMainService
+from .props import SaveProps
+
+# frames sampled over the whole video for the box, like FindVideoBox
+BOX_FRAMES = 100
+# ReadPCM's resampling, keeping the channels of the source to mix them down in numpy
+PCM_FILTER = f'asetpts=PTS-STARTPTS,aresample=async=1,aformat=sample_fmts=s16:sample_rates={SAMPLE_RATE}'
+
+def SampleFrames(frames, step, boxQueue):
+    # every step-th frame also goes to the box as RGB, the frames the fps filter of FindVideoBox picks
+    count = 0
+    for i, frame in enumerate(frames):
+        if i >= count * step:
+            boxQueue.put(frame[:, :, ::-1])
+            count += 1
+        yield frame
+
+def ReadSad(stream, info, sadList, boxQueue=None):
+    # SAD of every frame against the previous one, as StreamFrameProps does
+    frames = ReadFrames(stream, info['width'], info['height'])
+    if boxQueue is not None:
+        frames = SampleFrames(frames, info['duration'] * info['fps'] / BOX_FRAMES, boxQueue)
+    lastImage = None
+    try:
+        for image in GetSadImages(frames, info):
+            sadList.append(0.0 if lastImage is None else CalcSad(image, lastImage))
+            lastImage = image
+    finally:
+        if boxQueue is not None:
+            boxQueue.put(None)
+
+def GetQueued(boxQueue):
+    while True:
+        image = boxQueue.get()
+        if image is None:
+            break
+        yield image
+
+def FindBox(boxQueue, info, boxResult, errors):
+    images = GetQueued(boxQueue)
+    try:
+        boxResult.append(FindBoxFromFrames(images, info['width'], info['height']))
+    except Exception as e:
+        errors.append(e)
+    # the SAD reader never waits on a failed box
+    for _ in images:
+        pass
+
+def ReadSilence(stream, scanners, channels):
+    for samples in ReadMixedBlocks(stream, channels):
+        for scanner in scanners.values():
+            scanner.Feed(samples[:, 0])
+
+def DrainAfter(stream, target, errors):
+    # a failed reader still empties its pipe, or ffmpeg would block on it and never exit
+    try:
+        target(stream)
+    except Exception as e:
+        errors.append(e)
+    while stream.read(1024 * 1024):
+        pass
+
+def GetPts(line):
+    return int(line.split(' pts:')[1].split()[0])
+
+def AnalyzeSequentially(path, silenceParams, box, strip, quiet):
+    # no fd passing on Windows, so every consumer decodes on its own
+    info = GetInfo(path)
+    return {
+        'info': info,
+        'props': ExtractFrameProps(path, 0, info['duration'], pipe=True, quiet=quiet),
+        'silence': { params: DetectSilence(path, min_silence_len=params[0], silence_thresh=params[1], quiet=quiet, backend='numpy') for params in silenceParams },
+        'box': FindVideoBox(path, quiet=quiet) if box else None,
+        'strip': StripTS(path, outputPath=strip, quiet=quiet) if strip else None,
+    }
+
+def Analyze(path, silenceParams=((800, -80),), box=True, strip=None, audioLanguages=None, quiet=False):
+    # frame props, silence periods, crop box and optionally the stripped TS, demuxing and decoding once
+    CheckExtenralCommand('ffmpeg')
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    silenceParams = [ tuple(params) for params in silenceParams ]
+    if os.name == 'nt':
+        return AnalyzeSequentially(path, silenceParams, box, strip, quiet)
+    mainService = GetMainService(path)
+    if mainService is None:
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    # the PCM output needs a stream, the rest of the info comes from ffmpeg's own banner
+    soundTracks = sum(streamType in AUDIO_STREAM_TYPES for streamType, _ in mainService[1]['streams'])
+    hasAudio = soundTracks > 0
+    args = [
+        # no -ss, like StripTS which keeps the audio before the first keyframe
+        'ffmpeg', '-hide_banner', '-y', '-i', str(path),
+        '-map', '0:v:0', '-vsync', '0', '-filter:v', "select='gte(t,0)',showinfo",
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1',
+    ]
+    passFds = []
+    if hasAudio:
+        pcmRead, pcmWrite = os.pipe()
+        args += [ '-map', '0:a:0', '-filter:a', PCM_FILTER, '-f', 's16le', f'pipe:{pcmWrite}' ]
+        passFds.append(pcmWrite)
+    if strip:
+        strip = Path(strip)
+        audioLanguages = GetAudioLanguagesByName(path.name) if audioLanguages is None else audioLanguages
+        # same streams and tags as StripTS
+        args += [ '-map', '0:v', '-map', '0:a?', '-ignore_unknown', '-c:v', 'copy', '-c:a', 'copy' ]
+        for i in range(soundTracks):
+            args += [ f'-metadata:s:a:{i}', f'language={audioLanguages[i]}' ]
+        args += [ str(strip) ]
+    pipeObj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, pass_fds=passFds)
+    for fd in passFds:
+        os.close(fd)
+    readers = [ pipeObj.stdout ]
+    if hasAudio:
+        readers.append(open(pcmRead, 'rb'))
+    lines = io.TextIOWrapper(pipeObj.stderr, errors='ignore')
+    # nothing is written to the pipes before the banner ends
+    banner = list(itertools.takewhile(lambda line: 'Press [q] to stop' not in line, lines))
+    info = GetInfoFromLines(banner, minSoundTracks=1 if hasAudio else 0)
+    channels = GetAudioChannelsFromLines(banner)[:1] if hasAudio else []
+    if info is None or hasAudio and not channels:
+        pipeObj.kill()
+        pipeObj.wait()
+        for stream in readers:
+            stream.close()
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    duration = info['duration']
+    # every output is drained at the same time, or ffmpeg would block on the first full pipe
+    sadList = []
+    boxResult = []
+    boxQueue = queue.Queue() if box else None
+    scanners = { params: SilenceScanner(min_silence_len=params[0], silence_thresh=params[1]) for params in silenceParams }
+    errors = []
+    threads = [ threading.Thread(target=DrainAfter, args=(pipeObj.stdout, lambda stream: ReadSad(stream, info, sadList, boxQueue), errors), daemon=True) ]
+    if hasAudio:
+        threads.append(threading.Thread(target=DrainAfter, args=(readers[1], lambda stream: ReadSilence(stream, scanners, [ channels[0] or 2 ]), errors), daemon=True))
+    if box:
+        threads.append(threading.Thread(target=FindBox, args=(boxQueue, info, boxResult, errors), daemon=True))
+    for thread in threads:
+        thread.start()
+    propList = []
+    ptsList = []
+    try:
+        with tqdm(total=duration, unit='secs', disable=quiet) as pbar:
+            pbar.set_description('Analyzing')
+            for line in lines:
+                if 'pts_time:' in line:
+                    prop = GetFramePropFromLine(line)
+                    propList.append(prop)
+                    ptsList.append(GetPts(line))
+                    pbar.update(max(min(prop['ptsTime'], duration) - pbar.n, 0))
+            pipeObj.wait()
+            pbar.update(duration - pbar.n)
+    except BaseException:
+        pipeObj.kill()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        for stream in readers:
+            stream.close()
+    if errors:
+        raise errors[0]
+    if pipeObj.returncode != 0:
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    # ffmpeg rebases on the earliest stream it reads, ExtractFrameProps reads only the video
+    # and starts at the video, where the first decoded frame can come later when cut mid-GOP
+    if propList:
+        firstPts = (GetPtsAt(path, propList[0]['pos']) - GetStartPts(path)) % PTS_WRAP
+        for prop, pts in zip(propList, ptsList):
+            prop['ptsTime'] = float(f'{(1 / PTS_CLOCK) * (pts - ptsList[0] + firstPts):.6g}')
+    # the clip is corrupted if we cannot extract the same number of images
+    if len(sadList) == 0 or len(sadList) != len(propList):
+        propList = []
+    for prop, sad in zip(propList, sadList):
+        prop['sad'] = sad
+    if strip:
+        shutil.copystat(path, strip)
+    return {
+        'info': info,
+        'props': FilterFrameProps(propList, 0, duration),
+        'silence': { params: scanner.Finish() for params, scanner in scanners.items() },
+        'box': boxResult[0] if box and boxResult else None,
+        'strip': strip,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Analyze a TS file with a single decode')
+    parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
+    parser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    parser.add_argument('--length', '-l', type=int, nargs='+', default=[ 800 ], help='minimum silence lengths (ms)')
+    parser.add_argument('--threshold', '-t', type=int, nargs='+', default=[ -80 ], help='silence thresholds (dB)')
+    parser.add_argument('--props', '-p', help='save the frame props to this path (.npy or .npz)')
+    parser.add_argument('--strip', '-s', help='also write the stripped TS to this path')
+    args = parser.parse_args()
+
+    result = Analyze(
+        args.input,
+        silenceParams=[ (length, threshold) for length in args.length for threshold in args.threshold ],
+        strip=args.strip,
+        quiet=args.quiet)
+    if args.props:
+        SaveProps(result['props'], args.props)
+    json.dump({
+        'frames': len(result['props']),
+        'silence': { f'{length},{threshold}': periods for (length, threshold), periods in result['silence'].items() },
+        'box': result['box'],
+        'strip': str(result['strip']) if result['strip'] else None,
+    }, sys.stdout, indent=1)
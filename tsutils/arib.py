@@ -0,0 +1,334 @@
+import datetime
+
+# graphic sets of ARIB STD-B24, by the final byte of their designation
+ONE_BYTE_SETS = {
+    0x4A: 'alnum', 0x36: 'alnum',
+    0x30: 'hiragana', 0x37: 'hiragana',
+    0x31: 'katakana', 0x38: 'katakana',
+    0x49: 'jisKatakana',
+    0x32: 'mosaic', 0x33: 'mosaic', 0x34: 'mosaic', 0x35: 'mosaic',
+}
+TWO_BYTE_SETS = {
+    0x42: 'kanji', 0x39: 'kanji', 0x3A: 'kanji',
+    0x3B: 'symbols',
+}
+TWO_BYTE_NAMES = ( 'kanji', 'symbols', 'drcs2' )
+
+HIRAGANA = [ bytes([ 0xA4, 0xA0 + i ]).decode('euc_jp') for i in range(1, 84) ] + [ '　', '　', '　', 'ゝ', 'ゞ', 'ー', '。', '「', '」', '、', '・' ]
+KATAKANA = [ bytes([ 0xA5, 0xA0 + i ]).decode('euc_jp') for i in range(1, 87) ] + [ 'ヽ', 'ヾ', 'ー', '。', '「', '」', '、', '・' ]
+
+# additional symbols in row 90 of the kanji set
+ADDITIONAL_SYMBOLS = dict(zip(range(0x7A50, 0x7A75), [
+    '[HV]', '[SD]', '[Ｐ]', '[Ｗ]', '[MV]', '[手]', '[字]', '[双]', '[デ]', '[Ｓ]', '[二]', '[多]', '[解]', '[SS]', '[Ｂ]', '[Ｎ]',
+    '■', '●', '[天]', '[交]', '[映]', '[無]', '[料]', '[年齢制限]', '[前]', '[後]', '[再]', '[新]', '[初]', '[終]', '[生]', '[販]',
+    '[声]', '[吹]', '[PPV]', '(秘)', 'ほか',
+]))
+UNKNOWN_CHAR = '〓'
+
+# default macros of the caption coding (ARIB TR-B14), each designates a group of sets
+DEFAULT_MACROS = { 0x60 + i: bytes.fromhex(macro + '1b2b20700f1b7d') for i, macro in enumerate([
+    '1b24421b294a1b2a30', '1b24421b29311b2a30', '1b24421b2920411b2a30', '1b28321b29341b2a35',
+    '1b28321b29331b2a35', '1b28321b2920411b2a35', '1b2820411b2920421b2a2043', '1b2820441b2920451b2a2046',
+    '1b2820471b2920481b2a2049', '1b28204a1b29204b1b2a204c', '1b28204d1b29204e1b2a204f', '1b24421b2920421b2a30',
+    '1b24421b2920431b2a30', '1b24421b2920441b2a30', '1b28311b29301b2a4a', '1b284a1b29321b2a2041',
+]) }
+
+# parameter bytes following C1 control codes
+C1_PARAMS = { 0x8B: 1, 0x91: 1, 0x93: 1, 0x94: 1, 0x97: 1, 0x98: 1 }
+
+class AribString:
+    # decoder for ARIB 8 unit character strings, the state lives for one string
+    def __init__(self, caption=False):
+        # captions start with the macro set in G3 and use their own screen controls
+        self.caption = caption
+        self.sets = [ 'kanji', 'alnum', 'hiragana', 'macro' if caption else 'katakana' ]
+        self.gl = 0
+        self.gr = 2
+        self.singleShift = None
+        self.normalSize = True
+        self.smallSize = False
+        self.cleared = False
+
+    def Designate(self, data, i):
+        # ESC sequences from data[i] (the byte after ESC), returns the index after them
+        b = data[i]
+        invocations = { 0x6E: ('gl', 2), 0x6F: ('gl', 3), 0x7E: ('gr', 1), 0x7D: ('gr', 2), 0x7C: ('gr', 3) }
+        if b in invocations:
+            name, value = invocations[b]
+            setattr(self, name, value)
+            return i + 1
+        if 0x28 <= b <= 0x2B and i + 1 < len(data):
+            if data[i + 1] == 0x20:
+                self.sets[b - 0x28] = 'macro' if i + 2 < len(data) and data[i + 2] == 0x70 else 'drcs'
+                return i + 3
+            self.sets[b - 0x28] = ONE_BYTE_SETS.get(data[i + 1], 'mosaic')
+            return i + 2
+        if b == 0x24 and i + 1 < len(data):
+            b = data[i + 1]
+            if 0x28 <= b <= 0x2B and i + 2 < len(data):
+                if data[i + 2] == 0x20:
+                    self.sets[b - 0x28] = 'drcs2'
+                    return i + 4
+                self.sets[b - 0x28] = TWO_BYTE_SETS.get(data[i + 2], 'drcs2')
+                return i + 3
+            self.sets[0] = TWO_BYTE_SETS.get(b, 'drcs2')
+            return i + 2
+        return i + 1
+
+    def GetChar(self, charSet, b1, b2=None):
+        if self.smallSize:
+            # ruby above the caption text
+            return ''
+        if charSet == 'macro':
+            return self.Decode(DEFAULT_MACROS[b1]) if b1 in DEFAULT_MACROS else ''
+        if charSet == 'alnum':
+            return chr(b1 + 0xFEE0) if self.normalSize else chr(b1)
+        if charSet == 'hiragana':
+            return HIRAGANA[b1 - 0x21]
+        if charSet == 'katakana':
+            return KATAKANA[b1 - 0x21]
+        if charSet == 'jisKatakana':
+            return chr(0xFF61 + b1 - 0x21) if b1 <= 0x5F else ''
+        if charSet in ( 'kanji', 'symbols' ):
+            if b1 >= 0x75:
+                return ADDITIONAL_SYMBOLS.get((b1 << 8) | b2, UNKNOWN_CHAR)
+            return bytes([ b1 | 0x80, b2 | 0x80 ]).decode('euc_jis_2004', errors='replace').replace('�', UNKNOWN_CHAR)
+        # mosaic and DRCS glyphs have no text
+        return ''
+
+    def Decode(self, data):
+        chars = []
+        i = 0
+        while i < len(data):
+            b = data[i]
+            if b < 0x20:
+                i += 1
+                if b == 0x0F:
+                    self.gl = 0
+                elif b == 0x0E:
+                    self.gl = 1
+                elif b == 0x19:
+                    self.singleShift = 2
+                elif b == 0x1D:
+                    self.singleShift = 3
+                elif b == 0x1B and i < len(data):
+                    i = self.Designate(data, i)
+                elif b == 0x0D:
+                    chars.append('\n')
+                elif b == 0x0C:
+                    self.cleared = True
+                elif b == 0x16:
+                    i += 1
+                elif b == 0x1C:
+                    # a caption line placed somewhere else starts a new line
+                    if self.caption and chars and chars[-1] != '\n':
+                        chars.append('\n')
+                    i += 2
+            elif b == 0x20:
+                chars.append('　' if self.normalSize else ' ')
+                i += 1
+            elif 0x80 <= b < 0xA0:
+                i += 1
+                if b in ( 0x88, 0x89 ):
+                    self.normalSize = False
+                    self.smallSize = b == 0x88 and self.caption
+                elif b == 0x8A:
+                    self.normalSize = True
+                    self.smallSize = False
+                elif b in ( 0x90, 0x92 ):
+                    i += 2 if i < len(data) and data[i] == 0x20 else 1
+                elif b == 0x9D:
+                    i += 2
+                elif b == 0x95:
+                    # macro definitions end with MACRO 0x4F
+                    end = data.find(b'\x95\x4F', i)
+                    i = len(data) if end < 0 else end + 2
+                elif b == 0x9B:
+                    while i < len(data) and not 0x40 <= data[i] <= 0x6F:
+                        i += 1
+                    i += 1
+                else:
+                    i += C1_PARAMS.get(b, 0)
+            elif b in ( 0x7F, 0xA0, 0xFF ):
+                i += 1
+            else:
+                if b < 0x80:
+                    charSet = self.sets[self.singleShift if self.singleShift is not None else self.gl]
+                else:
+                    charSet = self.sets[self.gr]
+                self.singleShift = None
+                if charSet in TWO_BYTE_NAMES:
+                    if i + 1 >= len(data):
+                        break
+                    chars.append(self.GetChar(charSet, b & 0x7F, data[i + 1] & 0x7F))
+                    i += 2
+                else:
+                    chars.append(self.GetChar(charSet, b & 0x7F))
+                    i += 1
+        return ''.join(chars)
+
+def DecodeAribString(data):
+    return AribString().Decode(bytes(data))
+
+def ParseCaptionStatements(pes):
+    # statement bodies of the first caption language in a synchronized PES data packet
+    payload = pes[9 + pes[8]:]
+    if len(payload) < 3 or payload[0] != 0x80:
+        return []
+    group = payload[3 + (payload[2] & 0x0F):]
+    # data groups 0x00 and 0x20 manage the captions, 0x01 and 0x21 carry the first language
+    if len(group) < 5 or (group[0] >> 2) & 0x0F != 1:
+        return []
+    groupSize = (group[3] << 8) | group[4]
+    data = group[5:5 + groupSize]
+    i = 1 + (5 if data[:1] and data[0] >> 6 in ( 1, 2 ) else 0)
+    end = min(i + 3 + int.from_bytes(data[i:i + 3], 'big'), len(data))
+    i += 3
+    bodies = []
+    while i + 5 <= end:
+        unitSize = int.from_bytes(data[i + 2:i + 5], 'big')
+        if data[i] == 0x1F and data[i + 1] == 0x20:
+            bodies.append(data[i + 5:i + 5 + unitSize])
+        i += 5 + unitSize
+    return bodies
+
+def DecodeCaption(bodies):
+    # text of one caption statement, and whether it clears the screen first
+    decoder = AribString(caption=True)
+    text = ''.join(decoder.Decode(body) for body in bodies)
+    lines = [ line.strip() for line in text.split('\n') ]
+    return '\n'.join(line for line in lines if line), decoder.cleared
+
+def DecodeBcd(value):
+    return (value >> 4) * 10 + (value & 0x0F)
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+def DecodeStartTime(data):
+    # 16 bit MJD and BCD hh:mm:ss in JST, to epoch milliseconds
+    if data == b'\xFF' * 5:
+        return None
+    mjd = (data[0] << 8) | data[1]
+    date = datetime.date(1858, 11, 17) + datetime.timedelta(days=mjd)
+    startAt = datetime.datetime(date.year, date.month, date.day, DecodeBcd(data[2]), DecodeBcd(data[3]), DecodeBcd(data[4]), tzinfo=JST)
+    return int(startAt.timestamp() * 1000)
+
+def DecodeDuration(data):
+    if data == b'\xFF' * 3:
+        return None
+    return (DecodeBcd(data[0]) * 3600 + DecodeBcd(data[1]) * 60 + DecodeBcd(data[2])) * 1000
+
+def ParseEIT(section):
+    # events of an EIT section with their raw descriptors, text is decoded later
+    serviceId = (section[3] << 8) | section[4]
+    transportStreamId = (section[8] << 8) | section[9]
+    networkId = (section[10] << 8) | section[11]
+    events = []
+    i = 14
+    while i + 12 <= len(section) - 4:
+        descriptorsLength = ((section[i + 10] & 0x0F) << 8) | section[i + 11]
+        event = {
+            'tableId': section[0],
+            'networkId': networkId,
+            'transportStreamId': transportStreamId,
+            'serviceId': serviceId,
+            'eventId': (section[i] << 8) | section[i + 1],
+            'startAt': DecodeStartTime(section[i + 2:i + 7]),
+            'duration': DecodeDuration(section[i + 7:i + 10]),
+            'isFree': (section[i + 10] & 0x10) == 0,
+            'short': None,
+            'extended': {},
+            'genres': None,
+        }
+        descriptors = section[i + 12:i + 12 + descriptorsLength]
+        j = 0
+        while j + 2 <= len(descriptors):
+            tag, length = descriptors[j], descriptors[j + 1]
+            body = descriptors[j + 2:j + 2 + length]
+            if tag == 0x4D:
+                nameLength = body[3]
+                textLength = body[4 + nameLength]
+                event['short'] = ( body[4:4 + nameLength], body[5 + nameLength:5 + nameLength + textLength] )
+            elif tag == 0x4E:
+                event['extended'][body[0] >> 4] = ( body[0] & 0x0F, body )
+            elif tag == 0x54:
+                event['genres'] = [ { 'lv1': body[k] >> 4, 'lv2': body[k] & 0x0F, 'un1': body[k + 1] >> 4, 'un2': body[k + 1] & 0x0F } for k in range(0, len(body) - 1, 2) ]
+            j += 2 + length
+        events.append(event)
+        i += 12 + descriptorsLength
+    return events
+
+def DecodeExtended(descriptors):
+    # items may continue across descriptors, so the bytes are joined before decoding
+    items = []
+    for number in sorted(descriptors):
+        body = descriptors[number][1]
+        itemsLength = body[4]
+        k = 5
+        while k < 5 + itemsLength:
+            descriptionLength = body[k]
+            description = body[k + 1:k + 1 + descriptionLength]
+            itemLength = body[k + 1 + descriptionLength]
+            item = body[k + 2 + descriptionLength:k + 2 + descriptionLength + itemLength]
+            if descriptionLength == 0 and items:
+                items[-1][1] += item
+            else:
+                items.append([ description, item ])
+            k += 2 + descriptionLength + itemLength
+    return { DecodeAribString(description): DecodeAribString(item) for description, item in items }
+
+def IsExtendedComplete(descriptors):
+    if not descriptors:
+        return False
+    last = max(lastNumber for lastNumber, _ in descriptors.values())
+    return all(number in descriptors for number in range(last + 1))
+
+class EventStore:
+    # merges the pieces of every event seen in EIT p/f and schedule sections
+    def __init__(self):
+        self.events = {}
+
+    def Add(self, event):
+        key = ( event['networkId'], event['serviceId'], event['eventId'] )
+        stored = self.events.get(key)
+        if stored is None:
+            stored = self.events[key] = { 'tableIds': set(), 'short': None, 'extended': {}, 'genres': None }
+        stored['tableIds'].add(event['tableId'])
+        for name in ( 'networkId', 'serviceId', 'eventId', 'isFree' ):
+            stored[name] = event[name]
+        for name in ( 'startAt', 'duration', 'short', 'genres' ):
+            if event[name] is not None:
+                stored[name] = event[name]
+        stored['extended'].update(event['extended'])
+        return key
+
+    def IsComplete(self, key):
+        # p/f sections carry every descriptor of their events, schedules may split them
+        stored = self.events[key]
+        if stored['short'] is None or stored.get('startAt') is None:
+            return False
+        return bool(stored['tableIds'] & { 0x4E, 0x4F }) or IsExtendedComplete(stored['extended'])
+
+    def GetProgram(self, key):
+        # the program item as written by mirakurun-epgdump
+        stored = self.events[key]
+        program = {
+            'id': stored['networkId'] * 10000000000 + stored['serviceId'] * 100000 + stored['eventId'],
+            'eventId': stored['eventId'],
+            'serviceId': stored['serviceId'],
+            'networkId': stored['networkId'],
+            'startAt': stored.get('startAt'),
+            'duration': stored.get('duration'),
+            'isFree': stored['isFree'],
+        }
+        if stored['short'] is not None:
+            program['name'] = DecodeAribString(stored['short'][0])
+            program['description'] = DecodeAribString(stored['short'][1])
+        if stored['genres']:
+            program['genres'] = stored['genres']
+        if stored['extended']:
+            program['extended'] = DecodeExtended(stored['extended'])
+        return program
+
+    def GetPrograms(self):
+        return [ self.GetProgram(key) for key in self.events ]
@@ -1,18 +1,258 @@
-import sys, tempfile, argparse
+import sys, tempfile, argparse, subprocess, threading, json
 from pathlib import Path
+import numpy as np
+from tqdm import tqdm
 from pydub import AudioSegment
 from pydub.silence import detect_silence
-from .ffmpeg import ExtractStream
-from .common import FormatTimestamp
+from .ffmpeg import ExtractStream, GetInfo, GetAudioChannels
+from .common import FormatTimestamp, CheckExtenralCommand, TsFileNotFound, EncodingError
+from .cache import Cached
 
-def DetectSilence(path, ss=0, to=999999, min_silence_len=800, silence_thresh=-80, quiet=False):
+SAMPLE_RATE = 48000
+SEEK_STEP = 10
+BLOCK_SECONDS = 10
+# first_pts=0 pads the start, so sample i is at i / SAMPLE_RATE on the same timeline as -ss
+PCM_FILTER = 'aresample=async=1:first_pts=0'
+
+def GetPCMFilter(channels, rate=SAMPLE_RATE, audioFilter='aresample=async=1'):
+    # s16 with the channels of the WAV pydub loads, mono is copied to both sides at full gain
+    # as a stereo layout would upmix it at -3dB, more than 2 channels keep their own layout
+    if channels == 1:
+        return f'{audioFilter},pan=stereo|c0=c0|c1=c0,aformat=sample_fmts=s16:sample_rates={rate}:channel_layouts=stereo'
+    if channels is not None and channels > 2:
+        return f'{audioFilter},aformat=sample_fmts=s16:sample_rates={rate}'
+    return f'{audioFilter},aformat=sample_fmts=s16:sample_rates={rate}:channel_layouts=stereo'
+
+def GetPCMChannels(channels):
+    return channels if channels is not None and channels > 2 else 2
+
+def MixDown(frames):
+    # exactly like pydub's set_channels(1)
+    if frames.shape[1] == 2:
+        return ((frames[:, 0] + frames[:, 1]) >> 1).astype(np.int16)
+    return (frames // frames.shape[1]).sum(axis=1).astype(np.int16)
+
+def ReadPCMBlocks(stream, channels, rate=SAMPLE_RATE):
+    # s16le frames of the tracks side by side (GetPCMFilter), one mixed down column per track
+    return ReadMixedBlocks(stream, [ GetPCMChannels(trackChannels) for trackChannels in channels ], rate)
+
+def ReadMixedBlocks(stream, widths, rate=SAMPLE_RATE):
+    # s16le frames of tracks with widths channels each, side by side
+    bounds = np.cumsum([ 0 ] + list(widths))
+    frameSize = int(bounds[-1]) * 2
+    while True:
+        data = stream.read(rate * BLOCK_SECONDS * frameSize)
+        data = data[:len(data) // frameSize * frameSize]
+        if not data:
+            break
+        frames = np.frombuffer(data, dtype=np.int16).reshape(-1, bounds[-1]).astype(np.int32)
+        yield np.stack([ MixDown(frames[:, bounds[i]:bounds[i + 1]]) for i in range(len(widths)) ], axis=1)
+
+def ReadTracksPCM(path, ss=0, to=999999, tracks=None, rate=SAMPLE_RATE, quiet=False, audioFilter='aresample=async=1'):
+    CheckExtenralCommand('ffmpeg')
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    info = GetInfo(path)
+    if tracks is None:
+        tracks = list(range(info['soundTracks']))
+    channels = GetAudioChannels(path)
+    channels = [ channels[track] if track < len(channels) else None for track in tracks ]
+    # every track is resampled like the WAV path, then merged into one pipe
+    filters = [ f'[0:a:{track}]{GetPCMFilter(channels[i], rate, audioFilter)}[a{i}]' for i, track in enumerate(tracks) ]
+    if len(tracks) > 1:
+        filters.append(''.join(f'[a{i}]' for i in range(len(tracks))) + f'amerge=inputs={len(tracks)}[aout]')
+        output = '[aout]'
+    else:
+        output = '[a0]'
+    args = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-ss', str(ss), '-to', str(to), '-i', path,
+        '-filter_complex', ';'.join(filters), '-map', output,
+        '-f', 's16le', '-'
+    ]
+    pipeObj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = []
+    stderrThread = threading.Thread(target=lambda: errors.extend(pipeObj.stderr), daemon=True)
+    stderrThread.start()
+    try:
+        with tqdm(total=min(to, info['duration']) - ss, unit='secs', disable=quiet) as pbar:
+            pbar.set_description('Reading PCM')
+            for samples in ReadPCMBlocks(pipeObj.stdout, channels, rate):
+                pbar.update(len(samples) / rate)
+                yield samples
+        pipeObj.wait()
+        stderrThread.join()
+        if pipeObj.returncode != 0:
+            raise EncodingError(f'Failed to read audio from "{path.name}": {b"".join(errors).decode(errors="ignore").strip()}')
+    finally:
+        # the consumer may stop early
+        if pipeObj.poll() is None:
+            pipeObj.kill()
+            pipeObj.wait()
+
+def ReadPCM(path, ss=0, to=999999, track=0, rate=SAMPLE_RATE, quiet=False, audioFilter='aresample=async=1'):
+    for samples in ReadTracksPCM(path, ss=ss, to=to, tracks=[ track ], rate=rate, quiet=quiet, audioFilter=audioFilter):
+        yield samples[:, 0]
+
+class SilenceScanner:
+    # windowed RMS over a PCM stream, giving the same periods as pydub's detect_silence
+    def __init__(self, min_silence_len=800, silence_thresh=-80, rate=SAMPLE_RATE, seek_step=SEEK_STEP):
+        self.minSilenceLen = min_silence_len
+        self.seekStep = seek_step
+        self.rate = rate
+        self.threshold = 10 ** (silence_thresh / 20) * 32768
+        self.windowSize = min_silence_len * rate // 1000
+        self.stepSize = seek_step * rate // 1000
+        self.squares = np.zeros(0, dtype=np.int64)
+        self.squaresStart = 0
+        self.nextWindow = 0
+        self.total = 0
+        self.rangeStart = None
+        self.prevStart = None
+        self.periods = []
+
+    def AddSilenceStart(self, start):
+        if self.prevStart is not None:
+            continuous = start == self.prevStart + self.seekStep
+            hasGap = start > self.prevStart + self.minSilenceLen
+            if not continuous and hasGap:
+                self.periods.append([ self.rangeStart, self.prevStart + self.minSilenceLen ])
+                self.rangeStart = start
+        else:
+            self.rangeStart = start
+        self.prevStart = start
+
+    def ScanWindows(self, starts):
+        # starts are sample offsets, windows beyond the buffer are zero padded like pydub does
+        if len(starts) == 0:
+            return
+        cumsum = np.concatenate(([ 0 ], np.cumsum(self.squares)))
+        relStarts = starts - self.squaresStart
+        ends = np.minimum(relStarts + self.windowSize, len(self.squares))
+        rms = np.floor(np.sqrt((cumsum[ends] - cumsum[relStarts]) / self.windowSize))
+        for start in starts[rms <= self.threshold]:
+            self.AddSilenceStart(int(start) * 1000 // self.rate)
+
+    def Feed(self, samples):
+        self.squares = np.concatenate((self.squares, samples.astype(np.int64) ** 2))
+        self.total += len(samples)
+        lastWindow = self.total - self.windowSize
+        if lastWindow >= self.nextWindow:
+            starts = np.arange(self.nextWindow, lastWindow + 1, self.stepSize)
+            self.ScanWindows(starts)
+            self.nextWindow = int(starts[-1]) + self.stepSize
+        # keep enough samples for the next windows and the final slice
+        keep = min(len(self.squares), self.windowSize + self.stepSize)
+        self.squaresStart += len(self.squares) - keep
+        self.squares = self.squares[len(self.squares) - keep:]
+
+    def Finish(self):
+        segLen = round(1000 * self.total / self.rate)
+        if segLen < self.minSilenceLen:
+            return []
+        lastSliceStart = segLen - self.minSilenceLen
+        starts = list(range(self.nextWindow * 1000 // self.rate, lastSliceStart + 1, self.seekStep))
+        if lastSliceStart % self.seekStep:
+            starts.append(lastSliceStart)
+        self.ScanWindows(np.array(starts, dtype=np.int64) * self.rate // 1000)
+        periods = self.periods
+        if self.prevStart is not None:
+            periods = periods + [ [ self.rangeStart, self.prevStart + self.minSilenceLen ] ]
+        return periods
+
+def DetectSilenceFromPCM(path, ss=0, to=999999, min_silence_len=800, silence_thresh=-80, quiet=False):
+    scanner = SilenceScanner(min_silence_len=min_silence_len, silence_thresh=silence_thresh)
+    for samples in ReadPCM(path, ss=ss, to=to, quiet=quiet):
+        scanner.Feed(samples)
+    return scanner.Finish()
+
+class SilenceDetector:
+    # decodes a track once, then answers DetectSilence queries from a memory-mapped buffer
+    def __init__(self, path, track=0, pcmPath=None, quiet=False):
+        self.path = Path(path)
+        if not self.path.is_file():
+            raise TsFileNotFound(f'"{self.path.name}" not found!')
+        self.track = track
+        self.tmpFolder = None
+        if pcmPath is None:
+            self.tmpFolder = tempfile.TemporaryDirectory(prefix='tsutils_pcm_')
+            pcmPath = Path(self.tmpFolder.name) / f'audio_{track}.pcm'
+        self.pcmPath = Path(pcmPath)
+        # the header beside the PCM records what was decoded, a reused path for another file or track is decoded again
+        self.headerPath = self.pcmPath.with_name(f'{self.pcmPath.name}.json')
+        if not self.pcmPath.is_file() or self.LoadHeader() != self.GetHeader():
+            self.Decode(quiet=quiet)
+        self.pcm = np.memmap(self.pcmPath, dtype=np.int16, mode='r') if self.pcmPath.stat().st_size > 0 else np.zeros(0, dtype=np.int16)
+
+    def GetHeader(self):
+        stat = self.path.stat()
+        return { 'source': str(self.path.resolve()), 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'track': self.track, 'filter': PCM_FILTER }
+
+    def LoadHeader(self):
+        try:
+            with self.headerPath.open(encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def Decode(self, quiet=False):
+        self.headerPath.unlink(missing_ok=True)
+        tmpPath = self.pcmPath.with_suffix('.part')
+        with tmpPath.open('wb') as f:
+            for samples in ReadPCM(self.path, track=self.track, quiet=quiet, audioFilter=PCM_FILTER):
+                f.write(samples.tobytes())
+        tmpPath.replace(self.pcmPath)
+        with self.headerPath.open('w', encoding='utf8') as f:
+            json.dump(self.GetHeader(), f)
+
+    def Detect(self, ss=0, to=999999, min_silence_len=800, silence_thresh=-80):
+        scanner = SilenceScanner(min_silence_len=min_silence_len, silence_thresh=silence_thresh)
+        start = min(round(ss * SAMPLE_RATE), len(self.pcm))
+        end = min(round(to * SAMPLE_RATE), len(self.pcm))
+        blockSize = SAMPLE_RATE * BLOCK_SECONDS
+        for i in range(start, end, blockSize):
+            scanner.Feed(self.pcm[i:min(i + blockSize, end)])
+        return scanner.Finish()
+
+    def DetectMany(self, queries):
+        # queries are (ss, to, min_silence_len, silence_thresh) tuples
+        return [ self.Detect(*query) for query in queries ]
+
+    def Close(self):
+        self.pcm = None
+        if self.tmpFolder is not None:
+            self.tmpFolder.cleanup()
+            self.tmpFolder = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.Close()
+
+def DetectSilenceGrid(path, ss=0, to=999999, lengths=(800,), thresholds=(-80,), tracks=None, quiet=False):
+    # one decode for all tracks, every (min_silence_len, silence_thresh) pair evaluated on the same blocks
+    if tracks is None:
+        tracks = list(range(GetInfo(path)['soundTracks']))
+    scanners = { track: { (length, thresh): SilenceScanner(min_silence_len=length, silence_thresh=thresh) for length in lengths for thresh in thresholds } for track in tracks }
+    for samples in ReadTracksPCM(path, ss=ss, to=to, tracks=tracks, quiet=quiet):
+        for i, track in enumerate(tracks):
+            for scanner in scanners[track].values():
+                scanner.Feed(samples[:, i])
+    return { track: { params: scanner.Finish() for params, scanner in trackScanners.items() } for track, trackScanners in scanners.items() }
+
+@Cached(ignore=( 'quiet', ), version=2)
+def DetectSilence(path, ss=0, to=999999, min_silence_len=800, silence_thresh=-80, quiet=False, backend='pydub'):
+    if backend == 'numpy':
+        return DetectSilenceFromPCM(path, ss=ss, to=to, min_silence_len=min_silence_len, silence_thresh=silence_thresh, quiet=quiet)
     with tempfile.TemporaryDirectory(prefix='logoNet_wav_') as tmpLogoFolder:
         streamsFolder = ExtractStream(path=path, output=tmpLogoFolder, ss=ss, to=to, toWav=True, videoTracks=[], audioTracks=[0], quiet=quiet)
         audioFilename = streamsFolder / 'audio_0.wav'
         if not quiet:
             print(f'Detect silence (min_silence_len: {min_silence_len},  silence_thresh: {silence_thresh})...', file=sys.stderr)
         sound = AudioSegment.from_wav(audioFilename).set_channels(1)
-        periods = detect_silence(audio_segment=sound, min_silence_len=min_silence_len, silence_thresh=silence_thresh, seek_step=10)
+        periods = detect_silence(audio_segment=sound, min_silence_len=min_silence_len, silence_thresh=silence_thresh, seek_step=SEEK_STEP)
         if not quiet:
             print('done!', file=sys.stderr)
         return periods
@@ -21,10 +261,27 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Detect silent periods in TS files')
     parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
     parser.add_argument('--input', '-i', required=True, help='input mpegts path')
-    parser.add_argument('--length', '-l', type=int, default=800, help='min silence length in ms')
-    parser.add_argument('--threshold', '-t', type=int, default=-80, help='silence threshold')
+    parser.add_argument('--length', '-l', type=int, nargs='+', default=[ 800 ], help='min silence length in ms (several values with --grid)')
+    parser.add_argument('--threshold', '-t', type=int, nargs='+', default=[ -80 ], help='silence threshold (several values with --grid)')
+    parser.add_argument('--grid', action='store_true', help='analyse all sound tracks for every length and threshold in one decode')
+    parser.add_argument('--backend', choices=[ 'pydub', 'numpy' ], default='pydub', help='pydub loads a temporary WAV, numpy streams PCM from ffmpeg')
+    parser.add_argument('--pcm', help='decoded PCM cache, created if missing and reused by later runs of the same file and track')
+    parser.add_argument('--ss', type=float, default=0, help='from (seconds)')
+    parser.add_argument('--to', type=float, default=999999, help='to (seconds)')
     args = parser.parse_args()
 
-    silencePeriods = DetectSilence(path=args.input, min_silence_len=args.length, silence_thresh=args.threshold)
-    for period in silencePeriods:
-        print(FormatTimestamp(period[0] / 1000), period[1] - period[0])
\ No newline at end of file
+    if args.grid:
+        results = DetectSilenceGrid(args.input, ss=args.ss, to=args.to, lengths=args.length, thresholds=args.threshold, quiet=args.quiet)
+        for track, trackResults in results.items():
+            for (length, thresh), silencePeriods in trackResults.items():
+                print(f'track {track}, length {length}, threshold {thresh}:')
+                for period in silencePeriods:
+                    print(FormatTimestamp(period[0] / 1000), period[1] - period[0])
+    else:
+        if args.pcm:
+            with SilenceDetector(args.input, pcmPath=args.pcm, quiet=args.quiet) as detector:
+                silencePeriods = detector.Detect(args.ss, args.to, min_silence_len=args.length[0], silence_thresh=args.threshold[0])
+        else:
+            silencePeriods = DetectSilence(path=args.input, ss=args.ss, to=args.to, min_silence_len=args.length[0], silence_thresh=args.threshold[0], quiet=args.quiet, backend=args.backend)
+        for period in silencePeriods:
+            print(FormatTimestamp(period[0] / 1000), period[1] - period[0])
\ No newline at end of file
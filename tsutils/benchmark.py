@@ -0,0 +1,276 @@
+import sys, time, argparse, json, statistics, subprocess, tempfile, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tqdm import tqdm
+from .common import CheckExtenralCommand
+from .ffmpeg import GetInfo, ExtractStream, ExtractFrameProps, ExtractArea
+from .audio import DetectSilence
+from .encode import FindVideoBox, StripTS
+from .splitter import Trim
+from .cache import EnableCache
+
+PROBE_BACKENDS = ( 'ffmpeg', 'ffprobe' )
+
+def BenchmarkProbe(paths, repeat=3, quiet=False):
+    results = []
+    for path in tqdm(paths, unit='files', disable=quiet):
+        result = { 'path': str(path) }
+        infos = {}
+        for backend in PROBE_BACKENDS:
+            latencies = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                infos[backend] = GetInfo(path, useCache=False, backend=backend)
+                latencies.append(time.perf_counter() - start)
+            result[backend] = min(latencies)
+        result['identical'] = infos['ffmpeg'] == infos['ffprobe']
+        results.append(result)
+    summary = { 'files': len(results), 'identical': sum(result['identical'] for result in results) }
+    for backend in PROBE_BACKENDS:
+        latencies = [ result[backend] for result in results ]
+        summary[backend] = {
+            'total': sum(latencies),
+            'mean': statistics.mean(latencies) if latencies else 0,
+            'median': statistics.median(latencies) if latencies else 0,
+        }
+    return { 'summary': summary, 'results': results }
+
+# lavfi sources of the synthetic recordings, all MPEG-2 video and AAC audio like broadcasts
+FIXTURES = {
+    'basic': {
+        'video': 'testsrc2=size=1920x1080:rate=30000/1001',
+        'audio': [ 'sine=frequency=1000:sample_rate=48000' ],
+    },
+    'interlaced': {
+        'video': 'testsrc2=size=1920x1080:rate=60000/1001',
+        'filter': 'tinterlace=interleave_top,fieldorder=tff',
+        'args': [ '-flags', '+ildct+ilme', '-top', '1' ],
+        'audio': [ 'sine=frequency=1000:sample_rate=48000' ],
+    },
+    'dual': {
+        'video': 'testsrc2=size=1920x1080:rate=30000/1001',
+        'audio': [ 'sine=frequency=1000:sample_rate=48000', 'sine=frequency=440:sample_rate=48000' ],
+    },
+    'sar': {
+        # 1440x1080 shown as 16:9
+        'video': 'testsrc2=size=1440x1080:rate=30000/1001',
+        'filter': 'setsar=4/3',
+        'audio': [ 'sine=frequency=1000:sample_rate=48000' ],
+    },
+    'sd': {
+        # 720x480 shown as 4:3
+        'video': 'testsrc2=size=720x480:rate=30000/1001',
+        'filter': 'setsar=8/9',
+        'audio': [ 'sine=frequency=1000:sample_rate=48000' ],
+    },
+    'silence': {
+        'video': 'testsrc2=size=1920x1080:rate=30000/1001',
+        'audio': [ "sine=frequency=1000:sample_rate=48000,volume=enable='between(mod(t,10),5,7)':volume=0" ],
+    },
+    'mono': {
+        # a mono track, silent then at half volume in every 6s, beside a stereo one
+        'video': 'testsrc2=size=1920x1080:rate=30000/1001',
+        'audio': [
+            "sine=frequency=1000:sample_rate=48000,volume=enable='between(mod(t,6),2,3)':volume=0,volume=enable='between(mod(t,6),4,5)':volume=0.5",
+            'sine=frequency=440:sample_rate=48000',
+        ],
+        'channels': [ 1, 2 ],
+    },
+    'offset': {
+        # the video starts after the audio, as in most broadcasts
+        'video': 'testsrc2=size=1920x1080:rate=30000/1001',
+        'videoOffset': 0.5,
+        'audio': [ 'sine=frequency=1000:sample_rate=48000' ],
+    },
+    'letterbox': {
+        'video': 'testsrc2=size=1440x810:rate=30000/1001',
+        'filter': 'pad=1920:1080:240:135',
+        'audio': [ 'sine=frequency=1000:sample_rate=48000' ],
+    },
+}
+
+def MakeFixture(name, path, duration):
+    fixture = FIXTURES[name]
+    args = [ CheckExtenralCommand('ffmpeg'), '-hide_banner', '-loglevel', 'error', '-y' ]
+    if 'videoOffset' in fixture:
+        args += [ '-itsoffset', str(fixture['videoOffset']) ]
+    args += [ '-f', 'lavfi', '-t', str(duration), '-i', fixture['video'] ]
+    for audio in fixture['audio']:
+        args += [ '-f', 'lavfi', '-t', str(duration), '-i', audio ]
+    args += [ '-map', '0:v' ] + [ item for i in range(len(fixture['audio'])) for item in ( '-map', f'{i + 1}:a' ) ]
+    if 'filter' in fixture:
+        args += [ '-vf', fixture['filter'] ]
+    args += [ '-c:v', 'mpeg2video', '-b:v', '15M', '-g', '15' ] + fixture.get('args', [])
+    args += [ '-c:a', 'aac', '-b:a', '192k' ]
+    for i, channels in enumerate(fixture.get('channels', [ 2 ] * len(fixture['audio']))):
+        args += [ f'-ac:a:{i}', str(channels) ]
+    # deterministic output, so results compare across machines and commits
+    args += [ '-fflags', '+bitexact', '-flags:v', '+bitexact', '-flags:a', '+bitexact', '-f', 'mpegts', str(path) ]
+    subprocess.run(args, check=True)
+    return path
+
+def MakeFixtures(folder, names=None, duration=30, quiet=False):
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name in tqdm(names or FIXTURES, unit='fixtures', disable=quiet):
+        path = folder / f'{name}_{duration}s.ts'
+        if not path.exists():
+            MakeFixture(name, path.with_suffix('.part'), duration).rename(path)
+        paths[name] = path
+    return paths
+
+def GetSoundTracks(path):
+    return GetInfo(path)['soundTracks']
+
+# the functions timed, each taking the input and a scratch folder
+WORKLOADS = {
+    'GetInfo': lambda path, folder: GetInfo(path, useCache=False),
+    'ExtractStream': lambda path, folder: ExtractStream(path, output=folder / 'streams', quiet=True),
+    'ExtractFrameProps': lambda path, folder: ExtractFrameProps(path, 0, 999999, pipe=True, quiet=True),
+    'ExtractArea': lambda path, folder: ExtractArea(path, (0.8, 0.0, 0.2, 0.2), folder / 'area', 0, 999999, quiet=True),
+    'DetectSilence': lambda path, folder: DetectSilence(path, quiet=True),
+    'DetectSilence[numpy]': lambda path, folder: DetectSilence(path, quiet=True, backend='numpy'),
+    'FindVideoBox': lambda path, folder: FindVideoBox(path, quiet=True),
+    'Trim': lambda path, folder: Trim(path, outputPath=folder / 'trimmed.ts', quiet=True),
+    'StripTS': lambda path, folder: StripTS(path, outputPath=folder / 'stripped.ts', audioLanguages=[ 'jpn' ] * GetSoundTracks(path), quiet=True),
+}
+
+def GetPeakRSS():
+    # peak resident memory in MB of this process and of its largest child (ffmpeg)
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return tuple(resource.getrusage(who).ru_maxrss / scale for who in ( resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN ))
+
+def RunWorkload(name, path):
+    # runs in a fresh process, so the peak RSS belongs to this workload only
+    EnableCache(False)
+    with tempfile.TemporaryDirectory(prefix='tsutils_benchmark_') as folder:
+        start = time.perf_counter()
+        WORKLOADS[name](Path(path), Path(folder))
+        elapsed = time.perf_counter() - start
+    rss, childRss = GetPeakRSS()
+    return { 'elapsed': elapsed, 'rss': rss, 'child_rss': childRss }
+
+def BenchmarkWorkloads(paths, workloads=None, repeat=1, quiet=False):
+    results = []
+    context = multiprocessing.get_context('spawn')
+    jobs = [ ( fixture, path, name ) for fixture, path in paths.items() for name in (workloads or WORKLOADS) ]
+    for fixture, path, name in tqdm(jobs, unit='runs', disable=quiet):
+        duration = GetInfo(path)['duration']
+        runs = []
+        try:
+            for _ in range(repeat):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(RunWorkload, name, str(path)).result())
+        except Exception as e:
+            # e.g. Trim keeps HD services only, so the SD fixture has nothing left
+            results.append({ 'fixture': fixture, 'function': name, 'duration': duration, 'error': f'{type(e).__name__}: {e}' })
+            continue
+        best = min(runs, key=lambda run: run['elapsed'])
+        results.append({
+            'fixture': fixture,
+            'function': name,
+            'duration': duration,
+            'elapsed': best['elapsed'],
+            # seconds of media per second
+            'throughput': duration / best['elapsed'] if best['elapsed'] > 0 else None,
+            'rss': max(run['rss'] or 0 for run in runs),
+            'child_rss': max(run['child_rss'] or 0 for run in runs),
+        })
+    return results
+
+def GetCommit():
+    try:
+        return subprocess.run([ 'git', 'rev-parse', '--short', 'HEAD' ], cwd=Path(__file__).parent, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def CompareReports(baseline, report, tolerance=0.1):
+    # throughput of every (fixture, function) in report against the baseline, slower than tolerance is a regression
+    baselineResults = { ( result['fixture'], result['function'] ): result for result in baseline['results'] }
+    rows = []
+    for result in report['results']:
+        old = baselineResults.get(( result['fixture'], result['function'] ))
+        if old is None or not old.get('throughput') or not result.get('throughput'):
+            continue
+        ratio = result['throughput'] / old['throughput']
+        rows.append({
+            'fixture': result['fixture'],
+            'function': result['function'],
+            'ratio': ratio,
+            'rss_delta': result['rss'] - old['rss'],
+            'regression': ratio < 1 - tolerance,
+        })
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks of tsutils')
+    parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
+    subparsers = parser.add_subparsers(required=True, title='subcommands', dest='command')
+
+    subparser = subparsers.add_parser('probe', help='compare GetInfo latency of the ffmpeg and ffprobe backends')
+    subparser.add_argument('--input', '-i', required=True, help='input video file name (wildchars supported)')
+    subparser.add_argument('--repeat', type=int, default=3, help='probes per file and backend (the fastest is kept)')
+    subparser.add_argument('--output', '-o', help='save results as JSON')
+
+    subparser = subparsers.add_parser('fixtures', help='generate the synthetic MPEG-TS fixtures')
+    subparser.add_argument('--folder', '-f', required=True, help='fixtures folder')
+    subparser.add_argument('--duration', '-d', type=int, default=30, help='length of each fixture (seconds)')
+
+    subparser = subparsers.add_parser('run', help='time the main functions on the synthetic fixtures')
+    subparser.add_argument('--folder', '-f', required=True, help='fixtures folder, missing fixtures are generated')
+    subparser.add_argument('--duration', '-d', type=int, default=30, help='length of each fixture (seconds)')
+    subparser.add_argument('--fixtures', nargs='+', choices=FIXTURES.keys(), help='fixtures to use (default: all)')
+    subparser.add_argument('--functions', nargs='+', choices=WORKLOADS.keys(), help='functions to time (default: all)')
+    subparser.add_argument('--repeat', type=int, default=1, help='runs per function and fixture (the fastest is kept)')
+    subparser.add_argument('--output', '-o', help='save results as JSON')
+    subparser.add_argument('--compare', '-c', help='JSON results of an earlier run to compare with')
+    subparser.add_argument('--tolerance', type=float, default=0.1, help='slowdown reported as a regression')
+
+    args = parser.parse_args()
+
+    if args.command == 'fixtures':
+        for name, path in MakeFixtures(args.folder, duration=args.duration, quiet=args.quiet).items():
+            print(f'{name}: {path}')
+    elif args.command == 'run':
+        paths = MakeFixtures(args.folder, names=args.fixtures, duration=args.duration, quiet=args.quiet)
+        report = {
+            'commit': GetCommit(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': BenchmarkWorkloads(paths, workloads=args.functions, repeat=args.repeat, quiet=args.quiet),
+        }
+        if args.output:
+            with Path(args.output).open('w') as f:
+                json.dump(report, f, indent=2)
+        for result in report['results']:
+            if 'error' in result:
+                print(f'{result["fixture"]:<12}{result["function"]:<22}{result["error"]}')
+                continue
+            print(f'{result["fixture"]:<12}{result["function"]:<22}{result["elapsed"]:8.3f}s {result["throughput"]:8.2f}x {result["rss"]:7.1f}MB {result["child_rss"]:7.1f}MB')
+        if args.compare:
+            with Path(args.compare).open() as f:
+                baseline = json.load(f)
+            rows = CompareReports(baseline, report, tolerance=args.tolerance)
+            for row in rows:
+                mark = ' REGRESSION' if row['regression'] else ''
+                print(f'{row["fixture"]:<12}{row["function"]:<22}{row["ratio"]:6.2f}x {row["rss_delta"]:+7.1f}MB{mark}')
+            if any(row['regression'] for row in rows):
+                sys.exit(1)
+    elif args.command == 'probe':
+        inputPath = Path(args.input)
+        paths = sorted(inputPath.parent.glob(inputPath.name))
+        report = BenchmarkProbe(paths, repeat=args.repeat, quiet=args.quiet)
+        if args.output:
+            with Path(args.output).open('w') as f:
+                json.dump(report, f, indent=2)
+        for result in report['results']:
+            mark = '' if result['identical'] else ' (different info!)'
+            print(f'{Path(result["path"]).name}: ffmpeg {result["ffmpeg"]:.3f}s, ffprobe {result["ffprobe"]:.3f}s{mark}')
+        summary = report['summary']
+        for backend in PROBE_BACKENDS:
+            print(f'{backend}: total {summary[backend]["total"]:.3f}s, mean {summary[backend]["mean"]:.3f}s, median {summary[backend]["median"]:.3f}s')
+        print(f'identical results: {summary["identical"]}/{summary["files"]}')
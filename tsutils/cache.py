@@ -0,0 +1,155 @@
+import os, json, hashlib, functools, inspect, threading, argparse
+from pathlib import Path
+import numpy as np
+from .props import PROPS_DTYPE, PropsToArray, ArrayToProps, SaveProps
+
+# blocks hashed for a fingerprint, spread over the whole file
+FINGERPRINT_BLOCKS = 16
+FINGERPRINT_BLOCK_SIZE = 64 * 1024
+DEFAULT_CACHE_SIZE = 1024
+# part of every key, bump it when the stored format changes
+CACHE_VERSION = 1
+
+cacheEnabled = None
+cacheLock = threading.Lock()
+# bytes under every results folder, scanned once per process and then counted on every save
+cacheTotals = {}
+
+def GetCacheDir():
+    cacheDir = os.environ.get('TSUTILS_CACHE_DIR')
+    return Path(cacheDir) if cacheDir else Path.home() / '.cache' / 'tsutils'
+
+def GetResultsDir():
+    return GetCacheDir() / 'results'
+
+def GetCacheSize():
+    # disk cap in MB
+    return float(os.environ.get('TSUTILS_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+
+def EnableCache(enabled=True):
+    global cacheEnabled
+    cacheEnabled = enabled
+
+def IsCacheEnabled():
+    # opt-in, by EnableCache() or TSUTILS_CACHE=1
+    if cacheEnabled is not None:
+        return cacheEnabled
+    return os.environ.get('TSUTILS_CACHE', '') not in ( '', '0' )
+
+@functools.lru_cache(maxsize=1024)
+def GetFingerprintOf(path, size, mtime):
+    digest = hashlib.sha1(f'{size}|{mtime}'.encode())
+    with open(path, 'rb') as f:
+        for i in range(FINGERPRINT_BLOCKS):
+            f.seek(max(size - FINGERPRINT_BLOCK_SIZE, 0) * i // (FINGERPRINT_BLOCKS - 1))
+            digest.update(f.read(FINGERPRINT_BLOCK_SIZE))
+    return digest.hexdigest()
+
+def GetFingerprint(path):
+    # size, mtime and sampled blocks, so a touched or copied file gets a new fingerprint and misses
+    path = Path(path)
+    stat = path.stat()
+    return GetFingerprintOf(str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+def SaveResult(path, kind, result):
+    if kind == 'props':
+        SaveProps(PropsToArray(result), path)
+    elif kind == 'array':
+        with path.open('wb') as f:
+            np.save(f, result)
+    else:
+        with path.open('w', encoding='utf8') as f:
+            json.dump(result, f, ensure_ascii=False)
+
+def LoadResult(path, kind):
+    if kind == 'props':
+        with np.load(path) as npz:
+            props = np.zeros(len(npz['ptsTime']), dtype=PROPS_DTYPE)
+            for name in PROPS_DTYPE.names:
+                props[name] = npz[name]
+        return ArrayToProps(props)
+    if kind == 'array':
+        return np.load(path)
+    with path.open(encoding='utf8') as f:
+        result = json.load(f)
+    return tuple(result) if kind == 'tuple' else result
+
+def Evict(maxSize=None):
+    # least recently used results go first, a hit touches its file
+    maxSize = (GetCacheSize() if maxSize is None else maxSize) * 1024 * 1024
+    files = [ ( path.stat(), path ) for path in GetResultsDir().glob('*/*') if path.is_file() ]
+    total = sum(stat.st_size for stat, _ in files)
+    for stat, path in sorted(files, key=lambda item: item[0].st_mtime):
+        if total <= maxSize:
+            break
+        path.unlink(missing_ok=True)
+        total -= stat.st_size
+    cacheTotals[GetResultsDir()] = total
+    return total
+
+def CountSaved(size):
+    # the folder is scanned again only over the cap, other processes' results are found then
+    resultsDir = GetResultsDir()
+    if resultsDir not in cacheTotals or cacheTotals[resultsDir] + size > GetCacheSize() * 1024 * 1024:
+        Evict()
+    else:
+        cacheTotals[resultsDir] += size
+
+def ClearCache():
+    for path in GetResultsDir().glob('*/*'):
+        path.unlink(missing_ok=True)
+    cacheTotals.pop(GetResultsDir(), None)
+
+def Cached(kind='json', ignore=( 'quiet', ), version=1):
+    # caches func(path, ...) by the fingerprint of path, the function and its other parameters,
+    # bump version when the function's results change
+    suffix = { 'props': '.npz', 'array': '.npy' }.get(kind, '.json')
+    def Decorator(func):
+        signature = inspect.signature(func)
+        pathName = next(iter(signature.parameters))
+        @functools.wraps(func)
+        def Wrapper(*args, **kwargs):
+            if not IsCacheEnabled():
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = { name: value for name, value in bound.arguments.items() if name != pathName and name not in ignore }
+            path = Path(bound.arguments[pathName])
+            if not path.is_file():
+                # the function raises its own error
+                return func(*args, **kwargs)
+            key = json.dumps([ CACHE_VERSION, GetFingerprint(path), f'{func.__module__}.{func.__qualname__}', version, params ], sort_keys=True, default=str)
+            key = hashlib.sha1(key.encode()).hexdigest()
+            resultPath = GetResultsDir() / key[:2] / (key + suffix)
+            try:
+                result = LoadResult(resultPath, kind)
+                os.utime(resultPath)
+                return result
+            except (OSError, ValueError, KeyError):
+                pass
+            result = func(*args, **kwargs)
+            with cacheLock:
+                try:
+                    resultPath.parent.mkdir(parents=True, exist_ok=True)
+                    tmpPath = resultPath.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp{suffix}')
+                    SaveResult(tmpPath, kind, result)
+                    os.replace(tmpPath, resultPath)
+                    CountSaved(resultPath.stat().st_size)
+                except OSError:
+                    pass
+            return result
+        return Wrapper
+    return Decorator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Manage the cache of analysis results')
+    subparsers = parser.add_subparsers(required=True, title='subcommands', dest='command')
+    subparser = subparsers.add_parser('evict', help='trim the cache to its size cap')
+    subparser.add_argument('--size', type=float, default=None, help='cap in MB (default: $TSUTILS_CACHE_SIZE or 1024)')
+    subparsers.add_parser('clear', help='remove every cached result')
+    args = parser.parse_args()
+
+    if args.command == 'evict':
+        print(f'{Evict(args.size) / 1024 / 1024:.1f}MB in {GetResultsDir()}')
+    elif args.command == 'clear':
+        ClearCache()
@@ -1,21 +1,93 @@
-import sys, subprocess, os
+import sys, subprocess, os, shutil, threading, errno
 
 class TsFileNotFound(FileNotFoundError): ...
 class InvalidTsFormat(RuntimeError): ...
 class ProgramNotFound(RuntimeError): ...
 class EncodingError(RuntimeError): ...
 
+# resolved once per process: { command: { 'path': ..., 'version': ... } }
+externalCommands = {}
+externalCommandsLock = threading.Lock()
+ffmpegCapabilities = None
+
+def FindExternalCommand(command):
+    # the path of command, or None when it isn't installed
+    with externalCommandsLock:
+        if command in externalCommands:
+            return externalCommands[command]['path']
+    path = shutil.which(command)
+    if path is None or not os.path.exists(path):
+        return None
+    with externalCommandsLock:
+        return externalCommands.setdefault(command, { 'path': path })['path']
+
 def CheckExtenralCommand(command):
-    if sys.platform == 'win32':
-        pipeObj = subprocess.Popen(f'cmd /c where {command}', stdout=subprocess.PIPE)
-    else:
-        pipeObj = subprocess.Popen(f'which {command}', stdout=subprocess.PIPE)
-    pipeObj.wait()
-    path = pipeObj.stdout.read().decode().strip('\r\n')
-    if os.path.exists(path):
-        return path
-    else:
+    path = FindExternalCommand(command)
+    if path is None:
         raise ProgramNotFound(f'{command} not found in $PATH!')
+    return path
+
+def GetExternalCommandVersion(command):
+    path = CheckExtenralCommand(command)
+    with externalCommandsLock:
+        if 'version' in externalCommands[command]:
+            return externalCommands[command]['version']
+    # ffmpeg style "<name> version <version> Copyright ..."
+    pipeObj = subprocess.Popen([ path, '-version' ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, errors='ignore')
+    firstLine = pipeObj.stdout.readline()
+    pipeObj.communicate()
+    fields = firstLine.split(' ')
+    version = fields[2] if len(fields) > 2 and fields[1] == 'version' else firstLine.strip()
+    with externalCommandsLock:
+        externalCommands[command]['version'] = version
+    return version
+
+def ListFFmpeg(option):
+    pipeObj = subprocess.Popen([ CheckExtenralCommand('ffmpeg'), '-hide_banner', option ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, errors='ignore')
+    lines, _ = pipeObj.communicate()
+    return lines.splitlines()
+
+def GetFFmpegCapabilities():
+    global ffmpegCapabilities
+    if ffmpegCapabilities is not None:
+        return ffmpegCapabilities
+    encoders, filters, hwaccels = set(), set(), set()
+    # " V....D libx264  libx264 H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10 (codec h264)"
+    for line in ListFFmpeg('-encoders'):
+        fields = line.split()
+        if len(fields) > 1 and len(fields[0]) == 6 and fields[0][0] in 'VAS' and fields[1] != '=':
+            encoders.add(fields[1])
+    # " DEV.LS h264  H.264 / AVC / MPEG-4 AVC / MPEG-4 part 10", so "-c:v hevc" is valid too
+    for line in ListFFmpeg('-codecs'):
+        fields = line.split()
+        if len(fields) > 1 and len(fields[0]) == 6 and fields[0][1] == 'E' and fields[1] != '=':
+            encoders.add(fields[1])
+    # " TSC bwdif  V->V  Deinterlace the input image."
+    for line in ListFFmpeg('-filters'):
+        fields = line.split()
+        if len(fields) > 2 and '->' in fields[2]:
+            filters.add(fields[1])
+    for line in ListFFmpeg('-hwaccels')[1:]:
+        if line.strip():
+            hwaccels.add(line.strip())
+    ffmpegCapabilities = {
+        'version': GetExternalCommandVersion('ffmpeg'),
+        'encoders': encoders,
+        'filters': filters,
+        'hwaccels': hwaccels,
+    }
+    return ffmpegCapabilities
+
+def CheckEncoder(encoder):
+    if encoder not in GetFFmpegCapabilities()['encoders']:
+        raise EncodingError(f'Encoder "{encoder}" is not supported by ffmpeg {GetFFmpegCapabilities()["version"]}!')
+
+def CheckFilters(videoFilter):
+    filters = GetFFmpegCapabilities()['filters']
+    for item in videoFilter.split(','):
+        name = item.split('=')[0].strip()
+        if name not in filters:
+            raise EncodingError(f'Filter "{name}" is not supported by ffmpeg {GetFFmpegCapabilities()["version"]}!')
 
 def FormatTimestamp(timestamp):
     seconds = round(timestamp)
@@ -28,13 +100,58 @@ def FormatTimestamp(timestamp):
 def ClipToFilename(clip):
     return '{:08.3f}-{:08.3f}.ts'.format(float(clip[0]), float(clip[1]))
 
+def CopyRange(srcFile, destFile, start, length, buffer=None):
+    # kernel-side copy where the platform has one, a reused buffer otherwise
+    srcFd, destFd = srcFile.fileno(), destFile.fileno()
+    destFile.flush()
+    for kernelCopy in ( getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None) if sys.platform == 'linux' else None ):
+        if kernelCopy is None or length == 0:
+            continue
+        try:
+            while length > 0:
+                if kernelCopy is os.sendfile:
+                    copied = os.sendfile(destFd, srcFd, start, length)
+                else:
+                    copied = os.copy_file_range(srcFd, destFd, length, start)
+                if copied == 0:
+                    break
+                start += copied
+                length -= copied
+        except OSError as e:
+            if e.errno not in ( errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF ):
+                raise
+        # keep the file object in step with the descriptor
+        destFile.seek(os.lseek(destFd, 0, os.SEEK_CUR))
+    if length > 0:
+        buffer = memoryview(buffer if buffer is not None else bytearray(min(length, 1024 * 1024)))
+        srcFile.seek(start)
+        while length > 0:
+            read = srcFile.readinto(buffer[:min(len(buffer), length)])
+            if not read:
+                break
+            destFile.write(buffer[:read])
+            length -= read
+    return length
+
 def CopyPart(src, dest, start, end, mode='wb', bufsize=1024*1024):
     with open(src, 'rb') as f1:
-        f1.seek(start)
         with open(dest, mode) as f2:
-            length = end - start
-            while length:
-                chunk = min(bufsize,length)
-                data = f1.read(chunk)
-                f2.write(data)
-                length -= chunk
+            CopyRange(f1, f2, start, end - start, buffer=bytearray(min(bufsize, max(end - start, 1))))
+
+def CopyParts(src, dest, ranges, mode='wb', bufsize=1024*1024):
+    # several (start, end) ranges of one source, concatenated into dest
+    buffer = bytearray(bufsize)
+    with open(src, 'rb') as f1:
+        with open(dest, mode) as f2:
+            for start, end in ranges:
+                CopyRange(f1, f2, start, end - start, buffer=buffer)
+    return dest
+
+def SplitParts(src, parts, bufsize=1024*1024):
+    # (dest, start, end) parts of one source, each to its own file
+    buffer = bytearray(bufsize)
+    with open(src, 'rb') as f1:
+        for dest, start, end in parts:
+            with open(dest, 'wb') as f2:
+                CopyRange(f1, f2, start, end - start, buffer=buffer)
+    return [ dest for dest, _, _ in parts ]
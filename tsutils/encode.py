@@ -1,44 +1,81 @@
-import sys, subprocess, shutil, tempfile, argparse
+import sys, subprocess, shutil, argparse, tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import numpy as np
 from tqdm import tqdm
-from PIL import Image
-from .ffmpeg import GetInfo, GetInfoFromLines, ExtractArea, ExtractStream
-from .common import EncodingError
+from .ffmpeg import GetInfo, ExtractAreaFrames, ReadFrames
+from .common import EncodingError, CheckEncoder, CheckFilters
+from .progress import RunFFmpeg
+from .scheduler import JobQueue, RunJobs, GetBudget
+from .index import PTS_CLOCK, LoadIndex, GetStartPts
+from .cache import Cached
 
-def FindVideoBox(path, ss=None, to=None, quiet=False):
+def FindBoxEdges(delta):
+    # scan outwards from the center to the first still pixel on the center row/column
+    width, height = delta.shape
+    centerX, centerY = width // 2, height // 2
+    still = np.flatnonzero(delta[1:centerX + 1, centerY] == 0) + 1
+    x1 = still[-1] + 1 if len(still) else 2
+    still = np.flatnonzero(delta[centerX, 1:centerY + 1] == 0) + 1
+    y1 = still[-1] + 1 if len(still) else 2
+    still = np.flatnonzero(delta[centerX:, centerY] == 0) + centerX
+    x2 = still[0] - 1 if len(still) else width - 2
+    still = np.flatnonzero(delta[centerX, centerY:] == 0) + centerY
+    y2 = still[0] - 1 if len(still) else height - 2
+    return int(y1), int(x1), int(y2 - y1 + 1), int(x2 - x1 + 1)
+
+def ExtractFrameAt(path, ptsTime, info):
+    # seek to the keyframe before ptsTime and decode that frame only
+    args = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-noaccurate_seek', '-ss', str(ptsTime), '-i', str(path),
+        '-frames:v', '1', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'
+    ]
+    pipeObj = subprocess.Popen(args, stdout=subprocess.PIPE)
+    frames = list(ReadFrames(pipeObj.stdout, info['width'], info['height']))
+    pipeObj.wait()
+    return frames[0] if frames else None
+
+def FindVideoBoxBySampling(path, ss, to, samples, workers, quiet=False):
     info = GetInfo(path)
-    if ss is None or to is None:
-        ss, to = 0, info['duration']
-    with tempfile.TemporaryDirectory(prefix='aspect_ratio_') as tmpLogoFolder:
-        ExtractArea(path, (0.0, 0.0, 1.0, 1.0), tmpLogoFolder, ss, to, fps=100 / (to - ss), quiet=quiet)
-        pics = sorted(list(Path(tmpLogoFolder).glob('*.bmp')))
-        delta_0 = np.zeros((info['height'], info['width'], 3))
-        for i in range(len(pics) - 1):
-            image1 = np.array(Image.open(pics[i])).astype(np.float32) / 255.0
-            image2 = np.array(Image.open(pics[i + 1])).astype(np.float32) / 255.0
+    ptsTimes = [ ss + (i + 0.5) * (to - ss) / samples for i in range(samples) ]
+    delta = np.zeros((info['height'], info['width']), dtype=np.uint32)
+    image1 = None
+    pics = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for image2 in tqdm(executor.map(lambda ptsTime: ExtractFrameAt(path, ptsTime, info), ptsTimes), total=samples, disable=quiet, desc='Sampling frames'):
+            if image2 is None:
+                continue
+            if image1 is not None:
+                delta += np.abs(image1.astype(np.int16) - image2).sum(axis=2, dtype=np.uint16)
+            image1 = image2
+            pics += 1
+    # same threshold as the full scan: mean over channels of the average delta > 0.1
+    return (delta > 0.1 * 255 * 3 * (pics - 1)) * 1.0
+
+def FindBoxFromFrames(images, width, height):
+    delta_0 = np.zeros((height, width, 3))
+    image1 = None
+    pics = 0
+    for image in images:
+        image2 = image.astype(np.float32) / 255.0
+        if image1 is not None:
             delta_0 += np.absolute(image1 - image2)
-        delta_0 /= len(pics) - 1
+        image1 = image2
+        pics += 1
+    delta_0 /= pics - 1
     delta = (np.mean(delta_0, axis=2) > 0.1) * 1.0
-    width, height = delta_0.shape[0], delta_0.shape[1]
-    centerX, centerY = width // 2, height // 2
-    for x1 in range(centerX, 0, -1):
-        if delta[x1][centerY] == 0.0:
-            break
-    x1 += 1
-    for y1 in range(centerY, 0, -1):
-        if delta[centerX][y1] == 0.0:
-            break
-    y1 += 1
-    for x2 in range(centerX, width, 1):
-        if delta[x2][centerY] == 0.0:
-            break
-    x2 -= 1
-    for y2 in range(centerY, height, 1):
-        if delta[centerX][y2] == 0.0:
-            break
-    y2 -= 1
-    return y1, x1, y2 - y1 + 1, x2 - x1 + 1
+    return FindBoxEdges(delta)
+
+@Cached('tuple', ignore=( 'quiet', 'workers' ))
+def FindVideoBox(path, ss=None, to=None, quiet=False, samples=None, workers=4):
+    info = GetInfo(path)
+    if ss is None or to is None:
+        ss, to = 0, info['duration']
+    if samples:
+        return FindBoxEdges(FindVideoBoxBySampling(path, ss, to, samples, workers, quiet=quiet))
+    frames = ExtractAreaFrames(path, (0.0, 0.0, 1.0, 1.0), ss, to, fps=100 / (to - ss))
+    return FindBoxFromFrames((image for _, image in tqdm(frames, total=100, disable=quiet, desc='Extracting area')), info['width'], info['height'])
 
 presets = {
     'drama': {
@@ -84,7 +121,7 @@ def CheckEncodingOutput(inputInfo, outputPath):
     if round(inputInfo['duration'] / outputInfo['duration'] * 100) != 100:
         raise EncodingError(f'Output file "{outputPath}" has incorrect duration ({inputInfo["duration"]} vs {outputInfo["duration"]})!')
 
-def StripTS(videoPath, outputPath=None, audioLanguages=None, fixAudio=False, nomap=False, quiet=False):
+def StripTS(videoPath, outputPath=None, audioLanguages=None, fixAudio=False, nomap=False, quiet=False, callbacks=None, threads=None):
     videoPath = Path(videoPath)
     outputPath = Path(outputPath) if outputPath else videoPath.with_name(videoPath.name.replace('.ts', '_stripped.ts'))
     if outputPath.exists() and videoPath.stat().st_mtime == outputPath.stat().st_mtime:
@@ -110,27 +147,16 @@ def StripTS(videoPath, outputPath=None, audioLanguages=None, fixAudio=False, nom
         args += [ '-map', '0:v', '-map', '0:a', '-ignore_unknown' ]
         for i in range(soundTracks):
             args += [ f'-metadata:s:a:{i}', f'language={audioLanguages[i]}' ]
+    if threads:
+        args += [ '-threads', str(threads) ]
     args += [ str(outputPath) ]
-    pipeObj = subprocess.Popen(args, stderr=subprocess.PIPE, universal_newlines='\r', errors='ignore')
-    output = []
-    with tqdm(total=duration, unit='secs', disable=quiet) as pbar:
-        pbar.set_description('StripTS')
-        for line in pipeObj.stderr:
-            if 'Conversion failed!' in line:
-                raise EncodingError(f'Failed in encoding "{videoPath}"!')
-            output.append(line)
-            if 'time=' in line:
-                for item in line.split(' '):
-                    if item.startswith('time='):
-                        timeFields = item.replace('time=', '').split(':')
-                        time = float(timeFields[0]) * 3600 + float(timeFields[1]) * 60  + float(timeFields[2])
-                        pbar.update(time - pbar.n)
-        pbar.update(duration - pbar.n)
-    pipeObj.wait()
+    _, output = RunFFmpeg(args, duration, 'StripTS', quiet=quiet, callbacks=callbacks)
+    if any('Conversion failed!' in line for line in output):
+        raise EncodingError(f'Failed in encoding "{videoPath}"!')
     shutil.copystat(videoPath, outputPath)
     return outputPath
 
-def StripAndRepackTS(videoPath, outputPath=None, audioLanguages=None, quiet=False):
+def StripAndRepackTS(videoPath, outputPath=None, audioLanguages=None, quiet=False, callbacks=None, threads=None):
     videoPath = Path(videoPath)
     outputPath = Path(outputPath) if outputPath else videoPath.with_name(videoPath.name.replace('.ts', '_stripped.ts'))
     if outputPath.exists() and videoPath.stat().st_mtime == outputPath.stat().st_mtime:
@@ -142,59 +168,37 @@ def StripAndRepackTS(videoPath, outputPath=None, audioLanguages=None, quiet=Fals
     soundTracks = info['soundTracks']
     audioLanguages = GetAudioLanguagesByName(videoPath.name) if audioLanguages is None else audioLanguages
 
-    streamsFolder = ExtractStream(path=videoPath, toWav=True)
-
-    args = [ 'ffmpeg', '-hide_banner', '-y' ]
+    # one input keeps the audio's offset to the video as in the source, the old video and WAV files both started at 0
+    # and the -ss 0 of their extraction dropped audio before the first keyframe
+    args = [ 'ffmpeg', '-hide_banner', '-y', '-i', str(videoPath) ]
     # video stream
-    args += [ '-i', streamsFolder / 'video_0.ts' ]
-    # audio streams
+    args += [ '-map', '0:v:0' ]
+    # audio streams, resynced and quantized to 16 bits like the WAV files were, without writing PCM to disk
+    # (the aac encoder takes fltp only, so s16 is converted back and this is about parity, not speed)
     for i in range(soundTracks):
-        args += [ '-i', streamsFolder / f'audio_{i}.wav' ]
-    # maps
-    for i in range(soundTracks + 1):
-        args += [ '-map', f'{i}' ]
+        args += [ '-map', f'0:a:{i}', f'-filter:a:{i}', 'aresample=async=1,aformat=sample_fmts=s16' ]
     # language tags
     for i in range(soundTracks):
         args += [ f'-metadata:s:a:{i}', f'language={audioLanguages[i]}' ]
     # encoders
     args += [ '-c:v', 'copy', '-c:a', 'aac' ]
+    if threads:
+        args += [ '-threads', str(threads) ]
     # output path
-    args += [ outputPath ]
+    args += [ str(outputPath) ]
 
-    pipeObj = subprocess.Popen(args, stderr=subprocess.PIPE, universal_newlines='\r', errors='ignore')
-    output = []
-    with tqdm(total=duration, unit='secs', disable=quiet) as pbar:
-        pbar.set_description('StripTS2')
-        for line in pipeObj.stderr:
-            if 'Conversion failed!' in line:
-                raise EncodingError(f'Failed in encoding "{videoPath}"!')
-            output.append(line)
-            if 'time=' in line:
-                for item in line.split(' '):
-                    if item.startswith('time='):
-                        timeFields = item.replace('time=', '').split(':')
-                        time = float(timeFields[0]) * 3600 + float(timeFields[1]) * 60  + float(timeFields[2])
-                        pbar.update(time - pbar.n)
-        pbar.update(duration - pbar.n)
-    pipeObj.wait()
-    shutil.rmtree(streamsFolder)
+    _, output = RunFFmpeg(args, duration, 'StripTS2', quiet=quiet, callbacks=callbacks)
+    if any('Conversion failed!' in line for line in output):
+        raise EncodingError(f'Failed in encoding "{videoPath}"!')
     shutil.copystat(videoPath, outputPath)
     return outputPath
 
-def EncodeTS(videoPath, preset, cropdetect, encoder, crf, outputPath=None, notag=False, quiet=False):
-    videoPath = Path(videoPath)
-    if outputPath is None:
-        outputPath = videoPath.with_suffix('.mp4') if notag else videoPath.with_suffix(f'.{preset}_{encoder}_crf{crf}.mp4')
-    outputPath = Path(outputPath)
-    if outputPath.exists() and videoPath.stat().st_mtime == outputPath.stat().st_mtime:
-        print(f'Skipping encoding {videoPath.name}', file=sys.stderr)
-        return outputPath
-    preset = presets[preset]
+def GetVideoFilter(videoPath, preset, cropdetect, quiet=False, cropSamples=None):
     videoFilter = preset['videoFilter']
     if cropdetect:
         info = GetInfo(videoPath)
         sar = info['sar']
-        x, y, w, h = FindVideoBox(videoPath)
+        x, y, w, h = FindVideoBox(videoPath, samples=cropSamples, quiet=quiet)
         for dar in ((16, 9), (4, 3), (1,1), (999, 999)):
             if 0.95 < w * sar[0] / (h * sar[1]) / (dar[0] / dar[1]) < 1.05:
                 break
@@ -216,12 +220,93 @@ def EncodeTS(videoPath, preset, cropdetect, encoder, crf, outputPath=None, notag
             print(f'cropping using: "{cropStr}"', file=sys.stderr)
         else:
             print('No need to crop.', file=sys.stderr)
+    return videoFilter
+
+def GetVideoCodec(preset, encoder, crf):
     if '_nvenc' in encoder:
         videoCodec = [ '-c:v', encoder, '-rc:v', 'vbr_hq', '-cq:v', str(crf), '-b:v', preset['bitrate'], '-maxrate:v', preset['maxRate'], '-profile:v', 'high' ]
     elif '_videotoolbox' in encoder:
         videoCodec = [ '-c:v', encoder, '-b:v', preset['bitrate'], '-maxrate:v',  preset['maxRate'] ]
     else:
         videoCodec = [ '-c:v', encoder, '-crf', str(crf) ]
+    return videoCodec
+
+# seconds decoded ahead of a chunk, so pullup and fps see the same fields as in one run
+CHUNK_PREROLL = 3.0
+
+def GetChunks(index, chunkSeconds):
+    # (ss, to) of chunks starting at the first keyframe after every chunkSeconds, to is None for the last one
+    keyTimes = np.unique(index['pts'][index['isKey'] != 0]) / PTS_CLOCK
+    starts = [ 0.0 ]
+    for keyTime in keyTimes:
+        if keyTime >= starts[-1] + chunkSeconds:
+            starts.append(float(keyTime))
+    return list(zip(starts, starts[1:] + [ None ]))
+
+def EncodeChunks(videoPath, videoFilter, videoCodec, outputPath, chunkSeconds, workers=None, quiet=False, callbacks=None, threads=None):
+    # encodes keyframe aligned chunks in parallel, then joins them with the audio without re-encoding
+    info = GetInfo(videoPath)
+    chunks = GetChunks(LoadIndex(videoPath, quiet=quiet), chunkSeconds)
+    # with -copyts the filters see the original timestamps, so the fps grid and the trims line up across chunks
+    origin = GetStartPts(videoPath) / PTS_CLOCK
+    # threads, when given, is per chunk
+    workers, budgetThreads = GetBudget(jobs=workers)
+    threads = threads or budgetThreads
+    with tempfile.TemporaryDirectory(dir=outputPath.parent) as tempDir:
+        chunkPaths = [ Path(tempDir) / f'chunk_{i:04}{outputPath.suffix}' for i in range(len(chunks)) ]
+        def EncodeChunk(i):
+            ss, to = chunks[i]
+            trim = f'trim=start={origin + ss:.6f}' + (f':end={origin + to:.6f}' if to is not None else '')
+            args = [
+                'ffmpeg', '-hide_banner', '-y',
+                '-copyts', '-noaccurate_seek', '-ss', str(max(ss - CHUNK_PREROLL, 0)),
+                '-i', str(videoPath),
+                '-vf', f'{videoFilter},{trim},setpts=PTS-STARTPTS',
+            ] + videoCodec + [
+                '-map', '0:v:0', '-an', '-threads', str(threads),
+                str(chunkPaths[i])
+            ]
+            _, output = RunFFmpeg(args, (to if to is not None else info['duration']) - ss, f'Chunk {i}', quiet=True, callbacks=callbacks)
+            if any('Conversion failed!' in line for line in output) or not chunkPaths[i].exists():
+                raise EncodingError(f'Failed in encoding "{videoPath}" from {ss}s!')
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [ executor.submit(EncodeChunk, i) for i in range(len(chunks)) ]
+            for future in tqdm(as_completed(futures), total=len(futures), unit='chunks', disable=quiet, desc='Encoding'):
+                future.result()
+        listPath = Path(tempDir) / 'chunks.txt'
+        listPath.write_text(''.join(f"file '{path.name}'\n" for path in chunkPaths), encoding='utf8')
+        # audio keeps its original timestamps, shifted so the first video frame is at 0
+        args = [
+            'ffmpeg', '-hide_banner', '-y', '-copyts',
+            '-f', 'concat', '-safe', '0', '-i', str(listPath),
+            '-itsoffset', str(-origin), '-i', str(videoPath),
+            '-c', 'copy', '-bsf:a', 'aac_adtstoasc',
+            '-map', '0:v', '-map', '1:a', '-ignore_unknown',
+            str(outputPath)
+        ]
+        _, output = RunFFmpeg(args, info['duration'], 'Joining', quiet=quiet, callbacks=callbacks)
+    if any('Conversion failed!' in line for line in output):
+        raise EncodingError(f'Failed in encoding "{videoPath}"!')
+    shutil.copystat(videoPath, outputPath)
+    CheckEncodingOutput(info, outputPath)
+    return outputPath
+
+def EncodeTS(videoPath, preset, cropdetect, encoder, crf, outputPath=None, notag=False, quiet=False, callbacks=None, cropSamples=None, threads=None, chunkSeconds=None, workers=None):
+    videoPath = Path(videoPath)
+    if outputPath is None:
+        outputPath = videoPath.with_suffix('.mp4') if notag else videoPath.with_suffix(f'.{preset}_{encoder}_crf{crf}.mp4')
+    outputPath = Path(outputPath)
+    if outputPath.exists() and videoPath.stat().st_mtime == outputPath.stat().st_mtime:
+        print(f'Skipping encoding {videoPath.name}', file=sys.stderr)
+        return outputPath
+    preset = presets[preset]
+    # fail before cropdetect and the encoding itself
+    CheckEncoder(encoder)
+    CheckFilters(preset['videoFilter'])
+    videoFilter = GetVideoFilter(videoPath, preset, cropdetect, quiet=quiet, cropSamples=cropSamples)
+    videoCodec = GetVideoCodec(preset, encoder, crf)
+    if chunkSeconds:
+        return EncodeChunks(videoPath, videoFilter, videoCodec, outputPath, chunkSeconds, workers=workers, quiet=quiet, callbacks=callbacks, threads=threads)
     args = [
         'ffmpeg', '-hide_banner', '-y',
         '-i', str(videoPath),
@@ -232,24 +317,13 @@ def EncodeTS(videoPath, preset, cropdetect, encoder, crf, outputPath=None, notag
         # TODO: support opt-in encoding audio
         '-c:a', 'copy', '-bsf:a', 'aac_adtstoasc',
         '-map', '0:v', '-map', '0:a', '-ignore_unknown',
+    ] + ([ '-threads', str(threads) ] if threads else []) + [
         str(outputPath)
     ]
-    pipeObj = subprocess.Popen(args, stderr=subprocess.PIPE, universal_newlines='\r', errors='ignore')
-    info = GetInfoFromLines(pipeObj.stderr)
-    duration = info['duration']
-    with tqdm(total=duration, unit='secs', disable=quiet) as pbar:
-        pbar.set_description('Encoding')
-        for line in pipeObj.stderr:
-            if 'Conversion failed!' in line:
-                raise EncodingError(f'Failed in encoding "{videoPath}"!')
-            if 'time=' in line:
-                for item in line.split(' '):
-                    if item.startswith('time='):
-                        timeFields = item.replace('time=', '').split(':')
-                        time = float(timeFields[0]) * 3600 + float(timeFields[1]) * 60  + float(timeFields[2])
-                        pbar.update(time - pbar.n)
-        pbar.update(duration - pbar.n)
-    pipeObj.wait()
+    info = GetInfo(videoPath)
+    _, output = RunFFmpeg(args, info['duration'], 'Encoding', quiet=quiet, callbacks=callbacks)
+    if any('Conversion failed!' in line for line in output):
+        raise EncodingError(f'Failed in encoding "{videoPath}"!')
     shutil.copystat(videoPath, outputPath)
     CheckEncodingOutput(info, outputPath)
     return outputPath
@@ -269,23 +343,33 @@ if __name__ == "__main__":
     subparser.add_argument('--input', '-i', required=True, help='input video file name (wildchars supported)')
     subparser.add_argument('--preset', '-p', required=True, help='preset for the video')
     subparser.add_argument('--cropdetect', '-c', action='store_true', help='detect and crop still area')
+    subparser.add_argument('--cropsamples', type=int, default=None, help='detect the crop area from N seeked frames instead of a full decode')
     subparser.add_argument('--encoder', default='hevc', help='video encoder name')
     subparser.add_argument('--crf', default=22, help='CRF value for the video encoder')
     subparser.add_argument('--notag', action='store_true', help="don't add tag to output filename")
     subparser.add_argument('--output', '-o', help='output video file name')
+    subparser.add_argument('--chunks', type=float, default=None, help='encode chunks of about N seconds in parallel and join them')
+    subparser.add_argument('--workers', type=int, default=None, help='chunks encoded at the same time')
+
+    for subparser in subparsers.choices.values():
+        subparser.add_argument('--jobs', '-j', type=int, default=1, help='files processed at the same time')
+        subparser.add_argument('--cores', type=int, default=None, help='CPU cores shared by the jobs (default: all)')
+        subparser.add_argument('--memory', type=float, default=None, help='RAM in GB shared by the jobs (default: all)')
+        subparser.add_argument('--queue', help='queue file (.json) to resume an interrupted batch')
 
     args = parser.parse_args()
 
-    videoPath = Path(args.input)
-    for path in videoPath.parent.glob(videoPath.name):
-        if args.command == 'strip':
+    def Worker(job, threads):
+        path = Path(job['input'])
+        # progress bars of concurrent jobs would overwrite each other
+        quiet = args.quiet or args.jobs > 1
+        if job['command'] == 'strip':
             print(f'Striping {path} ...')
             if args.repack:
-                outputPath = StripAndRepackTS(videoPath=path, outputPath=args.output, audioLanguages=args.languages, quiet=args.quiet)
+                outputPath = StripAndRepackTS(videoPath=path, outputPath=args.output, audioLanguages=args.languages, quiet=quiet, threads=threads)
             else:
-                outputPath = StripTS(videoPath=path, outputPath=args.output, audioLanguages=args.languages, quiet=args.quiet)
-            pass
-        elif args.command == 'encode':
+                outputPath = StripTS(videoPath=path, outputPath=args.output, audioLanguages=args.languages, quiet=quiet, threads=threads)
+        elif job['command'] == 'encode':
             print(f'Encoding {path} ...')
             outputPath = EncodeTS(
                 videoPath=path,
@@ -295,5 +379,19 @@ if __name__ == "__main__":
                 crf=args.crf,
                 outputPath=args.output,
                 notag=args.notag,
-                quiet=args.quiet)
-        print('Compress rate: {}%'.format(round(outputPath.stat().st_size / path.stat().st_size * 100, 2)))
\ No newline at end of file
+                quiet=quiet,
+                cropSamples=args.cropsamples,
+                threads=threads,
+                chunkSeconds=args.chunks,
+                workers=args.workers)
+        print('Compress rate: {}%'.format(round(outputPath.stat().st_size / path.stat().st_size * 100, 2)))
+        return outputPath
+
+    options = { k: v for k, v in vars(args).items() if k not in ( 'input', 'quiet', 'command', 'jobs', 'cores', 'memory', 'queue' ) }
+    queue = JobQueue(args.queue)
+    videoPath = Path(args.input)
+    keys = [ queue.Add(path, args.command, options) for path in sorted(videoPath.parent.glob(videoPath.name)) ]
+    result = RunJobs(queue, Worker, keys=keys, jobs=args.jobs, cores=args.cores, memory=args.memory, quiet=args.quiet)
+    print(f'{result["jobs"]} jobs, {round(result["media_time"])}s of media in {round(result["elapsed"])}s ({result["throughput"] or 0:.2f}x)')
+    if result['failed']:
+        sys.exit(1)
@@ -1,28 +1,84 @@
-import os, subprocess, json, unicodedata, time, argparse, re
+import os, subprocess, json, unicodedata, time, argparse, re, functools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+import numpy as np
 import yaml
-from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand
+from tqdm import tqdm
+from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand, FindExternalCommand
+from .ts import EIT_PIDS, SectionReader, GetPids, GetMainService, ReadPackets
+from .arib import ParseEIT, EventStore
+from .cache import Cached
 
-def Dump(videoPath, quiet=False):
-    if os.name == 'nt':
-        CheckExtenralCommand('mirakurun-epgdump.cmd')
-    else:
-        CheckExtenralCommand('mirakurun-epgdump')
-    with (Path(__file__).parent / 'channels.yml').open() as f:        
-        channels = yaml.load(f, Loader=yaml.FullLoader)
+@functools.lru_cache(maxsize=None)
+def GetChannels():
+    # serviceId -> channel, channels.yml is parsed once per process
+    with (Path(__file__).parent / 'channels.yml').open(encoding='utf8') as f:
+        channels = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    channelIndex = {}
+    for item in channels:
+        if 'serviceId' in item:
+            channelIndex.setdefault(item['serviceId'], item)
+    return channelIndex
+
+def IsProgramOf(name, videoName):
+    name = unicodedata.normalize('NFKC', name)
+    name = name.replace(chr(8217), "'")
+    return name in videoName or re.sub(r"\[.*?\]", "", name) in videoName
+
+@Cached()
+def ReadPrograms(videoPath, videoName=None, quiet=False):
+    # EIT events of the recorded service, with videoName only those up to the first complete one named like it
     videoPath = Path(videoPath)
     if not videoPath.is_file():
         raise TsFileNotFound(f'"{videoPath.name}" not found!')
+    mainService = GetMainService(videoPath)
+    serviceId = mainService[1]['programNumber'] if mainService is not None else None
+    store = EventStore()
+    readers = { pid: SectionReader() for pid in EIT_PIDS }
+    parsedSections = set()
+    for _, packets in ReadPackets(videoPath, 'Reading EIT', quiet=quiet):
+        pids = GetPids(packets)
+        for i in np.flatnonzero(np.isin(pids, EIT_PIDS)):
+            for section in readers[int(pids[i])].Feed(packets[i].tobytes()):
+                if not 0x4E <= section[0] <= 0x6F:
+                    continue
+                # table, service, version, section number, transport stream and network fix the content
+                sectionKey = ( section[0], section[3:5], section[5] >> 1 & 0x1F, section[6], section[8:12] )
+                if sectionKey in parsedSections:
+                    continue
+                parsedSections.add(sectionKey)
+                for event in ParseEIT(section):
+                    if serviceId is not None and event['serviceId'] != serviceId:
+                        continue
+                    key = store.Add(event)
+                    if videoName is not None and store.IsComplete(key) and IsProgramOf(store.GetProgram(key)['name'], videoName):
+                        return store.GetPrograms()
+    return store.GetPrograms()
+
+def Dump(videoPath, quiet=False, native=None):
+    command = 'mirakurun-epgdump.cmd' if os.name == 'nt' else 'mirakurun-epgdump'
+    if native is None:
+        native = FindExternalCommand(command) is None
+    if not native:
+        CheckExtenralCommand(command)
     videoPath = Path(videoPath)
+    if not videoPath.is_file():
+        raise TsFileNotFound(f'"{videoPath.name}" not found!')
     epgPath = videoPath.with_suffix('.epg')
     txtPath = videoPath.with_suffix('.txt')
-    if not epgPath.exists():
+    videoName = unicodedata.normalize('NFKC', videoPath.stem)
+    if not epgPath.exists() and native:
+        # every event like mirakurun-epgdump writes, the .epg is read by other tools too
+        programs = ReadPrograms(videoPath, quiet=quiet)
+        with epgPath.open('w') as f:
+            json.dump(programs, f)
+    elif not epgPath.exists():
         if os.name == 'nt':
             pipeObj = subprocess.Popen(f'mirakurun-epgdump.cmd "{videoPath}" "{epgPath}"')
         else:
             pipeObj = subprocess.Popen(['mirakurun-epgdump', videoPath, epgPath])
         pipeObj.wait()
-    else:
+    elif not quiet:
         print(f'skipping {str(videoPath)} ...')
     info = {}
     with epgPath.open() as f:
@@ -30,10 +86,7 @@ def Dump(videoPath, quiet=False):
         for item in epg:
             name = item.get('name')
             if name:
-                name = unicodedata.normalize('NFKC', name)
-                name = name.replace(chr(8217), "'")
-                videoName = unicodedata.normalize('NFKC', videoPath.stem)
-                if name in videoName or re.sub(r"\[.*?\]", "", name) in videoName:
+                if IsProgramOf(name, videoName):
                     for k in item:
                         info[k] = item[k]
     if info == {}:
@@ -48,18 +101,59 @@ def Dump(videoPath, quiet=False):
                 print(k, file=f)
                 print(info['extended'][k], file=f)
         print('', file=f)
-        for item in channels:
-            if item.get('serviceId') == info['serviceId']:
-                print(f'{item["name"]}', file=f)
-                break
+        channel = GetChannels().get(info['serviceId'])
+        if channel is not None:
+            print(f'{channel["name"]}', file=f)
         print(f'serviceId: {info["serviceId"]}', file=f)
-        print(f"{time.strftime('%Y-%m-%d %H:%M (%a)', time.localtime(info['startAt'] / 1000))} ~ {round(info['duration'] / 1000 / 60)} mins", file=f)
+        # the duration of an EIT event may be undetermined
+        mins = f" {round(info['duration'] / 1000 / 60)} mins" if info.get('duration') is not None else ''
+        print(f"{time.strftime('%Y-%m-%d %H:%M (%a)', time.localtime(info['startAt'] / 1000))} ~{mins}", file=f)
     return epgPath, txtPath
 
+def DumpFile(videoPath, native=None):
+    startTime = time.perf_counter()
+    result = { 'path': str(videoPath) }
+    try:
+        epgPath, txtPath = Dump(videoPath, quiet=True, native=native)
+        result.update({ 'epg': str(epgPath), 'txt': str(txtPath), 'error': None })
+    except Exception as e:
+        result.update({ 'epg': None, 'txt': None, 'error': f'{type(e).__name__}: {e}' })
+    result['elapsed'] = time.perf_counter() - startTime
+    return result
+
+def DumpBatch(paths, workers=None, native=None, quiet=False):
+    # one result per recording, failures are reported instead of raised
+    paths = [ Path(path) for path in paths ]
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = { executor.submit(DumpFile, path, native): path for path in paths }
+        with tqdm(total=len(futures), unit='files', disable=quiet) as pbar:
+            pbar.set_description('Dumping EPG')
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                pbar.update(1)
+    return [ results[path] for path in paths ]
+
+def GetInputPaths(inputPath):
+    inputPath = Path(inputPath)
+    if inputPath.is_dir():
+        return sorted(inputPath.glob('*.ts'))
+    return sorted(inputPath.parent.glob(inputPath.name))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Dump EPG from TS files')
     parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
-    parser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    parser.add_argument('--input', '-i', required=True, help='input mpegts path, folder or wildchars')
+    parser.add_argument('--native', action='store_true', default=None, help='decode EIT without mirakurun-epgdump')
+    parser.add_argument('--workers', '-w', type=int, help='parallel workers for several files')
     args = parser.parse_args()
 
-    Dump(args.input, args.quiet)
+    if Path(args.input).is_file():
+        Dump(args.input, args.quiet, native=args.native)
+    else:
+        results = DumpBatch(GetInputPaths(args.input), workers=args.workers, native=args.native, quiet=args.quiet)
+        for result in results:
+            status = f'failed ({result["error"]})' if result['error'] else 'done'
+            print(f'{Path(result["path"]).name}: {status} in {result["elapsed"]:.2f}s')
+        failures = sum(1 for result in results if result['error'])
+        print(f'{len(results) - failures}/{len(results)} succeeded, {sum(result["elapsed"] for result in results):.2f}s in total')
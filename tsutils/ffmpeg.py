@@ -1,11 +1,16 @@
-import re, subprocess, tempfile, argparse, shutil, json, pprint
+import re, subprocess, tempfile, argparse, shutil, json, pprint, threading, io, os, math, queue, hashlib
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
 from pathlib import Path
 from tqdm import tqdm
 import numpy as np
 from PIL import Image
-from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand
+from .common import TsFileNotFound, InvalidTsFormat, EncodingError, CheckExtenralCommand
+from .props import SaveProps
+from .cache import Cached, GetCacheDir, IsCacheEnabled
+from .progress import RunFFmpeg
 
-def GetInfoFromLines(lines, suffix=None):
+def GetInfoFromLines(lines, suffix=None, minSoundTracks=1):
     duration = 0
     if suffix == '.mp4':
         pid = 0
@@ -41,7 +46,7 @@ def GetInfoFromLines(lines, suffix=None):
         if 'Press [q] to stop' in line or ' time=' in line:
             break
     for pid in programs:
-        if programs[pid]['soundTracks'] > 0:
+        if programs[pid]['soundTracks'] >= minSoundTracks:
             return {
                 'duration': duration, 
                 'width': programs[pid]['width'],
@@ -53,11 +58,43 @@ def GetInfoFromLines(lines, suffix=None):
                 }
     return None
 
-def GetInfo(path):
+def GetInfoFromProbe(probe):
+    duration = round(float(probe.get('format', {}).get('duration', 0)), 2)
+    # .mp4 and other single program files have no program list
+    programs = probe.get('programs') or [ { 'streams': probe.get('streams', []) } ]
+    for program in programs:
+        video = None
+        soundTracks = 0
+        for stream in program.get('streams', []):
+            if stream.get('codec_type') == 'video' and video is None and stream.get('width') and stream.get('height'):
+                video = stream
+            elif stream.get('codec_type') == 'audio' and int(stream.get('sample_rate', 0)) > 0:
+                soundTracks += 1
+        if video is not None and soundTracks > 0:
+            frameRate = video.get('avg_frame_rate', '0/0')
+            if frameRate.endswith('/0') or frameRate.startswith('0/'):
+                frameRate = video.get('r_frame_rate', '0/1')
+            sar = video.get('sample_aspect_ratio', '1:1')
+            sar = (1, 1) if sar in ('0:1', 'N/A') else tuple(int(i) for i in sar.split(':'))
+            dar = video.get('display_aspect_ratio')
+            if dar is None or dar in ('0:1', 'N/A'):
+                dar = Fraction(video['width'] * sar[0], video['height'] * sar[1])
+                dar = dar.numerator, dar.denominator
+            else:
+                dar = tuple(int(i) for i in dar.split(':'))
+            return {
+                'duration': duration,
+                'width': video['width'],
+                'height': video['height'],
+                'fps': round(float(Fraction(frameRate)), 2),
+                'sar': sar,
+                'dar': dar,
+                'soundTracks': soundTracks
+                }
+    return None
+
+def ProbeWithFFmpeg(path):
     CheckExtenralCommand('ffmpeg')
-    path = Path(path)
-    if not path.is_file():
-        raise TsFileNotFound(f'"{path.name}" not found!')
     pipeObj = subprocess.Popen(
         [
             'ffmpeg', '-hide_banner',
@@ -73,11 +110,148 @@ def GetInfo(path):
     except IndexError:
         raise InvalidTsFormat(f'"{path.name}" is invalid!')
     pipeObj.wait()
+    return info
+
+CHANNEL_LAYOUTS = { 'mono': 1, 'stereo': 2, 'downmix': 2, 'quad': 4, 'hexagonal': 6, 'octagonal': 8 }
+
+def GetChannelsFromLayout(layout):
+    # "stereo", "5.1(side)", "3 channels", ... or None when unknown
+    layout = layout.strip().split('(')[0]
+    if layout in CHANNEL_LAYOUTS:
+        return CHANNEL_LAYOUTS[layout]
+    match = re.fullmatch(r'(\d+) channels', layout) or re.fullmatch(r'(\d+)\.(\d+)', layout)
+    return sum(int(i) for i in match.groups()) if match else None
+
+def GetAudioChannels(path):
+    # channels of every audio stream, in the order of the 0:a:N specifiers
+    CheckExtenralCommand('ffmpeg')
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    pipeObj = subprocess.run([ 'ffmpeg', '-hide_banner', '-i', path ], stderr=subprocess.PIPE, universal_newlines=True, errors='ignore')
+    return GetAudioChannelsFromLines(pipeObj.stderr.splitlines())
+
+def GetAudioChannelsFromLines(lines):
+    streams = {}
+    for line in lines:
+        # streams are listed once per program
+        match = re.search(r'Stream #\d+:(\d+)\S*: Audio: .*?, \d+ Hz, ([^,]+)', line)
+        if match:
+            streams[int(match.group(1))] = GetChannelsFromLayout(match.group(2))
+    return [ streams[index] for index in sorted(streams) ]
+
+PROBE_SIZE = 5 * 1024 * 1024
+PROBE_DURATION = 5
+PROBE_STREAM_ENTRIES = 'index,codec_type,width,height,avg_frame_rate,r_frame_rate,sample_aspect_ratio,display_aspect_ratio,sample_rate'
+
+def ProbeWithFFprobe(path, probeSize=PROBE_SIZE, probeDuration=PROBE_DURATION):
+    CheckExtenralCommand('ffprobe')
+    # stream parameters come from the first probeSize bytes / probeDuration seconds only,
+    # no packets or frames are read beyond that
+    pipeObj = subprocess.Popen(
+        [
+            'ffprobe', '-v', 'error', '-hide_banner',
+            '-probesize', str(probeSize),
+            '-analyzeduration', str(int(probeDuration * 1000000)),
+            '-print_format', 'json',
+            '-show_entries', f'format=duration:program=program_id:program_stream={PROBE_STREAM_ENTRIES}:stream={PROBE_STREAM_ENTRIES}',
+            path
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+    output, _ = pipeObj.communicate()
+    try:
+        return GetInfoFromProbe(json.loads(output))
+    except (ValueError, KeyError):
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+
+INFO_CACHE_SIZE = 1024
+# entries under every info folder, scanned once per process and then counted on every save
+infoCacheCounts = {}
+infoCacheLock = threading.Lock()
+
+def GetInfoCacheDir():
+    return GetCacheDir() / 'info'
+
+def GetInfoCachePath(path):
+    # one file per recording, so processes never overwrite each other's entries
+    digest = hashlib.sha1(str(path.resolve()).encode()).hexdigest()
+    return GetInfoCacheDir() / digest[:2] / f'{digest}.json'
+
+def GetInfoCacheKey(path):
+    stat = path.stat()
+    return f'{stat.st_size}|{stat.st_mtime_ns}|{stat.st_ino}'
+
+def LoadInfoCache(path, key):
+    cachePath = GetInfoCachePath(path)
+    try:
+        with cachePath.open(encoding='utf-8') as f:
+            cachedKey, info = json.load(f)
+        # the recording changed since
+        if cachedKey != key:
+            return None
+        info['sar'], info['dar'] = tuple(info['sar']), tuple(info['dar'])
+        # least recently used entries go first
+        os.utime(cachePath)
+        return info
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def EvictInfoCache(maxCount=INFO_CACHE_SIZE):
+    paths = sorted(GetInfoCacheDir().glob('*/*.json'), key=lambda path: path.stat().st_mtime)
+    for path in paths[:max(len(paths) - maxCount, 0)]:
+        path.unlink(missing_ok=True)
+    infoCacheCounts[GetInfoCacheDir()] = min(len(paths), maxCount)
+
+def SaveInfoCache(path, key, info):
+    cachePath = GetInfoCachePath(path)
+    try:
+        cachePath.parent.mkdir(parents=True, exist_ok=True)
+        tmpPath = cachePath.with_name(f'{cachePath.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with tmpPath.open('w', encoding='utf-8') as f:
+            json.dump([ key, info ], f)
+        os.replace(tmpPath, cachePath)
+        with infoCacheLock:
+            # the folder is scanned again only over the cap, other processes' entries are found then
+            infoDir = GetInfoCacheDir()
+            if infoDir not in infoCacheCounts or infoCacheCounts[infoDir] >= INFO_CACHE_SIZE:
+                EvictInfoCache()
+            else:
+                infoCacheCounts[infoDir] += 1
+    except OSError:
+        pass
+
+def InvalidateInfoCache(path=None):
+    if path is None:
+        for cachePath in GetInfoCacheDir().glob('*/*.json'):
+            cachePath.unlink(missing_ok=True)
+        infoCacheCounts.pop(GetInfoCacheDir(), None)
+    else:
+        GetInfoCachePath(Path(path)).unlink(missing_ok=True)
+
+def GetInfo(path, useCache=None, backend='ffmpeg'):
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    # opt-in like the results cache, by EnableCache() or TSUTILS_CACHE=1
+    if useCache is None:
+        useCache = IsCacheEnabled()
+    if useCache:
+        key = GetInfoCacheKey(path)
+        info = LoadInfoCache(path, key)
+        if info is not None:
+            return info
+    if backend == 'ffprobe':
+        info = ProbeWithFFprobe(path)
+    else:
+        info = ProbeWithFFmpeg(path)
     if info is None:
         raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    if useCache:
+        SaveInfoCache(path, key, info)
     return info
 
-def ExtractStream(path, output=None, ss=0, to=999999, videoTracks=None, audioTracks=None, toWav=False, quiet=False):
+def ExtractStream(path, output=None, ss=0, to=999999, videoTracks=None, audioTracks=None, toWav=False, quiet=False, callbacks=None):
     CheckExtenralCommand('ffmpeg')
     path = Path(path)
     if not path.is_file():
@@ -113,27 +287,120 @@ def ExtractStream(path, output=None, ss=0, to=999999, videoTracks=None, audioTra
             args += [ '-c:a', 'copy' ]
         args += [ output / f'audio_{i}.{extName}' ]
 
-    pipeObj = subprocess.Popen(args, stderr=subprocess.PIPE, universal_newlines='\r', errors='ignore')
-    info = GetInfoFromLines(pipeObj.stderr)
-    if info is None:
-        raise InvalidTsFormat(f'"{path.name}" is invalid!')
-   
+    if to > info['duration']:
+        to = info['duration']
+    RunFFmpeg(args, to - ss, 'Extracting streams', quiet=quiet, callbacks=callbacks)
+    return output
+
+def GetFramePropFromLine(line, ss=0):
+    ptsTime = float(line.split('pts_time:')[1].lstrip().split(' ')[0])
+    pos = int(line.split('pos:')[1].lstrip().split(' ')[0])
+    checksum = line.split('checksum:')[1].split(' ')[0]
+    planeChecksum = line.split('plane_checksum:')[1].split('[')[1].split(']')[0].split(' ')
+    meanStrList = line.split('mean:')[1].split('\x08')[0].strip('[]').strip().split(' ')
+    stdevStrList = line.split('stdev:')[1].split('\x08')[0].strip('[]').strip().split(' ')
+    mean = [ float(i) for i in meanStrList ]
+    stdev = [ float(i) for i in stdevStrList ]
+    isKey = int(line.split(' iskey:')[1].split(' ')[0])
+    frameType = line.split(' type:')[1].split(' ')[0]
+    return {
+        'ptsTime': ptsTime + ss,
+        'pos': pos,
+        'checksum': checksum,
+        'plane_checksum': planeChecksum,
+        'mean': mean,
+        'stdev': stdev,
+        'isKey': isKey,
+        'type': frameType,
+    }
+
+def FilterFrameProps(propList, ss, to):
+    return [ prop for prop in propList if ss <= prop['ptsTime'] <= to and prop['pos'] >= 0 ]
+
+def GetSadSize(info):
+    # PIL takes (width, height), so the BMP path samples a (h/8) x (w/8) grid
+    return round(info['height'] / 8), round(info['width'] / 8)
+
+def ReadFrames(stream, width, height, channels=3):
+    frameSize = width * height * channels
+    while True:
+        data = stream.read(frameSize)
+        if len(data) < frameSize:
+            break
+        yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, channels)
+
+def GetNearestIndex(size, sadSize):
+    # the pixels PIL's NEAREST resize picks along one axis, so the pipe samples what the BMP path does
+    return np.array(Image.fromarray(np.arange(size, dtype=np.int32)[None, :]).resize((sadSize, 1), Image.NEAREST))[0]
+
+def ReadSadImages(stream, info):
+    return GetSadImages(ReadFrames(stream, info['width'], info['height']), info)
+
+def GetSadImages(frames, info):
+    # full bgr24 frames in, the images the BMP path compares out
+    sadSize = GetSadSize(info)
+    xIndex, yIndex = GetNearestIndex(info['width'], sadSize[0]), GetNearestIndex(info['height'], sadSize[1])
+    for frame in frames:
+        # RGB like PIL loads the BMP, the float sums depend on the element order
+        yield np.ascontiguousarray(frame[yIndex[:, None], xIndex, ::-1])
+
+def CalcSad(image1, image2):
+    # the same arithmetic as the BMP path, so the values are bit-identical
+    return np.sum(np.abs(image1 / 255.0 - image2 / 255.0)) / image1.size
+
+def StreamFrameProps(path, ss, to, info, quiet=False):
+    CheckExtenralCommand('ffmpeg')
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    # full frames in the pixel format the BMP encoder gets, downscaled here like PIL does
+    args = [
+        'ffmpeg', '-hide_banner',
+        '-ss', str(ss), '-to', str(to),
+        '-i', path,
+        '-filter:v', "select='gte(t,0)',showinfo", '-vsync', '0',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'
+    ]
+    pipeObj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # only the first and the previous frame are kept, so memory does not grow with the clip
+    sadList = []
+    edges = [ None, None ]
+    def ReadSad():
+        for image in ReadSadImages(pipeObj.stdout, info):
+            if edges[0] is None:
+                edges[0] = image
+                sadList.append(0.0)
+            else:
+                sadList.append(CalcSad(image, edges[1]))
+            edges[1] = image
+    sadThread = threading.Thread(target=ReadSad, daemon=True)
+    sadThread.start()
+    propList = []
     if to > info['duration']:
         to = info['duration']
     with tqdm(total=to - ss, unit='secs', disable=quiet) as pbar:
-        pbar.set_description('Extracting streams')
-        for line in pipeObj.stderr:
-            if 'time=' in line:
-                for item in line.split(' '):
-                    if item.startswith('time='):
-                        timeFields = item.replace('time=', '').split(':')
-                        time = float(timeFields[0]) * 3600 + float(timeFields[1]) * 60  + float(timeFields[2])
-                        pbar.update(time - pbar.n)
+        pbar.set_description('Extracting props')
+        for line in io.TextIOWrapper(pipeObj.stderr, errors='ignore'):
+            if 'pts_time:' in line:
+                prop = GetFramePropFromLine(line, ss)
+                propList.append(prop)
+                pbar.update(prop['ptsTime'] - ss - pbar.n)
+        pipeObj.wait()
         pbar.update(to - ss - pbar.n)
-    pipeObj.wait()
-    return output
+    sadThread.join()
+    # The clip is corrputed if we cannot extract the same number of images
+    if len(sadList) == 0 or len(sadList) != len(propList):
+        return [], None, None
+    for prop, sad in zip(propList, sadList):
+        prop['sad'] = sad
+    return propList, edges[0], edges[1]
 
-def ExtractFrameProps(path, ss, to, nosad=False):
+@Cached('props', ignore=( 'quiet', ))
+def ExtractFrameProps(path, ss, to, nosad=False, pipe=False, quiet=False):
+    if pipe and not nosad:
+        info = GetInfo(path)
+        propList, _, _ = StreamFrameProps(path, ss, to, info, quiet=quiet)
+        return FilterFrameProps(propList, ss, min(to, info['duration']))
     CheckExtenralCommand('ffmpeg')
     path = Path(path)
     if not path.is_file():
@@ -161,31 +428,13 @@ def ExtractFrameProps(path, ss, to, nosad=False):
             raise InvalidTsFormat(f'"{path.name}" is invalid!')
         if to > info['duration']:
             to = info['duration']
-        with tqdm(total=to - ss, unit='secs', disable=not nosad) as pbar:
+        with tqdm(total=to - ss, unit='secs', disable=quiet or not nosad) as pbar:
             pbar.set_description('Extracting props')
             for line in pipeObj.stderr:
                 if 'pts_time:' in line:
-                    ptsTime = float(line.split('pts_time:')[1].lstrip().split(' ')[0])
-                    pos = int(line.split('pos:')[1].lstrip().split(' ')[0])
-                    checksum = line.split('checksum:')[1].split(' ')[0]
-                    planeChecksum = line.split('plane_checksum:')[1].split('[')[1].split(']')[0].split(' ')
-                    meanStrList = line.split('mean:')[1].split('\x08')[0].strip('[]').strip().split(' ')
-                    stdevStrList = line.split('stdev:')[1].split('\x08')[0].strip('[]').strip().split(' ')
-                    mean = [ float(i) for i in meanStrList ]
-                    stdev = [ float(i) for i in stdevStrList ]
-                    isKey = int(line.split(' iskey:')[1].split(' ')[0])
-                    frameType = line.split(' type:')[1].split(' ')[0]
-                    propList.append({
-                        'ptsTime': ptsTime + ss,
-                        'pos': pos,
-                        'checksum': checksum,
-                        'plane_checksum': planeChecksum,
-                        'mean': mean,
-                        'stdev': stdev,
-                        'isKey': isKey,
-                        'type': frameType,
-                    })
-                    pbar.update(ptsTime - pbar.n)
+                    prop = GetFramePropFromLine(line, ss)
+                    propList.append(prop)
+                    pbar.update(prop['ptsTime'] - ss - pbar.n)
             pipeObj.wait()
             pbar.update(to - ss - pbar.n)
         if not nosad:
@@ -207,15 +456,134 @@ def ExtractFrameProps(path, ss, to, nosad=False):
         else:
             sad = np.sum(np.abs(image - imageList[i - 1])) / (sadSize[0] * sadSize[1] * 3)
         propList[i]['sad'] = sad
-    for prop in propList[:]:
-        if prop['ptsTime'] < ss or prop['ptsTime'] > to:
-            propList.remove(prop)
-    for prop in propList[:]:
-        if prop['pos'] < 0:
-            propList.remove(prop)
-    return propList
-
-def ExtractArea(path, area, folder, ss, to, fps='1/1', quiet=False):
+    return FilterFrameProps(propList, ss, to)
+
+def GetKeyFrames(path, ss, to):
+    CheckExtenralCommand('ffmpeg')
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    # only keyframes are decoded, so this costs a fraction of a full pass
+    args = [
+        'ffmpeg', '-hide_banner',
+        '-skip_frame', 'nokey',
+        '-ss', str(ss), '-to', str(to),
+        '-i', path,
+        '-filter:v', 'showinfo', '-vsync', '0',
+        '-f', 'null', '-'
+    ]
+    pipeObj = subprocess.Popen(args, stderr=subprocess.PIPE, universal_newlines='\r', errors='ignore')
+    keyFrames = []
+    for line in pipeObj.stderr:
+        if 'pts_time:' in line:
+            prop = GetFramePropFromLine(line, ss)
+            if prop['isKey'] and prop['pos'] >= 0:
+                keyFrames.append(prop['ptsTime'])
+    pipeObj.wait()
+    return keyFrames
+
+def SplitAtKeyFrames(keyFrames, ss, to, chunkLength):
+    boundaries = [ ss ]
+    for keyFrame in keyFrames:
+        # -ss is parsed in microseconds while TS timestamps tick at 90kHz,
+        # so snap to 100us which both can represent exactly
+        keyFrame = math.floor(keyFrame * 10000) / 10000
+        if boundaries[-1] + chunkLength <= keyFrame < to:
+            boundaries.append(keyFrame)
+    return list(zip(boundaries, boundaries[1:] + [ to ]))
+
+def NormalizePtsTime(ptsTime, ss):
+    # showinfo prints pts_time with 6 significant digits relative to -ss,
+    # so re-quantize chunk timestamps the way a single pass from ss would
+    return float(f'{ptsTime - ss:.6g}') + ss
+
+def ExtractFramePropsParallel(path, ss, to, nosad=False, workers=None, chunkLength=60, quiet=False):
+    info = GetInfo(path)
+    if to > info['duration']:
+        to = info['duration']
+    chunks = SplitAtKeyFrames(GetKeyFrames(path, ss, to), ss, to, chunkLength)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        if nosad:
+            futures = [ executor.submit(ExtractFrameProps, path, chunkSs, chunkTo, nosad=True, quiet=True) for chunkSs, chunkTo in chunks ]
+        else:
+            futures = [ executor.submit(StreamFrameProps, path, chunkSs, chunkTo, info, quiet=True) for chunkSs, chunkTo in chunks ]
+        with tqdm(total=len(chunks), unit='chunks', disable=quiet) as pbar:
+            pbar.set_description('Extracting props')
+            results = []
+            for future in futures:
+                results.append(future.result() if not nosad else (future.result(), None, None))
+                pbar.update(1)
+    propList = []
+    lastImage = None
+    for chunkProps, firstImage, chunkLastImage in results:
+        # The clip is corrputed if any chunk is corrupted
+        if not nosad and len(chunkProps) == 0:
+            return []
+        for prop in chunkProps:
+            prop['ptsTime'] = NormalizePtsTime(prop['ptsTime'], ss)
+        # frames at the seam are decoded by both chunks
+        lastPtsTime = propList[-1]['ptsTime'] if propList else None
+        seamProps = [ prop for prop in chunkProps if lastPtsTime is None or prop['ptsTime'] > lastPtsTime ]
+        if not nosad and lastImage is not None and len(seamProps) == len(chunkProps):
+            chunkProps[0]['sad'] = CalcSad(firstImage, lastImage)
+        propList += seamProps
+        lastImage = chunkLastImage
+    return FilterFrameProps(propList, ss, to)
+
+def GetAreaCrop(info, area):
+    return int(round(area[2] * info['width'])), int(round(area[3] * info['height'])), int(round(area[0] * info['width'])), int(round(area[1] * info['height']))
+
+def ExtractAreaFrames(path, area, ss=0, to=999999, fps='1/1', gray=False, scale=None):
+    CheckExtenralCommand('ffmpeg')
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    info = GetInfo(path)
+    w, h, x, y = GetAreaCrop(info, area)
+    # even like crop makes them on 4:2:0 in ExtractArea, exact=1 keeps ffmpeg from rounding them again
+    w, h, x, y = max(w & ~1, 2), max(h & ~1, 2), x & ~1, y & ~1
+    filters = [ f'crop={w}:{h}:{x}:{y}:exact=1' ]
+    if fps:
+        filters.append(f'fps={fps}')
+    if scale is not None:
+        w, h = max(2, round(w * scale / 2) * 2), max(2, round(h * scale / 2) * 2)
+        filters.append(f'scale={w}:{h}')
+    filters.append('showinfo')
+    args = [
+        'ffmpeg', '-hide_banner',
+        '-ss', str(ss), '-to', str(to),
+        '-i', path,
+        '-filter:v', ','.join(filters), '-vsync', '0',
+        '-f', 'rawvideo', '-pix_fmt', 'gray' if gray else 'rgb24', '-'
+    ]
+    pipeObj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    frameInfos = queue.Queue()
+    def ReadFrameInfos():
+        for line in io.TextIOWrapper(pipeObj.stderr, errors='ignore'):
+            if 'pts_time:' in line:
+                size = tuple(int(i) for i in line.split(' s:')[1].split(' ')[0].split('x'))
+                frameInfos.put(( float(line.split('pts_time:')[1].lstrip().split(' ')[0]) + ss, size ))
+        # no more frames
+        frameInfos.put(None)
+    stderrThread = threading.Thread(target=ReadFrameInfos, daemon=True)
+    stderrThread.start()
+    try:
+        for image in ReadFrames(pipeObj.stdout, w, h, 1 if gray else 3):
+            frameInfo = frameInfos.get()
+            if frameInfo is None:
+                raise InvalidTsFormat(f'"{path.name}" is invalid!')
+            ptsTime, size = frameInfo
+            # the frames would be read out of step
+            if size != (w, h):
+                raise EncodingError(f'Expected {w}x{h} frames from "{path.name}", got {size[0]}x{size[1]}!')
+            yield ptsTime, image[:, :, 0] if gray else image
+    finally:
+        # the consumer may stop early
+        pipeObj.kill()
+        pipeObj.wait()
+        stderrThread.join()
+
+def ExtractArea(path, area, folder, ss, to, fps='1/1', quiet=False, callbacks=None):
     CheckExtenralCommand('ffmpeg')
     path = Path(path)
     if not path.is_file():
@@ -229,7 +597,7 @@ def ExtractArea(path, area, folder, ss, to, fps='1/1', quiet=False):
     info = GetInfo(path)
     if info is None:
         raise InvalidTsFormat(f'"{path.name}" is invalid!')
-    w, h, x, y = int(round(area[2] * info['width'])), int(round(area[3] * info['height'])), int(round(area[0] * info['width'])), int(round(area[1] * info['height']))
+    w, h, x, y = GetAreaCrop(info, area)
     args = [ 'ffmpeg', '-hide_banner' ]
     if ss is not None and to is not None:
         args += [ '-ss', str(ss), '-to', str(to) ]
@@ -238,20 +606,9 @@ def ExtractArea(path, area, folder, ss, to, fps='1/1', quiet=False):
         '-i', path,
         '-filter:v', 'crop={}:{}:{}:{}{}'.format(w, h, x, y, fpsStr),
         '{}/out%8d.bmp'.format(folder) ]
-    pipeObj = subprocess.Popen(args, stderr=subprocess.PIPE, universal_newlines='\r', errors='ignore')
     if to > info['duration']:
         to = info['duration']
-    with tqdm(total=to - ss, disable=quiet, unit='secs') as pbar:
-        pbar.set_description('Extracting area')
-        for line in pipeObj.stderr:
-            if 'time=' in line:
-                for item in line.split(' '):
-                    if item.startswith('time='):
-                        timeFields = item.replace('time=', '').split(':')
-                        time = float(timeFields[0]) * 3600 + float(timeFields[1]) * 60  + float(timeFields[2])
-                        pbar.update(time - pbar.n)
-        pbar.update(to - ss - pbar.n)
-    pipeObj.wait()
+    RunFFmpeg(args, to - ss, 'Extracting area', quiet=quiet, callbacks=callbacks)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Python wrapper of ffmpeg')
@@ -260,6 +617,7 @@ if __name__ == "__main__":
 
     subparser = subparsers.add_parser('info', help='mark CM clips in the mpegts file')
     subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    subparser.add_argument('--backend', default='ffmpeg', choices=[ 'ffmpeg', 'ffprobe' ], help='probe backend')
 
     subparser = subparsers.add_parser('stream', help='extract video and audio streams from the mpegts file')
     subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
@@ -280,17 +638,26 @@ if __name__ == "__main__":
     subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
     subparser.add_argument('--ss', type=float, default=999999, help='from (seconds)')
     subparser.add_argument('--to', type=float, default=0, help='to (seconds)')
+    subparser.add_argument('--pipe', action='store_true', help='read frames from a pipe instead of BMP files')
+    subparser.add_argument('--output', '-o', help='save props as a columnar .npy/.npz file')
+    subparser.add_argument('--workers', type=int, default=0, help='decode keyframe-aligned chunks in parallel')
 
     args = parser.parse_args()
 
     if args.command == 'info':
-        info = GetInfo(path=args.input)
+        info = GetInfo(path=args.input, backend=args.backend)
         print("info:", info)
     elif args.command == 'stream':
         ExtractStream(path=args.input, videoTracks=args.videotracks, audioTracks=args.audiotracks, toWav=args.wav)
     elif args.command == 'area':
         ExtractArea(path=args.input, area=args.area, folder=args.output, ss=args.ss, to=args.to, fps=args.fps)
     elif args.command == 'props':
-        props = ExtractFrameProps(path=args.input, ss=args.ss, to=args.to)
-        pp = pprint.PrettyPrinter()
-        pp.pprint(props)
\ No newline at end of file
+        if args.workers:
+            props = ExtractFramePropsParallel(path=args.input, ss=args.ss, to=args.to, workers=args.workers)
+        else:
+            props = ExtractFrameProps(path=args.input, ss=args.ss, to=args.to, pipe=args.pipe)
+        if args.output:
+            SaveProps(props, args.output)
+        else:
+            pp = pprint.PrettyPrinter()
+            pp.pprint(props)
\ No newline at end of file
@@ -0,0 +1,175 @@
+import argparse
+from pathlib import Path
+import numpy as np
+from .common import TsFileNotFound, InvalidTsFormat, CopyPart, CopyParts, SplitParts, ClipToFilename
+from .cache import Cached
+from .ts import PACKET_SIZE, VIDEO_STREAM_TYPES, GetPids, GetMainService, ReadPackets
+
+PTS_CLOCK = 90000
+PTS_WRAP = 1 << 33
+
+INDEX_DTYPE = np.dtype([
+    ('pts', 'i8'),
+    ('offset', 'i8'),
+    ('isKey', 'u1'),
+])
+
+def GetPayloadStarts(packets):
+    adaptationFieldControl = (packets[:, 3] >> 4) & 0x3
+    return 4 + np.where(adaptationFieldControl & 0x2, 1 + packets[:, 4].astype(np.int64), 0)
+
+def ReadPesHeaders(packets):
+    # PTS and keyframe flag of packets starting a PES, -1 where there is no PTS
+    payloadStarts = GetPayloadStarts(packets)
+    rows = np.arange(len(packets))
+    def ByteAt(offset):
+        columns = np.minimum(payloadStarts + offset, PACKET_SIZE - 1)
+        return packets[rows, columns].astype(np.int64)
+    isPes = (payloadStarts + 14 <= PACKET_SIZE) & (ByteAt(0) == 0) & (ByteAt(1) == 0) & (ByteAt(2) == 1) & ((ByteAt(7) & 0x80) != 0)
+    pts = ((ByteAt(9) >> 1) & 0x7) << 30 | ByteAt(10) << 22 | (ByteAt(11) >> 1) << 15 | ByteAt(12) << 7 | ByteAt(13) >> 1
+    pts = np.where(isPes, pts, -1)
+    # random_access_indicator, or an MPEG-2 sequence header right after the PES header
+    randomAccess = (((packets[:, 3] >> 4) & 0x2) != 0) & (packets[:, 4] > 0) & ((packets[:, 5] & 0x40) != 0)
+    esStarts = payloadStarts + 9 + ByteAt(8)
+    esBytes = [ packets[rows, np.minimum(esStarts + i, PACKET_SIZE - 1)] for i in range(4) ]
+    sequenceHeader = (esStarts + 4 <= PACKET_SIZE) & (esBytes[0] == 0) & (esBytes[1] == 0) & (esBytes[2] == 1) & (esBytes[3] == 0xB3)
+    return pts, randomAccess | sequenceHeader
+
+def UnwrapPts(pts, last=None):
+    # 33 bit PTS to a running count, steps of more than half the range are wraps
+    pts = pts.astype(np.int64)
+    if len(pts) == 0:
+        return pts, last
+    base = int(pts[0]) if last is None else last
+    steps = np.diff(pts, prepend=base % PTS_WRAP)
+    steps = (steps + PTS_WRAP // 2) % PTS_WRAP - PTS_WRAP // 2
+    unwrapped = base + np.cumsum(steps)
+    return unwrapped, int(unwrapped[-1])
+
+@Cached('array')
+def BuildIndex(path, quiet=False):
+    # kept with the other results in the cache, nothing is written next to the recording
+    path = Path(path)
+    if not path.is_file():
+        raise TsFileNotFound(f'"{path.name}" not found!')
+    mainService = GetMainService(path)
+    if mainService is None:
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    _, pmt = mainService
+    videoPid = next(pid for streamType, pid in pmt['streams'] if streamType in VIDEO_STREAM_TYPES)
+    entries = []
+    lastPts = None
+    for offset, packets in ReadPackets(path, 'Indexing', quiet=quiet):
+        starts = np.flatnonzero((GetPids(packets) == videoPid) & ((packets[:, 1] & 0x40) != 0))
+        pts, isKey = ReadPesHeaders(packets[starts])
+        hasPts = pts >= 0
+        unwrapped, lastPts = UnwrapPts(pts[hasPts], lastPts)
+        chunkEntries = np.zeros(len(unwrapped), dtype=INDEX_DTYPE)
+        chunkEntries['pts'] = unwrapped
+        chunkEntries['offset'] = offset + starts[hasPts] * PACKET_SIZE
+        chunkEntries['isKey'] = isKey[hasPts]
+        entries.append(chunkEntries)
+    index = np.concatenate(entries) if entries else np.zeros(0, dtype=INDEX_DTYPE)
+    if len(index) == 0:
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    # times count from the earliest video frame
+    index['pts'] -= index['pts'].min()
+    return index
+
+def GetStartPts(path):
+    # raw 33 bit PTS of the earliest video frame, the origin of the index times
+    mainService = GetMainService(path)
+    if mainService is None:
+        raise InvalidTsFormat(f'"{Path(path).name}" is invalid!')
+    _, pmt = mainService
+    videoPid = next(pid for streamType, pid in pmt['streams'] if streamType in VIDEO_STREAM_TYPES)
+    for _, packets in ReadPackets(path, quiet=True):
+        starts = np.flatnonzero((GetPids(packets) == videoPid) & ((packets[:, 1] & 0x40) != 0))
+        pts, _ = ReadPesHeaders(packets[starts])
+        pts = pts[pts >= 0]
+        if len(pts) > 0:
+            return int(pts.min())
+    raise InvalidTsFormat(f'"{Path(path).name}" is invalid!')
+
+def GetPtsAt(path, offset):
+    # raw 33 bit PTS of the PES starting in the packet at offset, -1 without one
+    with Path(path).open('rb') as f:
+        f.seek(offset)
+        data = f.read(PACKET_SIZE)
+    if len(data) < PACKET_SIZE:
+        return -1
+    pts, _ = ReadPesHeaders(np.frombuffer(data, dtype=np.uint8).reshape(1, PACKET_SIZE))
+    return int(pts[0])
+
+def LoadIndex(path, quiet=False):
+    # from the cache when it is enabled, built otherwise
+    return BuildIndex(path, quiet=quiet)
+
+def FindKeyFrame(index, ptsTime):
+    # row of the last keyframe shown at or before ptsTime
+    keyRows = np.flatnonzero(index['isKey'])
+    keyPts = np.maximum.accumulate(index['pts'][keyRows])
+    i = np.searchsorted(keyPts, round(ptsTime * PTS_CLOCK), side='right') - 1
+    return int(keyRows[max(i, 0)])
+
+def GetByteRange(index, ss, to, fileSize):
+    # from the keyframe at or before ss up to the first keyframe after to
+    start = int(index['offset'][FindKeyFrame(index, ss)])
+    keyRows = np.flatnonzero(index['isKey'])
+    keyPts = np.maximum.accumulate(index['pts'][keyRows])
+    i = np.searchsorted(keyPts, round(to * PTS_CLOCK), side='right')
+    end = int(index['offset'][keyRows[i]]) if i < len(keyRows) else fileSize
+    return start, end
+
+def CutClip(path, ss, to, outputPath, index=None):
+    path = Path(path)
+    if index is None:
+        index = LoadIndex(path, quiet=True)
+    start, end = GetByteRange(index, ss, to, path.stat().st_size)
+    CopyPart(path, outputPath, start, end)
+    return Path(outputPath)
+
+def ExportClips(path, clips, folder=None, outputPath=None, index=None):
+    # clips are (ss, to) pairs, exported as ClipToFilename files in folder or concatenated into outputPath
+    path = Path(path)
+    if index is None:
+        index = LoadIndex(path, quiet=True)
+    fileSize = path.stat().st_size
+    ranges = [ GetByteRange(index, clip[0], clip[1], fileSize) for clip in clips ]
+    if outputPath is not None:
+        return [ CopyParts(path, Path(outputPath), ranges) ]
+    folder = path.with_suffix('') if folder is None else Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    return SplitParts(path, [ (folder / ClipToFilename(clip), start, end) for clip, (start, end) in zip(clips, ranges) ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time to byte offset index of TS files')
+    parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
+    subparsers = parser.add_subparsers(required=True, title='subcommands', dest='command')
+
+    subparser = subparsers.add_parser('build', help='scan a TS file, the index is cached when the cache is enabled')
+    subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
+
+    subparser = subparsers.add_parser('cut', help='copy the bytes between two times without decoding')
+    subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    subparser.add_argument('--ss', type=float, required=True, help='from (seconds)')
+    subparser.add_argument('--to', type=float, required=True, help='to (seconds)')
+    subparser.add_argument('--output', '-o', required=True, help='output mpegts path')
+
+    subparser = subparsers.add_parser('clips', help='export many clips with one open source file')
+    subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    subparser.add_argument('--clips', '-c', required=True, nargs='+', help='clips as ss-to pairs in seconds, e.g. 10.5-40')
+    subparser.add_argument('--folder', '-f', help='output folder, one file per clip')
+    subparser.add_argument('--output', '-o', help='output mpegts path, clips concatenated')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        index = BuildIndex(args.input, quiet=args.quiet)
+        print(f'{len(index)} frames, {int(index["isKey"].sum())} keyframes, {index["pts"].max() / PTS_CLOCK:.3f}s')
+    elif args.command == 'cut':
+        CutClip(args.input, args.ss, args.to, args.output)
+    elif args.command == 'clips':
+        clips = [ [ float(i) for i in clip.split('-') ] for clip in args.clips ]
+        for path in ExportClips(args.input, clips, folder=args.folder, outputPath=args.output):
+            print(path)
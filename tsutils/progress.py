@@ -0,0 +1,170 @@
+import subprocess, threading, time, itertools
+from tqdm import tqdm
+from .common import EncodingError
+
+# callbacks notified for every ffmpeg job in this process
+progressCallbacks = []
+# seconds between the checks of a job that sends no progress
+WATCHDOG_INTERVAL = 1
+# tells apart the events of jobs running at the same time
+jobIds = itertools.count()
+
+def AddProgressCallback(callback):
+    progressCallbacks.append(callback)
+
+def RemoveProgressCallback(callback):
+    progressCallbacks.remove(callback)
+
+def ParseProgressTime(value):
+    if value is None or value == 'N/A':
+        return None
+    timeFields = value.split(':')
+    return float(timeFields[0]) * 3600 + float(timeFields[1]) * 60  + float(timeFields[2])
+
+def ParseProgressNumber(value, unit=''):
+    if value is None:
+        return None
+    value = value.strip()
+    if unit and value.endswith(unit):
+        value = value[:-len(unit)]
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def GetProgressEvent(fields, description, inputPath, total, elapsed, job=None):
+    outTime = fields.get('out_time_us', fields.get('out_time_ms'))
+    outTime = int(outTime) / 1000000 if outTime not in (None, 'N/A') else ParseProgressTime(fields.get('out_time'))
+    frames = ParseProgressNumber(fields.get('frame'))
+    totalSize = ParseProgressNumber(fields.get('total_size'))
+    return {
+        'job': job,
+        'description': description,
+        'input': inputPath,
+        'total': total,
+        'elapsed': elapsed,
+        'out_time': outTime,
+        'frames': int(frames) if frames is not None else None,
+        'fps': ParseProgressNumber(fields.get('fps')),
+        'speed': ParseProgressNumber(fields.get('speed'), 'x'),
+        'bitrate': ParseProgressNumber(fields.get('bitrate'), 'kbits/s'),
+        'total_size': int(totalSize) if totalSize is not None else None,
+        'dup_frames': int(fields.get('dup_frames', 0)),
+        'drop_frames': int(fields.get('drop_frames', 0)),
+        'progress': fields.get('progress'),
+    }
+
+class StallDetector:
+    # a hung ffmpeg sends no events at all, so RunFFmpeg also calls Check on a timer
+    def __init__(self, timeout=120):
+        self.timeout = timeout
+        # (last out_time, when it moved) per job, so one job's progress doesn't hide another's stall
+        self.jobs = {}
+        self.ended = set()
+        # jobs running on several threads share one detector
+        self.lock = threading.Lock()
+
+    def __call__(self, event):
+        now = time.monotonic()
+        job = event['job']
+        with self.lock:
+            if job not in self.jobs:
+                # finished jobs are forgotten once another one starts
+                for ended in self.ended:
+                    self.jobs.pop(ended, None)
+                self.ended.clear()
+            advanced = job not in self.jobs or event['out_time'] != self.jobs[job][0]
+            if advanced:
+                self.jobs[job] = ( event['out_time'], now )
+            if event['progress'] == 'end':
+                self.ended.add(job)
+        if not advanced:
+            self.Check(event)
+
+    def Check(self, event):
+        now = time.monotonic()
+        # a job with no event yet has been stalled since it started
+        with self.lock:
+            _, lastAdvance = self.jobs.get(event['job'], ( None, now - event['elapsed'] ))
+        stalled = now - lastAdvance
+        if stalled > self.timeout:
+            raise EncodingError(f'"{event["input"]}" stalled at {event["out_time"]}s for {round(stalled)}s!')
+
+class ThroughputRecorder:
+    def __init__(self):
+        self.jobs = []
+
+    def __call__(self, event):
+        if event['progress'] == 'end':
+            outTime = event['out_time'] or 0
+            self.jobs.append({
+                'job': event['job'],
+                'description': event['description'],
+                'input': event['input'],
+                'elapsed': event['elapsed'],
+                'out_time': outTime,
+                'frames': event['frames'],
+                'throughput': outTime / event['elapsed'] if event['elapsed'] > 0 else None,
+            })
+
+def RunFFmpeg(args, total, description, quiet=False, callbacks=None):
+    # progress goes to stdout as key=value blocks, stderr keeps the banner and errors
+    args = [ args[0], '-progress', 'pipe:1', '-nostats' ] + list(args[1:])
+    inputPath = str(args[args.index('-i') + 1]) if '-i' in args else None
+    callbacks = list(callbacks or []) + progressCallbacks
+    job = next(jobIds)
+    pipeObj = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, errors='ignore')
+    output = []
+    stderrThread = threading.Thread(target=lambda: output.extend(pipeObj.stderr), daemon=True)
+    stderrThread.start()
+    startTime = time.monotonic()
+    # callbacks run on this thread and on the watchdog, one at a time
+    lock = threading.Lock()
+    lastFields = {}
+    failures = []
+    stopped = threading.Event()
+    def Watch():
+        # the last event again with the current elapsed time, for callbacks that check it on a timer
+        while not stopped.wait(WATCHDOG_INTERVAL):
+            with lock:
+                event = GetProgressEvent(lastFields, description, inputPath, total, time.monotonic() - startTime, job)
+                try:
+                    for callback in callbacks:
+                        if hasattr(callback, 'Check'):
+                            callback.Check(event)
+                except Exception as e:
+                    failures.append(e)
+                    pipeObj.kill()
+                    return
+    watchdog = threading.Thread(target=Watch, daemon=True)
+    watchdog.start()
+    try:
+        with tqdm(total=total, unit='secs', disable=quiet) as pbar:
+            pbar.set_description(description)
+            fields = {}
+            for line in pipeObj.stdout:
+                key, _, value = line.strip().partition('=')
+                fields[key] = value
+                if key == 'progress':
+                    with lock:
+                        event = GetProgressEvent(fields, description, inputPath, total, time.monotonic() - startTime, job)
+                        if event['out_time'] is not None:
+                            pbar.update(max(min(event['out_time'], total) - pbar.n, 0))
+                        for callback in callbacks:
+                            callback(event)
+                        lastFields.clear()
+                        lastFields.update(fields)
+                    fields = {}
+            stopped.set()
+            watchdog.join()
+            if failures:
+                raise failures[0]
+            pbar.update(total - pbar.n)
+        pipeObj.wait()
+    except BaseException:
+        stopped.set()
+        pipeObj.kill()
+        pipeObj.wait()
+        raise
+    stderrThread.join()
+    return pipeObj.returncode, output
@@ -0,0 +1,82 @@
+from pathlib import Path
+import numpy as np
+
+MAX_PLANES = 4
+
+PROPS_DTYPE = np.dtype([
+    ('ptsTime', 'f8'),
+    ('pos', 'i8'),
+    ('isKey', 'u1'),
+    ('type', 'S1'),
+    ('planes', 'u1'),
+    ('checksum', 'u4'),
+    ('plane_checksum', 'u4', (MAX_PLANES,)),
+    ('mean', 'f8', (MAX_PLANES,)),
+    ('stdev', 'f8', (MAX_PLANES,)),
+    ('sad', 'f8'),
+])
+
+def PropsToArray(propList):
+    props = np.zeros(len(propList), dtype=PROPS_DTYPE)
+    props['ptsTime'] = [ prop['ptsTime'] for prop in propList ]
+    props['pos'] = [ prop['pos'] for prop in propList ]
+    props['isKey'] = [ prop['isKey'] for prop in propList ]
+    props['type'] = [ prop['type'] for prop in propList ]
+    props['planes'] = [ len(prop['plane_checksum']) for prop in propList ]
+    props['checksum'] = [ int(prop['checksum'], 16) for prop in propList ]
+    props['sad'] = [ prop.get('sad', np.nan) for prop in propList ]
+    for i, prop in enumerate(propList):
+        planes = len(prop['plane_checksum'])
+        props['plane_checksum'][i, :planes] = [ int(checksum, 16) for checksum in prop['plane_checksum'] ]
+        props['mean'][i, :planes] = prop['mean'][:planes]
+        props['stdev'][i, :planes] = prop['stdev'][:planes]
+    return props
+
+def ArrayToProps(props):
+    propList = []
+    for row in props:
+        planes = int(row['planes'])
+        prop = {
+            'ptsTime': float(row['ptsTime']),
+            'pos': int(row['pos']),
+            'checksum': f'{row["checksum"]:08X}',
+            'plane_checksum': [ f'{checksum:08X}' for checksum in row['plane_checksum'][:planes] ],
+            'mean': [ float(i) for i in row['mean'][:planes] ],
+            'stdev': [ float(i) for i in row['stdev'][:planes] ],
+            'isKey': int(row['isKey']),
+            'type': row['type'].decode(),
+        }
+        if not np.isnan(row['sad']):
+            prop['sad'] = float(row['sad'])
+        propList.append(prop)
+    return propList
+
+def SaveProps(props, path):
+    path = Path(path)
+    if isinstance(props, list):
+        props = PropsToArray(props)
+    if path.suffix == '.npz':
+        # one array per column, so readers can load only what they need
+        np.savez(path, **{ name: props[name] for name in PROPS_DTYPE.names })
+    else:
+        np.save(path, props)
+    return path
+
+def LoadProps(path, columns=None, mmap=True):
+    path = Path(path)
+    if path.suffix == '.npz':
+        with np.load(path) as npz:
+            return { name: npz[name] for name in (columns or npz.files) }
+    props = np.load(path, mmap_mode='r' if mmap else None)
+    if columns is not None:
+        return { name: props[name] for name in columns }
+    return props
+
+def FindFrame(props, ptsTime):
+    # index of the last frame shown at or before ptsTime
+    index = np.searchsorted(props['ptsTime'], ptsTime, side='right') - 1
+    return max(int(index), 0)
+
+def FindFrameRange(props, ss, to):
+    ptsTimes = props['ptsTime']
+    return int(np.searchsorted(ptsTimes, ss, side='left')), int(np.searchsorted(ptsTimes, to, side='right'))
@@ -0,0 +1,112 @@
+import os, sys, json, time, threading, argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from tqdm import tqdm
+from .ffmpeg import GetInfo
+
+# a software HEVC encode of a 1080i recording stays well below this
+JOB_MEMORY = 2.0
+
+def GetTotalMemory():
+    # physical memory in GB, or None where sysconf can't tell
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 1024 ** 3
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def GetBudget(jobs=None, cores=None, memory=None, jobMemory=JOB_MEMORY):
+    # (concurrent jobs, ffmpeg threads per job) within the core and RAM budget
+    cores = cores or os.cpu_count() or 1
+    memory = memory or GetTotalMemory()
+    jobs = jobs or max(1, cores // 4)
+    if memory is not None:
+        jobs = min(jobs, max(1, int(memory // jobMemory)))
+    jobs = max(1, min(jobs, cores))
+    return jobs, max(1, cores // jobs)
+
+class JobQueue:
+    # persistent job list, so an interrupted batch resumes with what is left
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else None
+        self.lock = threading.Lock()
+        self.jobs = {}
+        if self.path is not None and self.path.exists():
+            with self.path.open(encoding='utf8') as f:
+                self.jobs = json.load(f)
+
+    def Save(self):
+        if self.path is None:
+            return
+        tempPath = self.path.with_suffix(self.path.suffix + '.tmp')
+        with tempPath.open('w', encoding='utf8') as f:
+            json.dump(self.jobs, f, ensure_ascii=False, indent=1)
+        os.replace(tempPath, self.path)
+
+    def Add(self, inputPath, command, options):
+        inputPath = str(Path(inputPath).absolute())
+        key = json.dumps([ inputPath, command, options ], ensure_ascii=False, sort_keys=True)
+        with self.lock:
+            job = self.jobs.setdefault(key, { 'input': inputPath, 'command': command, 'options': options, 'status': 'pending' })
+            if job['status'] == 'done' and not IsFinished(job):
+                job['status'] = 'pending'
+            self.Save()
+        return key
+
+    def Update(self, key, **fields):
+        with self.lock:
+            self.jobs[key].update(fields)
+            self.Save()
+
+    def GetPending(self):
+        return [ key for key, job in self.jobs.items() if job['status'] != 'done' ]
+
+def IsFinished(job):
+    # outputs get the mtime of their input when they are complete
+    inputPath, outputPath = Path(job['input']), Path(job.get('output') or '')
+    return inputPath.exists() and outputPath.is_file() and inputPath.stat().st_mtime == outputPath.stat().st_mtime
+
+def RunJobs(queue, worker, keys=None, jobs=None, cores=None, memory=None, jobMemory=JOB_MEMORY, quiet=False):
+    # worker(job, threads) does one job and returns its output path
+    keys = queue.GetPending() if keys is None else [ key for key in keys if queue.jobs[key]['status'] != 'done' ]
+    jobs, threads = GetBudget(jobs, cores, memory, jobMemory)
+    if not quiet:
+        print(f'Running {len(keys)} jobs, {jobs} at a time with {threads} threads each', file=sys.stderr)
+    def Run(key):
+        job = queue.jobs[key]
+        queue.Update(key, status='running')
+        start = time.monotonic()
+        try:
+            outputPath = worker(job, threads)
+        except Exception as e:
+            queue.Update(key, status='failed', error=str(e))
+            raise
+        duration = GetInfo(job['input'])['duration']
+        queue.Update(key, status='done', output=str(Path(outputPath).absolute()), elapsed=time.monotonic() - start, duration=duration)
+        return duration
+    startTime = time.monotonic()
+    mediaTime, failed = 0, []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = { executor.submit(Run, key): key for key in keys }
+        for future in tqdm(as_completed(futures), total=len(futures), unit='jobs', disable=quiet):
+            try:
+                mediaTime += future.result()
+            except Exception as e:
+                failed.append(queue.jobs[futures[future]]['input'])
+                print(f'{queue.jobs[futures[future]]["input"]}: {e}', file=sys.stderr)
+    elapsed = time.monotonic() - startTime
+    return {
+        'jobs': len(keys) - len(failed),
+        'failed': failed,
+        'elapsed': elapsed,
+        'media_time': mediaTime,
+        'throughput': mediaTime / elapsed if elapsed > 0 else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Show the state of a persistent job queue')
+    parser.add_argument('--queue', required=True, help='queue file (.json)')
+    args = parser.parse_args()
+
+    queue = JobQueue(args.queue)
+    for job in queue.jobs.values():
+        print(f'{job["status"]}\t{job["command"]}\t{job["input"]}')
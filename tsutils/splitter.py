@@ -1,14 +1,18 @@
-import subprocess, shutil
+import subprocess
 from pathlib import Path
-from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand
-from .ffmpeg import GetInfo
+from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand, FindExternalCommand, CopyRange, CopyParts
+from .ts import SplitServices, ScanServices
 
 TRIM_THRESHOLD = 10 * 1024 * 1024
-BUF_SIZE = 1024 * 1024
 
-def Split(videoPath):
-    CheckExtenralCommand('TsSplitter')
+def Split(videoPath, native=None, quiet=False):
     videoPath = Path(videoPath).absolute()
+    if native is None:
+        # TsSplitter is Windows only, fall back to the built-in splitter elsewhere
+        native = FindExternalCommand('TsSplitter') is None
+    if native:
+        return SplitServices(videoPath, quiet=quiet)
+    CheckExtenralCommand('TsSplitter')
     if not videoPath.is_file():
         raise TsFileNotFound(f'"{videoPath.name}" not found!')
     cmdLine = f'TsSplitter -EIT -ECM -EMM -SD -1SEG -SEP3 -SEPA "{videoPath}"'
@@ -21,28 +25,53 @@ def Split(videoPath):
         raise InvalidTsFormat(f'"{videoPath.name}" is invalid!')
     return splittedTs
 
-def Trim(videoPath, outputPath=None):
-    splittedTs = Split(videoPath)
-    while True:
-        if splittedTs[0].stat().st_size < TRIM_THRESHOLD:
-            splittedTs[0].unlink()
-            del splittedTs[0]
-        elif splittedTs[-1].stat().st_size < TRIM_THRESHOLD:
-            splittedTs[-1].unlink()
-            del splittedTs[-1]
+def GetTrimRanges(segments):
+    # byte ranges kept by Trim: HD segments, without small ones at the head and the tail
+    segments = [ segment for segment in segments if segment['isHD'] ]
+    while segments and segments[0]['end'] - segments[0]['start'] < TRIM_THRESHOLD:
+        del segments[0]
+    while segments and segments[-1]['end'] - segments[-1]['start'] < TRIM_THRESHOLD:
+        del segments[-1]
+    ranges = []
+    for segment in segments:
+        if ranges and ranges[-1][1] == segment['start']:
+            ranges[-1] = ( ranges[-1][0], segment['end'] )
         else:
-            break
-    outputPath = Path(outputPath) if outputPath is not None else Path(str(videoPath).replace('.ts', '_trimmed.ts'))
-    with outputPath.open('wb') as wf:
-        for path in splittedTs:
-            with path.open('rb') as rf:
-                while True:
-                    data = rf.read(BUF_SIZE)
-                    if len(data) == 0:
-                        break
-                    wf.write(data)
-            path.unlink()
-    if GetInfo(outputPath)['duration'] / GetInfo(videoPath)['duration'] < 0.95:
+            ranges.append(( segment['start'], segment['end'] ))
+    return ranges
+
+def CompactRanges(path, ranges, bufsize=64*1024*1024):
+    # moves the ranges to the front of path and truncates it, so no second copy is ever on disk
+    buffer = bytearray(1024 * 1024)
+    with open(path, 'rb') as rf, open(path, 'r+b') as wf:
+        position = 0
+        for start, end in ranges:
+            if start == position:
+                position = end
+                wf.seek(position)
+                continue
+            # chunks no longer than the shift never overlap, so the kernel can copy them
+            step = min(start - position, bufsize)
+            while start < end:
+                length = min(step, end - start)
+                CopyRange(rf, wf, start, length, buffer=buffer)
+                start += length
+                position += length
+        wf.truncate(position)
+
+def Trim(videoPath, outputPath=None, quiet=False):
+    # copies the kept byte ranges straight from the source, nothing is split to disk first
+    videoPath = Path(videoPath)
+    if not videoPath.is_file():
+        raise TsFileNotFound(f'"{videoPath.name}" not found!')
+    fileSize = videoPath.stat().st_size
+    ranges = GetTrimRanges(ScanServices(videoPath, quiet=quiet))
+    if sum(end - start for start, end in ranges) / fileSize < 0.95:
         # trimmed more than expected
         raise InvalidTsFormat(f'"{videoPath.name}" is invalid!')
-    return outputPath
\ No newline at end of file
+    outputPath = Path(outputPath) if outputPath is not None else Path(str(videoPath).replace('.ts', '_trimmed.ts'))
+    if outputPath.exists() and outputPath.samefile(videoPath):
+        CompactRanges(videoPath, ranges)
+    else:
+        CopyParts(videoPath, outputPath, ranges)
+    return outputPath
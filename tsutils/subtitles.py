@@ -1,11 +1,83 @@
 import sys, subprocess, argparse
 from pathlib import Path
+import numpy as np
 import pysubs2
-from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand
+from .common import TsFileNotFound, InvalidTsFormat, CheckExtenralCommand, FindExternalCommand
+from .ts import VIDEO_STREAM_TYPES, PesReader, ParsePesPts, GetPids, GetMainService, ReadPackets
+from .index import PTS_CLOCK, PTS_WRAP, ReadPesHeaders
+from .arib import ParseCaptionStatements, DecodeCaption
 
-def Extract(path):
-    CheckExtenralCommand('LEProc2')
-    caption2AssPath = CheckExtenralCommand('Caption2AssC')
+# component tags of caption streams, superimposed text uses 0x38 and above
+CAPTION_COMPONENT_TAGS = range(0x30, 0x38)
+
+def GetCaptionPid(pmt):
+    for streamType, pid in pmt['streams']:
+        if streamType == 0x06 and pmt['componentTags'].get(pid) in CAPTION_COMPONENT_TAGS:
+            return pid
+    return None
+
+def ReadCaptions(path, quiet=False):
+    # [ start, end, text ] in ms from the first video frame, read in one pass
+    mainService = GetMainService(path)
+    if mainService is None:
+        return []
+    _, pmt = mainService
+    captionPid = GetCaptionPid(pmt)
+    if captionPid is None:
+        return []
+    videoPid = next(pid for streamType, pid in pmt['streams'] if streamType in VIDEO_STREAM_TYPES)
+    reader = PesReader()
+    statements = []
+    firstPts, lastPts = None, None
+    for _, packets in ReadPackets(path, 'Reading captions', quiet=quiet):
+        pids = GetPids(packets)
+        videoPts, _ = ReadPesHeaders(packets[np.flatnonzero((pids == videoPid) & ((packets[:, 1] & 0x40) != 0))])
+        videoPts = videoPts[videoPts >= 0]
+        if len(videoPts) > 0:
+            if firstPts is None:
+                firstPts = int(videoPts.min())
+            lastPts = int(videoPts[-1])
+        for i in np.flatnonzero(pids == captionPid):
+            for pes in reader.Feed(packets[i].tobytes()):
+                pts = ParsePesPts(pes)
+                bodies = ParseCaptionStatements(pes)
+                if pts is not None and bodies:
+                    statements.append(( pts, *DecodeCaption(bodies) ))
+    if firstPts is None:
+        return []
+    def ToMs(pts):
+        delta = (pts - firstPts) % PTS_WRAP
+        if delta >= PTS_WRAP // 2:
+            delta -= PTS_WRAP
+        return delta * 1000 // PTS_CLOCK
+    captions = []
+    for pts, text, cleared in statements:
+        # a caption stays on screen until it is cleared or replaced
+        if captions and captions[-1][1] is None and (cleared or text):
+            captions[-1][1] = ToMs(pts)
+        if text:
+            captions.append([ ToMs(pts), None, text ])
+    for caption in captions:
+        if caption[1] is None:
+            caption[1] = max(ToMs(lastPts), caption[0])
+    return [ [ max(start, 0), end, text ] for start, end, text in captions if end > 0 and end > start ]
+
+def ExtractNative(path, subtitlesPathes, quiet=False):
+    captions = ReadCaptions(path, quiet=quiet)
+    if not captions:
+        return
+    subtitles = pysubs2.SSAFile()
+    for start, end, text in captions:
+        subtitles.append(pysubs2.SSAEvent(start=start, end=end, text=text.replace('\n', '\\N')))
+    for subtitlesPath in subtitlesPathes:
+        subtitles.save(subtitlesPath)
+
+def Extract(path, native=None, quiet=False):
+    if native is None:
+        native = FindExternalCommand('LEProc2') is None or FindExternalCommand('Caption2AssC') is None
+    if not native:
+        CheckExtenralCommand('LEProc2')
+        caption2AssPath = CheckExtenralCommand('Caption2AssC')
     path = Path(path)
     if not path.is_file():
         raise TsFileNotFound(f'"{path.name}" not found!')
@@ -13,6 +85,9 @@ def Extract(path):
     for subtitlePath in subtitlesPathes:
         if subtitlePath.exists():
             subtitlePath.unlink()
+    if native:
+        ExtractNative(path, subtitlesPathes, quiet=quiet)
+        return [ path for path in subtitlesPathes if path.exists() ]
     retry = 0
     while any([ not path.exists() for path in subtitlesPathes ]) and retry < 2:
         pipeObj = subprocess.Popen(
@@ -39,8 +114,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Dump subtitles from TS file')
     parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
     parser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    parser.add_argument('--native', action='store_true', default=None, help='decode captions without Caption2AssC')
     args = parser.parse_args()
 
-    files = Extract(args.input)
+    files = Extract(args.input, native=args.native, quiet=args.quiet)
     for path in files:
         print(path.name)
\ No newline at end of file
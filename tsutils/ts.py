@@ -0,0 +1,472 @@
+import mmap, argparse
+from pathlib import Path
+import numpy as np
+from tqdm import tqdm
+from .common import TsFileNotFound, InvalidTsFormat
+
+PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+CHUNK_PACKETS = 65536
+
+PAT_PID = 0x0000
+SDT_PID = 0x0011
+EIT_PIDS = ( 0x0012, 0x0026, 0x0027 )
+TOT_PID = 0x0014
+# one-segment services carry their PMT on these PIDs
+ONESEG_PMT_PIDS = range(0x1FC8, 0x1FD0)
+VIDEO_STREAM_TYPES = ( 0x01, 0x02, 0x1B, 0x24 )
+MPEG2_STREAM_TYPES = ( 0x01, 0x02 )
+AUDIO_STREAM_TYPES = ( 0x03, 0x04, 0x0F, 0x11, 0x81 )
+HD_MIN_HEIGHT = 720
+
+def MakeCrcTable():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else (crc << 1)
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+CRC_TABLE = MakeCrcTable()
+
+def Crc32(data):
+    # CRC-32/MPEG-2, zero over a section including its own CRC
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+def FindSync(data, start=0):
+    # the first offset where three packets in a row start with the sync byte
+    end = len(data) - PACKET_SIZE * 2
+    offset = start
+    while offset < end:
+        offset = data.find(bytes([ SYNC_BYTE ]), offset, end)
+        if offset < 0:
+            break
+        if data[offset + PACKET_SIZE] == SYNC_BYTE and data[offset + PACKET_SIZE * 2] == SYNC_BYTE:
+            return offset
+        offset += 1
+    return None
+
+def GetPids(packets):
+    return ((packets[:, 1].astype(np.uint16) & 0x1F) << 8) | packets[:, 2]
+
+def GetPayload(packet):
+    adaptationFieldControl = (packet[3] >> 4) & 0x3
+    if not adaptationFieldControl & 0x1:
+        return b''
+    start = 4 + (1 + packet[4] if adaptationFieldControl & 0x2 else 0)
+    return bytes(packet[start:PACKET_SIZE])
+
+def GetSectionKey(section):
+    # table, extension (the service of an EIT) and section number, the slot a section fills
+    if section[1] & 0x80 and len(section) >= 8:
+        return section[0], section[3:5], section[6]
+    return section[0],
+
+class SectionReader:
+    # reassembles PSI/SI sections of one PID, dropping those with a bad CRC
+    def __init__(self):
+        self.buffer = None
+        # sections repeat all the time, the CRC is checked again only when a slot changes
+        self.verified = {}
+
+    def Feed(self, packet):
+        payload = GetPayload(packet)
+        sections = []
+        if packet[1] & 0x40:
+            if not payload:
+                return sections
+            pointer = payload[0]
+            if self.buffer is not None:
+                self.buffer += payload[1:1 + pointer]
+                sections += self.PopSections()
+            self.buffer = bytearray(payload[1 + pointer:])
+        elif self.buffer is not None:
+            self.buffer += payload
+        else:
+            return sections
+        sections += self.PopSections()
+        return sections
+
+    def PopSections(self):
+        sections = []
+        while self.buffer is not None and len(self.buffer) >= 3 and self.buffer[0] != 0xFF:
+            sectionLength = ((self.buffer[1] & 0x0F) << 8) | self.buffer[2]
+            if len(self.buffer) < 3 + sectionLength:
+                break
+            section = bytes(self.buffer[:3 + sectionLength])
+            del self.buffer[:3 + sectionLength]
+            key, digest = GetSectionKey(section), hash(section)
+            if self.verified.get(key) == digest or Crc32(section) == 0:
+                self.verified[key] = digest
+                sections.append(section)
+        if self.buffer is not None and len(self.buffer) > 0 and self.buffer[0] == 0xFF:
+            # stuffing, the rest of the packet carries nothing
+            self.buffer = None
+        return sections
+
+class PesReader:
+    # reassembles the PES packets of one PID
+    def __init__(self):
+        self.buffer = None
+
+    def Feed(self, packet):
+        payload = GetPayload(packet)
+        pesPackets = []
+        if packet[1] & 0x40:
+            if self.buffer:
+                pesPackets.append(bytes(self.buffer))
+            self.buffer = bytearray(payload)
+        elif self.buffer is not None:
+            self.buffer += payload
+        else:
+            return pesPackets
+        if len(self.buffer) >= 6:
+            pesLength = (self.buffer[4] << 8) | self.buffer[5]
+            if pesLength > 0 and len(self.buffer) >= 6 + pesLength:
+                pesPackets.append(bytes(self.buffer[:6 + pesLength]))
+                self.buffer = None
+        return pesPackets
+
+def ParsePesPts(pes):
+    # 33 bit PTS of a PES packet, or None
+    if len(pes) < 14 or pes[:3] != b'\x00\x00\x01' or not pes[7] & 0x80:
+        return None
+    return ((pes[9] >> 1) & 0x7) << 30 | pes[10] << 22 | (pes[11] >> 1) << 15 | pes[12] << 7 | pes[13] >> 1
+
+def ParsePAT(section):
+    transportStreamId = (section[3] << 8) | section[4]
+    programs = {}
+    for i in range(8, len(section) - 4, 4):
+        programNumber = (section[i] << 8) | section[i + 1]
+        if programNumber != 0:
+            programs[programNumber] = ((section[i + 2] & 0x1F) << 8) | section[i + 3]
+    return transportStreamId, programs
+
+def ParsePMT(section):
+    programNumber = (section[3] << 8) | section[4]
+    pcrPid = ((section[8] & 0x1F) << 8) | section[9]
+    programInfoLength = ((section[10] & 0x0F) << 8) | section[11]
+    streams = []
+    componentTags = {}
+    i = 12 + programInfoLength
+    while i + 5 <= len(section) - 4:
+        streamType = section[i]
+        pid = ((section[i + 1] & 0x1F) << 8) | section[i + 2]
+        esInfoLength = ((section[i + 3] & 0x0F) << 8) | section[i + 4]
+        streams.append(( streamType, pid ))
+        # stream_identifier_descriptor, which tells captions from superimposed text
+        j = i + 5
+        while j + 2 <= i + 5 + esInfoLength:
+            if section[j] == 0x52 and section[j + 1] >= 1:
+                componentTags[pid] = section[j + 2]
+            j += 2 + section[j + 1]
+        i += 5 + esInfoLength
+    return { 'programNumber': programNumber, 'pcrPid': pcrPid, 'streams': tuple(streams), 'componentTags': componentTags }
+
+def MakePATPacket(transportStreamId, programNumber, pmtPid, continuityCounter):
+    # a PAT listing only the kept service
+    section = bytes([
+        0x00, 0xB0, 13,
+        transportStreamId >> 8, transportStreamId & 0xFF,
+        0xC1, 0x00, 0x00,
+        programNumber >> 8, programNumber & 0xFF, 0xE0 | (pmtPid >> 8), pmtPid & 0xFF,
+    ])
+    section += Crc32(section).to_bytes(4, 'big')
+    packet = bytes([ SYNC_BYTE, 0x40, 0x00, 0x10 | continuityCounter, 0x00 ]) + section
+    return packet + b'\xFF' * (PACKET_SIZE - len(packet))
+
+def GetSequenceHeight(packet):
+    payload = GetPayload(packet)
+    index = payload.find(b'\x00\x00\x01\xB3')
+    if index < 0 or index + 7 > len(payload):
+        return None
+    return ((payload[index + 5] & 0x0F) << 8) | payload[index + 6]
+
+def IsHD(packets, pids, videoPid):
+    # from the first MPEG-2 sequence header in packets, None without one
+    for i in np.flatnonzero((pids == videoPid) & ((packets[:, 1] & 0x40) != 0)):
+        height = GetSequenceHeight(packets[i].tobytes())
+        if height is not None:
+            return height >= HD_MIN_HEIGHT
+    return None
+
+def GetVideoStream(service):
+    # (pid, stream type) of the first video stream
+    return next(((pid, streamType) for streamType, pid in service['streams'] if streamType in VIDEO_STREAM_TYPES), (None, None))
+
+class Segment:
+    def __init__(self, videoPath, folder, index, service, pmtPid, transportStreamId):
+        self.path = folder / f'{videoPath.stem}_seg-{index:03}.part'
+        self.finalPath = folder / f'{videoPath.stem}_HD-{index:03}.ts'
+        self.file = self.path.open('wb')
+        self.service = service
+        self.pmtPid = pmtPid
+        self.transportStreamId = transportStreamId
+        self.videoPid, videoType = GetVideoStream(service)
+        # only MPEG-2 sequence headers are read, other codecs are taken as HD
+        self.isHD = None if videoType in MPEG2_STREAM_TYPES else True
+        pids = [ PAT_PID, SDT_PID, TOT_PID, pmtPid, service['pcrPid'] ] + list(EIT_PIDS) + [ pid for _, pid in service['streams'] ]
+        self.pids = np.array(sorted(set(pids)), dtype=np.uint16)
+
+    def Write(self, packets, pids):
+        if len(packets) == 0:
+            return
+        if self.isHD is None:
+            self.isHD = IsHD(packets, pids, self.videoPid)
+        mask = np.isin(pids, self.pids)
+        patIndices = np.flatnonzero(pids == PAT_PID)
+        if len(patIndices) == 0:
+            self.file.write(packets[mask].tobytes())
+            return
+        # PAT packets are replaced one by one, everything between them goes out in bulk
+        start = 0
+        for i in patIndices:
+            self.file.write(packets[start:i][mask[start:i]].tobytes())
+            self.file.write(MakePATPacket(self.transportStreamId, self.service['programNumber'], self.pmtPid, int(packets[i, 3]) & 0x0F))
+            start = i + 1
+        self.file.write(packets[start:][mask[start:]].tobytes())
+
+    def Close(self):
+        self.file.close()
+        if self.isHD is False:
+            # SD services are dropped like TsSplitter -SD
+            self.path.unlink()
+            return None
+        self.path.replace(self.finalPath)
+        return self.finalPath
+
+class PsiTracker:
+    # follows the PAT and every PMT it lists
+    def __init__(self):
+        self.readers = { PAT_PID: SectionReader() }
+        self.lastSections = {}
+        self.transportStreamId = None
+        self.programs = {}
+        self.pmts = {}
+
+    def GetPsiPids(self):
+        return np.array(sorted(self.readers.keys()), dtype=np.uint16)
+
+    def FindMainService(self):
+        # the lowest numbered service with video, once every PMT in the PAT is known
+        candidates = { programNumber: pmtPid for programNumber, pmtPid in self.programs.items() if pmtPid not in ONESEG_PMT_PIDS }
+        if not candidates or any(pmtPid not in self.pmts for pmtPid in candidates.values()):
+            return None
+        for programNumber in sorted(candidates):
+            pmtPid = candidates[programNumber]
+            pmt = self.pmts[pmtPid]
+            if pmt['programNumber'] == programNumber and any(streamType in VIDEO_STREAM_TYPES for streamType, _ in pmt['streams']):
+                return pmtPid, pmt
+        return None
+
+    def ReadSection(self, pid, packet):
+        changed = False
+        for section in self.readers[pid].Feed(packet):
+            if self.lastSections.get(pid) == section:
+                continue
+            self.lastSections[pid] = section
+            changed = True
+            if pid == PAT_PID and section[0] == 0x00:
+                self.transportStreamId, self.programs = ParsePAT(section)
+                pmtPids = set(self.programs.values())
+                for oldPid in [ oldPid for oldPid in self.readers if oldPid != PAT_PID and oldPid not in pmtPids ]:
+                    del self.readers[oldPid]
+                    self.pmts.pop(oldPid, None)
+                    self.lastSections.pop(oldPid, None)
+                for pmtPid in pmtPids:
+                    self.readers.setdefault(pmtPid, SectionReader())
+            elif section[0] == 0x02:
+                self.pmts[pid] = ParsePMT(section)
+        return changed
+
+def GetMainService(path, maxPackets=CHUNK_PACKETS):
+    # (pmtPid, pmt) of the main service near the start of the file, or None
+    tracker = PsiTracker()
+    with Path(path).open('rb') as f:
+        data = f.read(maxPackets * PACKET_SIZE)
+    offset = FindSync(data)
+    if offset is None:
+        return None
+    count = (len(data) - offset) // PACKET_SIZE
+    packets = np.frombuffer(data, dtype=np.uint8, count=count * PACKET_SIZE, offset=offset).reshape(count, PACKET_SIZE)
+    packets = packets[packets[:, 0] == SYNC_BYTE]
+    pids = GetPids(packets)
+    start = 0
+    while start < len(packets):
+        psiIndices = start + np.flatnonzero(np.isin(pids[start:], tracker.GetPsiPids()))
+        if len(psiIndices) == 0:
+            break
+        for i in psiIndices:
+            start = i + 1
+            if tracker.ReadSection(int(pids[i]), packets[i].tobytes()):
+                mainService = tracker.FindMainService()
+                if mainService is not None:
+                    return mainService
+                # the PAT may have brought new PMT PIDs
+                break
+    return None
+
+class ServiceScanner(PsiTracker):
+    # byte ranges of the segments, a new one starts whenever the main service or its streams change
+    def __init__(self):
+        super().__init__()
+        self.segmentKey = None
+        self.segments = []
+
+    def OpenSegment(self, offset, pmtPid, pmt):
+        videoPid, videoType = GetVideoStream(pmt)
+        # only MPEG-2 sequence headers are read, other codecs are taken as HD
+        self.segments.append({ 'start': offset, 'end': offset, 'videoPid': videoPid, 'isHD': None if videoType in MPEG2_STREAM_TYPES else True })
+
+    def CloseSegment(self):
+        pass
+
+    def UpdateSegment(self, offset):
+        mainService = self.FindMainService()
+        if mainService is None:
+            return
+        pmtPid, pmt = mainService
+        key = ( pmt['programNumber'], pmtPid, pmt['pcrPid'], pmt['streams'] )
+        if key == self.segmentKey:
+            return
+        self.CloseSegment()
+        self.segmentKey = key
+        self.OpenSegment(offset, pmtPid, pmt)
+
+    def Write(self, offset, packets, pids):
+        if not self.segments or len(packets) == 0:
+            return
+        segment = self.segments[-1]
+        if segment['isHD'] is None:
+            segment['isHD'] = IsHD(packets, pids, segment['videoPid'])
+        segment['end'] = offset + len(packets) * PACKET_SIZE
+
+    def Feed(self, offset, packets):
+        pids = GetPids(packets)
+        start = 0
+        psiPids = self.GetPsiPids()
+        psiIndices = list(np.flatnonzero(np.isin(pids, psiPids))[::-1])
+        while psiIndices:
+            i = psiIndices.pop()
+            if self.ReadSection(int(pids[i]), packets[i].tobytes()):
+                # packets up to here belong to the previous layout
+                self.Write(offset + start * PACKET_SIZE, packets[start:i], pids[start:i])
+                start = i
+                self.UpdateSegment(offset + i * PACKET_SIZE)
+                if not np.array_equal(psiPids, self.GetPsiPids()):
+                    # the PAT changed, look for the new PMTs in the rest of the chunk
+                    psiPids = self.GetPsiPids()
+                    psiIndices = list(i + 1 + np.flatnonzero(np.isin(pids[i + 1:], psiPids))[::-1])
+        self.Write(offset + start * PACKET_SIZE, packets[start:], pids[start:])
+
+    def Finish(self):
+        self.CloseSegment()
+        return self.segments
+
+class ServiceSplitter(ServiceScanner):
+    # writes every segment to a file of its own
+    def __init__(self, videoPath, folder):
+        super().__init__()
+        self.videoPath = videoPath
+        self.folder = folder
+        self.segment = None
+        self.paths = []
+
+    def OpenSegment(self, offset, pmtPid, pmt):
+        self.segment = Segment(self.videoPath, self.folder, len(self.paths), pmt, pmtPid, self.transportStreamId)
+        self.paths.append(None)
+
+    def CloseSegment(self):
+        if self.segment is not None:
+            self.paths[-1] = self.segment.Close()
+            self.segment = None
+
+    def Write(self, offset, packets, pids):
+        if self.segment is not None:
+            self.segment.Write(packets, pids)
+
+    def Finish(self):
+        self.CloseSegment()
+        return [ path for path in self.paths if path is not None ]
+
+def ReadPackets(path, description='Reading', quiet=False):
+    # (offset, packets) for runs of packets in sync, read from a memory-mapped file
+    path = Path(path)
+    if path.stat().st_size < PACKET_SIZE * 3:
+        raise InvalidTsFormat(f'"{path.name}" is invalid!')
+    with path.open('rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        offset = FindSync(data)
+        if offset is None:
+            raise InvalidTsFormat(f'"{path.name}" is invalid!')
+        with tqdm(total=len(data), unit='B', unit_scale=True, disable=quiet) as pbar:
+            pbar.set_description(description)
+            while offset is not None and offset + PACKET_SIZE <= len(data):
+                count = min(CHUNK_PACKETS, (len(data) - offset) // PACKET_SIZE)
+                packets = np.frombuffer(data, dtype=np.uint8, count=count * PACKET_SIZE, offset=offset).reshape(count, PACKET_SIZE)
+                lostSync = np.flatnonzero(packets[:, 0] != SYNC_BYTE)
+                if len(lostSync) > 0:
+                    # hand out the good packets, then skip garbage up to the next sync point
+                    yield offset, packets[:lostSync[0]]
+                    nextOffset = FindSync(data, offset + int(lostSync[0]) * PACKET_SIZE)
+                else:
+                    yield offset, packets
+                    nextOffset = offset + count * PACKET_SIZE
+                del packets
+                pbar.update((nextOffset if nextOffset is not None else len(data)) - offset)
+                offset = nextOffset
+    finally:
+        try:
+            data.close()
+        except BufferError:
+            # a consumer still holds a view, the map is released with it
+            pass
+
+def SplitServices(videoPath, folder=None, quiet=False):
+    videoPath = Path(videoPath)
+    if not videoPath.is_file():
+        raise TsFileNotFound(f'"{videoPath.name}" not found!')
+    folder = videoPath.parent if folder is None else Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    splitter = ServiceSplitter(videoPath, folder)
+    try:
+        for offset, packets in ReadPackets(videoPath, 'Splitting', quiet=quiet):
+            splitter.Feed(offset, packets)
+    finally:
+        splittedTs = splitter.Finish()
+    if len(splittedTs) == 0:
+        raise InvalidTsFormat(f'"{videoPath.name}" is invalid!')
+    return splittedTs
+
+def ScanServices(videoPath, quiet=False):
+    # the segments SplitServices would write, as byte ranges of videoPath
+    videoPath = Path(videoPath)
+    if not videoPath.is_file():
+        raise TsFileNotFound(f'"{videoPath.name}" not found!')
+    scanner = ServiceScanner()
+    for offset, packets in ReadPackets(videoPath, 'Scanning', quiet=quiet):
+        scanner.Feed(offset, packets)
+    segments = [ { 'start': int(segment['start']), 'end': int(segment['end']), 'isHD': segment['isHD'] is not False } for segment in scanner.Finish() ]
+    if len(segments) == 0:
+        raise InvalidTsFormat(f'"{videoPath.name}" is invalid!')
+    return segments
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MPEG-TS tools')
+    parser.add_argument('--quiet', '-q', action='store_true', help="don't output to the console")
+    subparsers = parser.add_subparsers(required=True, title='subcommands', dest='command')
+
+    subparser = subparsers.add_parser('split', help='split the main service into segments at PAT/PMT changes')
+    subparser.add_argument('--input', '-i', required=True, help='input mpegts path')
+    subparser.add_argument('--output', '-o', help='output folder')
+
+    args = parser.parse_args()
+
+    if args.command == 'split':
+        for path in SplitServices(args.input, folder=args.output, quiet=args.quiet):
+            print(path)